@@ -0,0 +1,104 @@
+# benchmarks/bench_login.py
+# 登录吞吐量基准: 用多个并发客户端反复调用 POST /api/auth/login，
+# 对比不同 PASSWORD_HASHER_MODE 下的延迟、吞吐量和哈希排队时间。
+#
+# 用法 (在项目根目录，需要本地 MySQL):
+#   python -m benchmarks.bench_login --requests 400 --concurrency 16 --modes inline thread process
+#   python -m benchmarks.bench_login --username alice --password secret   # 使用已有用户
+# 默认会创建一个临时用户，结束时删除。
+import argparse
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import create_bench_app, summarize, format_summary, Timer
+
+
+def create_temp_user(app, login_service):
+    username = f"bench_{uuid.uuid4().hex[:10]}"
+    password = uuid.uuid4().hex
+    with app.app_context():
+        result = login_service.register_user(username, password, username, f"bench-{uuid.uuid4().hex[:12]}")
+        login_service.db_access.commit()
+    if not result.get('success'):
+        raise SystemExit(f"Failed to create benchmark user: {result.get('error')}")
+    return result['user_id'], username, password
+
+
+def delete_temp_user(app, login_service, user_id):
+    with app.app_context():
+        login_service.db_access.execute_update("DELETE FROM Users WHERE user_id = %s", (user_id,))
+        login_service.db_access.commit()
+
+
+def run_mode(app, mode, args, username, password):
+    from kaguchat_app.extensions import socketio, password_hasher
+    app.config['PASSWORD_HASHER_MODE'] = mode
+    app.config['PASSWORD_HASHER_WORKERS'] = args.workers
+    password_hasher.init_app(app, socketio)
+
+    local = threading.local()
+    errors = []
+
+    def one_login(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        with Timer() as t:
+            response = client.post('/api/auth/login', json={'username': username, 'password': password})
+        if response.status_code != 200:
+            errors.append(response.status_code)
+        return t.elapsed
+
+    # 预热 (建立连接池连接、加载模块)
+    for i in range(min(args.concurrency, 8)):
+        one_login(i)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = list(executor.map(one_login, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(latencies, elapsed=elapsed)
+    summary['errors'] = len(errors)
+    summary['hasher'] = password_hasher.stats()
+    password_hasher.shutdown()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Login throughput under concurrent clients.")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4, help='PASSWORD_HASHER_WORKERS')
+    parser.add_argument('--modes', nargs='+', default=['inline', 'thread', 'process'],
+                        choices=['inline', 'thread', 'process'])
+    parser.add_argument('--username', help='使用已有用户 (需同时指定 --password)')
+    parser.add_argument('--password')
+    args = parser.parse_args(argv)
+
+    app = create_bench_app()
+    from kaguchat_app.extensions import login_service
+
+    temp_user_id = None
+    if args.username:
+        username, password = args.username, args.password
+    else:
+        temp_user_id, username, password = create_temp_user(app, login_service)
+
+    try:
+        results = {mode: run_mode(app, mode, args, username, password) for mode in args.modes}
+    finally:
+        if temp_user_id is not None:
+            delete_temp_user(app, login_service, temp_user_id)
+
+    for mode, summary in results.items():
+        hasher = summary['hasher']
+        print(format_summary(f"login ({mode})", summary)
+              + f" errors={summary['errors']} avg_queue={hasher['avg_queue_ms']}ms"
+              f" p95_queue={hasher['p95_queue_ms']}ms avg_hash={hasher['avg_hash_ms']}ms")
+
+
+if __name__ == '__main__':
+    main()
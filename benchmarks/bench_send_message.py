@@ -0,0 +1,91 @@
+# benchmarks/bench_send_message.py
+# 发送消息写路径的微基准: 对比旧实现 (INSERT ... NOW() + SELECT 读回) 与
+# ChatService.send_message_and_get_info (应用生成 sent_at，单条 INSERT)。
+#
+# 用法 (在项目根目录，需要本地 MySQL 和已执行的 mysql/migrations):
+#   python -m benchmarks.bench_send_message --iterations 2000 --sender-id 1 --contact-id 2 --contact-type friend
+# 默认所有写入在结束时回滚；--commit-each 每条提交一次 (更接近线上)，结束时删除测试消息。
+import argparse
+
+from benchmarks.common import create_bench_app, summarize, format_summary, Timer
+
+
+def legacy_send(chat_service, sender_id, contact_id, contact_type, content):
+    """旧的写路径: INSERT 使用 NOW()，然后 SELECT 读回 sent_at。"""
+    from kaguchat_app.business.chat_service import get_conversation_key
+    db = chat_service.db_access
+    receiver_id = contact_id if contact_type == 'friend' else None
+    group_id = contact_id if contact_type == 'group' else None
+    # message_id 已改为应用生成 (AUTO_INCREMENT 分配的 ID 可能与生成器的 ID 冲突)，这里只保留 NOW() + 读回的开销
+    message_id = chat_service.id_generator.next_id()
+    db.execute_update("""
+        INSERT INTO Messages (message_id, sender_id, receiver_id, group_id, conversation_key, content, message_type, sent_at)
+        VALUES (%s, %s, %s, %s, %s, %s, 0, NOW())
+    """, (message_id, sender_id, receiver_id, group_id, get_conversation_key(sender_id, contact_id, contact_type), content))
+    message = db.execute_query("""
+        SELECT message_id, sender_id, receiver_id, group_id, content, sent_at
+        FROM Messages WHERE message_id = %s
+    """, (message_id,))
+    chat_service._update_conversation_summaries(message[0])
+    return {**message[0], 'sent_at': message[0]['sent_at'].strftime('%Y-%m-%dT%H:%M:%S.%f')}
+
+
+def run_case(name, send_func, args, db, created_ids):
+    latencies = []
+    for i in range(args.warmup + args.iterations):
+        with Timer() as t:
+            info = send_func(args.sender_id, args.contact_id, args.contact_type, f"bench {name} #{i}")
+            if args.commit_each:
+                db.commit()
+        created_ids.append(info['message_id'])
+        if i >= args.warmup:
+            latencies.append(t.elapsed)
+    return summarize(latencies, elapsed=sum(latencies))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-message latency of the send_message write path.")
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--sender-id', type=int, default=1)
+    parser.add_argument('--contact-id', type=int, default=2)
+    parser.add_argument('--contact-type', choices=['friend', 'group'], default='friend')
+    parser.add_argument('--commit-each', action='store_true', help='每条消息单独提交 (结束时删除测试消息)')
+    args = parser.parse_args(argv)
+
+    app = create_bench_app()
+    from kaguchat_app.extensions import chat_service
+    from kaguchat_app.data.db_access import get_request_db_connection
+    db = chat_service.db_access
+
+    with app.app_context():
+        created_ids = []
+        results = {
+            'legacy (insert + read-back)': run_case(
+                'legacy', lambda *a: legacy_send(chat_service, *a), args, db, created_ids),
+            'send_message_and_get_info': run_case(
+                'current', chat_service.send_message_and_get_info, args, db, created_ids),
+        }
+        if args.commit_each:
+            for start in range(0, len(created_ids), 1000):
+                chunk = created_ids[start:start + 1000]
+                db.execute_update(
+                    f"DELETE FROM Messages WHERE message_id IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk))
+            db.commit()
+            # 删除测试消息后重建受影响用户的会话摘要
+            if args.contact_type == 'friend':
+                affected = [args.sender_id, args.contact_id]
+            else:
+                affected = [row['user_id'] for row in db.execute_query(
+                    "SELECT user_id FROM Group_Members WHERE group_id = %s", (args.contact_id,))]
+            chat_service.on_contacts_changed(affected)
+            db.commit()
+        else:
+            get_request_db_connection().rollback()
+
+    for name, summary in results.items():
+        print(format_summary(name, summary))
+
+
+if __name__ == '__main__':
+    main()
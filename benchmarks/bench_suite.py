@@ -0,0 +1,308 @@
+# benchmarks/bench_suite.py
+# 规模基准测试套件: 在 generate_dataset.py 生成的数据集上运行聊天服务方法和 HTTP 接口，
+# 记录每个用例的 p50/p95/p99 延迟和吞吐量，结果写入 JSON 文件，便于在不同提交之间比较。
+#
+# 用法 (在项目根目录，需要本地 MySQL，并先运行 benchmarks.generate_dataset):
+#   python -m benchmarks.bench_suite --iterations 200 --concurrency 8
+#   python -m benchmarks.bench_suite --only contacts messages --compare benchmarks/results/<baseline>.json
+#   python -m benchmarks.bench_suite --include-writes        # 包含会提交的 HTTP 写入用例 (结束时删除测试消息)
+# 服务层写入用例在每次迭代后回滚，不会留下数据。
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.common import create_bench_app, summarize, format_summary, Timer, PROJECT_ROOT
+from benchmarks.generate_dataset import DEFAULT_MANIFEST
+
+DEFAULT_RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+BENCH_CONTENT_PREFIX = '[bench-suite]' # HTTP 写入用例发送的消息内容前缀，用于结束时清理
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def git_revision():
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=PROJECT_ROOT, text=True).strip())
+        return sha + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchCase:
+    """一个基准用例: func(i) 执行一次操作；after(i) 在计时之外执行 (例如回滚)。"""
+
+    def __init__(self, name, group, func, after=None, concurrent=False):
+        self.name = name
+        self.group = group
+        self.func = func
+        self.after = after
+        self.concurrent = concurrent
+
+
+class BenchSuite:
+    def __init__(self, app, manifest, args):
+        from kaguchat_app.extensions import chat_service
+        self.app = app
+        self.manifest = manifest
+        self.args = args
+        self.chat_service = chat_service
+        self.db = chat_service.db_access
+        self.rng = random.Random(args.seed)
+        self.tokens = {}
+        self.sent_by_http = set() # HTTP 写入用例涉及的用户，清理后重建其会话摘要
+        self._pick_targets()
+
+    # ---- 测试目标 ----
+
+    def _pick_targets(self):
+        manifest = self.manifest
+        hot = manifest.get('hot_conversations') or []
+        self.hot_friend = next((c for c in hot if c['type'] == 'friend'), None)
+        self.hot_group = next((c for c in hot if c['type'] == 'group'), None)
+        self.largest_group = manifest.get('largest_group')
+        low, high = manifest['user_id_min'], manifest['user_id_max']
+        self.random_users = [self.rng.randint(low, high) for _ in range(1000)]
+        # 联系人最多的用户: 取热点好友会话中的用户 (偏好连接使其度数较高)
+        self.busy_user = self.hot_friend['user_id'] if self.hot_friend else low
+
+    def token(self, user_id):
+        from flask_jwt_extended import create_access_token
+        if user_id not in self.tokens:
+            with self.app.app_context():
+                self.tokens[user_id] = create_access_token(identity=str(user_id))
+        return self.tokens[user_id]
+
+    def _deep_cursor(self, conversation, pages):
+        """沿 before 游标向前翻 pages 页，返回用于“深翻页”用例的游标。"""
+        cursor = None
+        with self.app.app_context():
+            for _ in range(pages):
+                page = self.chat_service.get_messages(conversation['user_id'], conversation['contact_id'],
+                                                      conversation['type'], limit=50, before=cursor)
+                if not page['next_cursor']:
+                    break
+                cursor = page['next_cursor']
+        return cursor
+
+    # ---- 用例定义 ----
+
+    def build_cases(self):
+        cs = self.chat_service
+        cases = []
+        random_users = self.random_users
+
+        cases.append(BenchCase('contacts.service.busy_user', 'contacts',
+                               lambda i: cs.get_contact_list(self.busy_user)))
+        cases.append(BenchCase('contacts.service.random_user', 'contacts',
+                               lambda i: cs.get_contact_list(random_users[i % len(random_users)])))
+
+        for label, conversation in (('hot_friend', self.hot_friend), ('hot_group', self.hot_group)):
+            if not conversation:
+                continue
+            args = (conversation['user_id'], conversation['contact_id'], conversation['type'])
+            cases.append(BenchCase(f'messages.service.{label}.first_page', 'messages',
+                                   lambda i, args=args: cs.get_messages(*args, limit=50)))
+            deep_cursor = self._deep_cursor(conversation, self.args.deep_pages)
+            if deep_cursor:
+                cases.append(BenchCase(f'messages.service.{label}.page_{self.args.deep_pages}', 'messages',
+                                       lambda i, args=args, c=deep_cursor: cs.get_messages(*args, limit=50, before=c)))
+
+        # 服务层写入: 每次迭代后回滚 (计时不包含回滚)，测量 INSERT + 会话摘要更新的代价
+        rollback = lambda i: self.db.rollback()
+        if self.hot_friend:
+            f = self.hot_friend
+            cases.append(BenchCase('send.service.friend', 'send', lambda i: cs.send_message_and_get_info(
+                f['user_id'], f['contact_id'], 'friend', f"bench send #{i}"), after=rollback))
+        if self.largest_group:
+            g = self.largest_group
+            cases.append(BenchCase(f"send.service.group_{g['size']}_members", 'send', lambda i: cs.send_message_and_get_info(
+                g['member_id'], g['group_id'], 'group', f"bench send #{i}"), after=rollback))
+
+        # HTTP 接口 (经过 JWT 认证、序列化等完整请求路径)，可以并发执行
+        cases.append(BenchCase('contacts.http.random_user', 'contacts', lambda client, i: self._get(
+            client, '/api/chat/contacts', random_users[i % len(random_users)]), concurrent=True))
+        if self.hot_friend:
+            f = self.hot_friend
+            cases.append(BenchCase('messages.http.hot_friend.first_page', 'messages', lambda client, i: self._get(
+                client, f"/api/chat/messages/friend/{f['contact_id']}?limit=50", f['user_id']), concurrent=True))
+            if self.args.include_writes:
+                self.sent_by_http.update((f['user_id'], f['contact_id']))
+                cases.append(BenchCase('send.http.friend', 'send', lambda client, i: self._post(
+                    client, '/api/chat/send_message', f['user_id'],
+                    {'contact_type': 'friend', 'contact_id': f['contact_id'], 'message': f"{BENCH_CONTENT_PREFIX} #{i}"}),
+                    concurrent=True))
+
+        admin = self.busy_user
+        deep_page = max(1, self.manifest['counts'].get('messages', 0) // 50 // 2) # 表中间位置的 OFFSET 分页
+        cases.append(BenchCase('admin.http.messages.page_1', 'admin', lambda client, i: self._get(
+            client, '/api/admin/table/messages/data?limit=50&page=1', admin), concurrent=True))
+        cases.append(BenchCase(f'admin.http.messages.page_{deep_page}', 'admin', lambda client, i: self._get(
+            client, f'/api/admin/table/messages/data?limit=50&page={deep_page}&count=none', admin), concurrent=True))
+        cases.append(BenchCase('admin.http.users.filter_contains', 'admin', lambda client, i: self._get(
+            client, f"/api/admin/table/users/data?limit=50&f_username__contains={self.manifest['params']['prefix']}{i % 1000}",
+            admin), concurrent=True))
+        cases.append(BenchCase('admin.http.users.schema', 'admin', lambda client, i: self._get(
+            client, '/api/admin/table/users/schema', admin), concurrent=True))
+
+        if self.args.only:
+            cases = [c for c in cases if c.group in self.args.only or c.name in self.args.only]
+        return cases
+
+    def _get(self, client, url, user_id):
+        response = client.get(url, headers={'Authorization': f"Bearer {self.token(user_id)}"})
+        return response.status_code
+
+    def _post(self, client, url, user_id, payload):
+        response = client.post(url, json=payload, headers={'Authorization': f"Bearer {self.token(user_id)}"})
+        return response.status_code
+
+    # ---- 执行 ----
+
+    def run_service_case(self, case):
+        latencies = []
+        with self.app.app_context():
+            for i in range(self.args.warmup + self.args.iterations):
+                with Timer() as t:
+                    case.func(i)
+                if case.after:
+                    case.after(i)
+                if i >= self.args.warmup:
+                    latencies.append(t.elapsed)
+        return summarize(latencies, elapsed=sum(latencies))
+
+    def run_http_case(self, case):
+        local = threading.local()
+        errors = []
+
+        def one(i):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = self.app.test_client()
+            with Timer() as t:
+                status = case.func(client, i)
+            if status >= 400:
+                errors.append(status)
+            return t.elapsed
+
+        for i in range(self.args.warmup):
+            one(i)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            latencies = list(executor.map(one, range(self.args.warmup, self.args.warmup + self.args.iterations)))
+        summary = summarize(latencies, elapsed=time.perf_counter() - started)
+        summary['errors'] = len(errors)
+        summary['concurrency'] = self.args.concurrency
+        return summary
+
+    def run(self):
+        results = {}
+        for case in self.build_cases():
+            summary = self.run_http_case(case) if case.concurrent else self.run_service_case(case)
+            results[case.name] = summary
+            print(format_summary(case.name, summary) + (f" errors={summary['errors']}" if summary.get('errors') else ''),
+                  flush=True)
+        return results
+
+    def cleanup(self):
+        """删除 HTTP 写入用例提交的消息，并重建相关用户的会话摘要。"""
+        if not self.sent_by_http:
+            return
+        with self.app.app_context():
+            while self.db.execute_update(
+                    "DELETE FROM Messages WHERE content LIKE %s AND sender_id IN ({}) LIMIT 5000".format(
+                        ', '.join(['%s'] * len(self.sent_by_http))),
+                    (BENCH_CONTENT_PREFIX + '%', *self.sent_by_http)):
+                self.db.commit()
+            self.chat_service.rebuild_conversation_summaries(sorted(self.sent_by_http))
+            self.db.commit()
+
+
+def compare(results, baseline, threshold_pct):
+    """与基线结果比较，返回 [(用例, 指标, 基线, 当前, 变化百分比)] 中超过阈值的回归。"""
+    regressions = []
+    print(f"\nComparison with {baseline.get('git_revision')} ({baseline.get('created_at')}):")
+    for name, summary in results.items():
+        base = baseline.get('cases', {}).get(name)
+        if not base:
+            print(f"  {name:<48} (new)")
+            continue
+        parts = []
+        for metric in COMPARED_METRICS:
+            before, after = base.get(metric), summary.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100.0
+            parts.append(f"{metric}={after}ms ({change:+.1f}%)")
+            if change > threshold_pct:
+                regressions.append((name, metric, before, after, round(change, 1)))
+        print(f"  {name:<48} " + ' '.join(parts))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scale benchmark suite for chat service methods and HTTP routes.")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='generate_dataset.py 写出的数据集清单')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8, help='HTTP 用例的并发客户端数')
+    parser.add_argument('--deep-pages', type=int, default=20, help='消息深翻页用例先向前翻的页数')
+    parser.add_argument('--only', nargs='+', help='只运行指定分组 (contacts/messages/send/admin) 或用例名')
+    parser.add_argument('--include-writes', action='store_true', help='包含会提交的 HTTP 写入用例')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help=f'结果文件 (默认写入 {DEFAULT_RESULTS_DIR}/<时间>_<提交>.json)')
+    parser.add_argument('--compare', help='与之比较的基线结果文件')
+    parser.add_argument('--threshold', type=float, default=10.0, help='延迟增加超过该百分比视为回归')
+    parser.add_argument('--fail-on-regression', action='store_true', help='存在回归时以退出码 1 结束')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.manifest):
+        raise SystemExit(f"Dataset manifest {args.manifest} not found; run benchmarks.generate_dataset first")
+    with open(args.manifest, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    app = create_bench_app()
+    suite = BenchSuite(app, manifest, args)
+    started = time.perf_counter()
+    try:
+        results = suite.run()
+    finally:
+        suite.cleanup()
+
+    revision = git_revision()
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': revision,
+        'elapsed_seconds': round(time.perf_counter() - started, 1),
+        'settings': {k: getattr(args, k) for k in ('iterations', 'warmup', 'concurrency', 'deep_pages', 'seed')},
+        'dataset': {'counts': manifest.get('counts'), 'params': manifest.get('params')},
+        'cases': results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{revision or 'unknown'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, metric, before, after, change in regressions:
+            print(f"REGRESSION {name} {metric}: {before}ms -> {after}ms ({change:+}%)")
+        if regressions and args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/common.py
+# 基准测试脚本共用的工具: 项目路径、应用创建、延迟统计
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def create_bench_app():
+    """创建用于基准测试的 Flask 应用 (使用默认配置，需要本地 MySQL)。"""
+    from kaguchat_app import create_app
+    return create_app()
+
+
+def percentile(sorted_values, pct):
+    """对已排序的序列取百分位 (线性插值)。"""
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(latencies, elapsed=None):
+    """
+    汇总一组延迟 (秒)，返回以毫秒为单位的统计结果。
+    elapsed 为总耗时 (秒)，提供时同时计算吞吐量 (ops/s)。
+    """
+    values = sorted(latencies)
+    to_ms = lambda v: round(v * 1000.0, 3) if v is not None else None
+    result = {
+        'count': len(values),
+        'mean_ms': to_ms(sum(values) / len(values)) if values else None,
+        'min_ms': to_ms(values[0]) if values else None,
+        'p50_ms': to_ms(percentile(values, 50)),
+        'p95_ms': to_ms(percentile(values, 95)),
+        'p99_ms': to_ms(percentile(values, 99)),
+        'max_ms': to_ms(values[-1]) if values else None,
+    }
+    if elapsed:
+        result['throughput_per_s'] = round(len(values) / elapsed, 2)
+    return result
+
+
+def format_summary(name, summary):
+    return (f"{name:<32} n={summary['count']:<6} mean={summary['mean_ms']}ms "
+            f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms"
+            + (f" ({summary['throughput_per_s']}/s)" if 'throughput_per_s' in summary else ''))
+
+
+class Timer:
+    """with Timer() as t: ...; t.elapsed 为耗时 (秒)。"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
@@ -0,0 +1,297 @@
+# benchmarks/generate_dataset.py
+# 生成用于规模测试的合成数据集: 用户、好友关系、群/群成员、消息，并重建会话摘要。
+# 数据分布尽量接近真实聊天应用:
+#   - 好友数和群大小服从幂律 (Pareto)，少数用户好友很多、少数群非常大
+#   - 好友关系带有偏好连接 (热门用户更容易被加好友)
+#   - 消息按 Zipf 分布落在会话上，少数热点会话承载大部分消息
+#   - 消息时间在 --days 天内按泊松过程递增，message_id 与 sent_at 同序 (与线上生成器的位布局一致)
+# 生成的用户名带 --prefix 前缀，数据集信息写入清单文件 (bench_suite.py 据此选取测试用户和会话)。
+#
+# 用法 (在项目根目录，需要本地 MySQL 和已执行的 mysql/migrations):
+#   python -m benchmarks.generate_dataset --users 10000 --groups 500 --messages 1000000 --seed 42
+#   python -m benchmarks.generate_dataset --clean          # 按清单删除生成的数据
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+from benchmarks.common import create_bench_app, PROJECT_ROOT
+
+DEFAULT_MANIFEST = os.path.join(PROJECT_ROOT, 'benchmarks', 'dataset_manifest.json')
+GENERATED_NODE_ID = 63 # 生成的历史消息使用的 ID 节点号，时间戳都早于当前时间，不会与线上生成的 ID 冲突
+WORDS = ("hi", "ok", "lol", "在吗", "收到", "明天见", "meeting", "deploy", "review", "lunch",
+         "哈哈", "好的", "test", "bug", "merge", "周末", "吃饭", "ship it", "thanks", "+1")
+
+
+def pareto_int(rng, alpha, minimum, maximum):
+    """服从 Pareto 分布 (形状参数 alpha) 的整数，截断到 [minimum, maximum]。"""
+    return max(minimum, min(maximum, int(minimum / (1.0 - rng.random()) ** (1.0 / alpha))))
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class DatasetGenerator:
+    def __init__(self, args, db):
+        self.args = args
+        self.db = db
+        self.rng = random.Random(args.seed)
+        self.counts = {}
+
+    def log(self, message):
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+    def insert_batches(self, query, rows, label):
+        """按 --batch-size 分批 executemany 并提交，返回写入的行数。"""
+        total = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.args.batch_size))
+            if not batch:
+                break
+            self.db.execute_many(query, batch)
+            self.db.commit()
+            total += len(batch)
+            if total % (self.args.batch_size * 20) == 0:
+                self.log(f"  ... {label}: {total}")
+        self.counts[label] = total
+        return total
+
+    # ---- 用户 ----
+
+    def create_users(self):
+        from werkzeug.security import generate_password_hash
+        args = self.args
+        password_hash = generate_password_hash(args.password) # 所有用户共用一个密码，只计算一次哈希
+        created_at = datetime.now().replace(microsecond=0)
+        rows = (
+            (f"{args.prefix}{i}", f"Bench User {i}", str(args.phone_base + i), password_hash, None, created_at)
+            for i in range(args.users)
+        )
+        self.insert_batches(
+            "INSERT INTO Users (username, nickname, phone, password, avatar_url, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+            rows, 'users')
+        result = self.db.execute_query(
+            "SELECT user_id FROM Users WHERE username LIKE %s ORDER BY user_id", (escape_like(args.prefix) + '%',))
+        self.user_ids = [row['user_id'] for row in result]
+        self.log(f"Created {len(self.user_ids)} users")
+
+    # ---- 好友关系 ----
+
+    def create_friendships(self):
+        args, rng, users = self.args, self.rng, self.user_ids
+        pairs = set()
+        endpoints = [] # 每条边的两个端点，从中随机抽取相当于按度数加权 (偏好连接)
+        max_friends = min(args.max_friends, len(users) - 1)
+        for user_id in users:
+            degree = pareto_int(rng, args.friend_alpha, args.min_friends, max_friends)
+            for _ in range(degree):
+                if endpoints and rng.random() < args.preferential:
+                    other = rng.choice(endpoints)
+                else:
+                    other = rng.choice(users)
+                if other == user_id:
+                    continue
+                pair = (min(user_id, other), max(user_id, other))
+                if pair not in pairs:
+                    pairs.add(pair)
+                    endpoints.extend(pair)
+        self.friend_pairs = sorted(pairs)
+        created_at = datetime.now().replace(microsecond=0)
+        rows = ((a, b, 1, created_at) for lo, hi in self.friend_pairs for a, b in ((lo, hi), (hi, lo)))
+        self.insert_batches("INSERT INTO Friends (user_id, friend_id, status, created_at) VALUES (%s, %s, %s, %s)",
+                            rows, 'friends')
+        self.log(f"Created {len(self.friend_pairs)} friendships")
+
+    # ---- 群 ----
+
+    def create_groups(self):
+        args, rng, users = self.args, self.rng, self.user_ids
+        sizes = [pareto_int(rng, args.group_alpha, args.min_group_size, min(args.max_group_size, len(users)))
+                 for _ in range(args.groups)]
+        members = [rng.sample(users, size) for size in sizes]
+        created_at = datetime.now().replace(microsecond=0)
+        self.insert_batches(
+            "INSERT INTO `Groups` (group_name, owner_id, group_avatar, created_at) VALUES (%s, %s, %s, %s)",
+            ((f"{args.prefix}group_{i}", group_members[0], None, created_at) for i, group_members in enumerate(members)),
+            'groups')
+        result = self.db.execute_query(
+            "SELECT group_id, group_name FROM `Groups` WHERE group_name LIKE %s",
+            (escape_like(f"{args.prefix}group_") + '%',))
+        id_by_name = {row['group_name']: row['group_id'] for row in result}
+        self.groups = [(id_by_name[f"{args.prefix}group_{i}"], group_members) for i, group_members in enumerate(members)]
+        rows = ((group_id, user_id, 2 if index == 0 else 0, created_at)
+                for group_id, group_members in self.groups for index, user_id in enumerate(group_members))
+        self.insert_batches("INSERT INTO Group_Members (group_id, user_id, role, join_at) VALUES (%s, %s, %s, %s)",
+                            rows, 'group_members')
+        self.log(f"Created {len(self.groups)} groups (largest {max(sizes) if sizes else 0} members)")
+
+    # ---- 消息 ----
+
+    def create_messages(self):
+        from kaguchat_app.data.id_generator import compose_id, MAX_SEQUENCE
+        args, rng = self.args, self.rng
+        conversations = [('friend', pair) for pair in self.friend_pairs] + [('group', group) for group in self.groups]
+        if not conversations:
+            self.counts['messages'] = 0
+            return
+        rng.shuffle(conversations)
+        # Zipf: 第 k 热的会话权重为 1 / k^s
+        cum_weights = list(itertools.accumulate(1.0 / (rank + 1) ** args.zipf for rank in range(len(conversations))))
+        self.hot_conversations = conversations[:20]
+
+        end_ms = int(time.time() * 1000) - 1000
+        start_ms = end_ms - args.days * 86400 * 1000
+        mean_gap_ms = (end_ms - start_ms) / max(args.messages, 1)
+
+        def rows():
+            current_ms = float(start_ms)
+            last_ms, sequence = None, 0
+            indexes = []
+            for i in range(args.messages):
+                if not indexes:
+                    indexes = rng.choices(range(len(conversations)), cum_weights=cum_weights, k=10000)
+                contact_type, conversation = conversations[indexes.pop()]
+                current_ms += rng.expovariate(1.0 / mean_gap_ms) if mean_gap_ms > 0 else 0
+                ms = int(current_ms)
+                if ms == last_ms:
+                    sequence += 1
+                    if sequence > MAX_SEQUENCE: # 同一毫秒内超过 128 条，顺延到下一毫秒
+                        ms, sequence = ms + 1, 0
+                        current_ms = ms
+                else:
+                    sequence = 0
+                last_ms = ms
+                message_id = compose_id(ms, GENERATED_NODE_ID, sequence)
+                sent_at = datetime.fromtimestamp(ms / 1000.0).replace(microsecond=0)
+                content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+                if contact_type == 'friend':
+                    sender, receiver = conversation if rng.random() < 0.5 else conversation[::-1]
+                    yield (message_id, sender, receiver, None, f"friend_{conversation[0]}_{conversation[1]}",
+                           content, 0, sent_at)
+                else:
+                    group_id, group_members = conversation
+                    yield (message_id, rng.choice(group_members), None, group_id, f"group_{group_id}",
+                           content, 0, sent_at)
+
+        self.insert_batches("""
+            INSERT INTO Messages (message_id, sender_id, receiver_id, group_id, conversation_key, content, message_type, sent_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, rows(), 'messages')
+        self.log(f"Created {self.counts['messages']} messages")
+
+    def rebuild_summaries(self, chat_service):
+        for start in range(0, len(self.user_ids), 500):
+            chat_service.rebuild_conversation_summaries(self.user_ids[start:start + 500])
+            chat_service.db_access.commit()
+        self.log("Rebuilt conversation summaries")
+
+    def manifest(self):
+        hot = []
+        for contact_type, conversation in getattr(self, 'hot_conversations', []):
+            if contact_type == 'friend':
+                hot.append({'type': 'friend', 'user_id': conversation[0], 'contact_id': conversation[1]})
+            else:
+                hot.append({'type': 'group', 'user_id': conversation[1][0], 'contact_id': conversation[0]})
+        largest_group = max(self.groups, key=lambda g: len(g[1])) if self.groups else None
+        params = {k: v for k, v in vars(self.args).items() if k not in ('password', 'clean', 'manifest')}
+        return {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'params': params,
+            'counts': self.counts,
+            'user_id_min': self.user_ids[0],
+            'user_id_max': self.user_ids[-1],
+            'group_ids': sorted(group_id for group_id, _ in self.groups),
+            'largest_group': {'group_id': largest_group[0], 'size': len(largest_group[1]),
+                              'member_id': largest_group[1][0]} if largest_group else None,
+            'hot_conversations': hot,
+        }
+
+
+def clean(db, manifest, batch_size):
+    """删除清单中记录的生成数据 (先删消息，再删群和用户，好友/群成员/会话摘要随外键级联删除)。"""
+    low, high = manifest['user_id_min'], manifest['user_id_max']
+    prefix_like = escape_like(manifest['params']['prefix']) + '%'
+    steps = [
+        ("DELETE FROM Messages WHERE sender_id BETWEEN %s AND %s LIMIT %s", (low, high, batch_size)),
+    ]
+    group_ids = manifest.get('group_ids') or []
+    for start in range(0, len(group_ids), 1000):
+        chunk = group_ids[start:start + 1000]
+        steps.append((f"DELETE FROM `Groups` WHERE group_id IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk)))
+    steps.append(("DELETE FROM Users WHERE user_id BETWEEN %s AND %s AND username LIKE %s LIMIT %s",
+                  (low, high, prefix_like, batch_size)))
+    for query, params in steps:
+        while True:
+            deleted = db.execute_update(query, params)
+            db.commit()
+            if 'LIMIT' not in query or not deleted:
+                break
+            print(f"  ... deleted {deleted} rows", flush=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic chat dataset for scale benchmarks.")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--groups', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=30, help='消息时间分布在最近多少天内')
+    parser.add_argument('--min-friends', type=int, default=2)
+    parser.add_argument('--max-friends', type=int, default=1000)
+    parser.add_argument('--friend-alpha', type=float, default=1.5, help='好友数 Pareto 分布的形状参数 (越小越偏斜)')
+    parser.add_argument('--preferential', type=float, default=0.5, help='按度数加权选择好友的比例 (0-1)')
+    parser.add_argument('--min-group-size', type=int, default=3)
+    parser.add_argument('--max-group-size', type=int, default=2000)
+    parser.add_argument('--group-alpha', type=float, default=1.2, help='群大小 Pareto 分布的形状参数')
+    parser.add_argument('--zipf', type=float, default=1.1, help='消息在会话上的 Zipf 指数 (越大热点越集中)')
+    parser.add_argument('--prefix', default='bench_', help='生成的用户名/群名前缀')
+    parser.add_argument('--phone-base', type=int, default=19000000000, help='生成的手机号从该值开始递增 (11 位)')
+    parser.add_argument('--password', default='benchpass', help='所有生成用户的密码')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000, help='每次 executemany 并提交的行数')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST)
+    parser.add_argument('--clean', action='store_true', help='删除清单中记录的数据集并退出')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = create_bench_app()
+    from kaguchat_app.extensions import chat_service
+    db = chat_service.db_access
+
+    with app.app_context():
+        if args.clean:
+            if not os.path.exists(args.manifest):
+                raise SystemExit(f"Manifest {args.manifest} not found, nothing to clean")
+            with open(args.manifest, 'r', encoding='utf-8') as f:
+                clean(db, json.load(f), args.batch_size)
+            os.remove(args.manifest)
+            print("Generated dataset removed.")
+            return
+        if os.path.exists(args.manifest):
+            raise SystemExit(f"Manifest {args.manifest} already exists; run with --clean first or use another --manifest")
+        if args.phone_base + args.users > 99999999999:
+            raise SystemExit("--phone-base + --users must stay within 11 digits")
+
+        started = time.perf_counter()
+        generator = DatasetGenerator(args, db)
+        generator.create_users()
+        generator.create_friendships()
+        generator.create_groups()
+        generator.create_messages()
+        generator.rebuild_summaries(chat_service)
+
+        manifest = generator.manifest()
+        manifest['elapsed_seconds'] = round(time.perf_counter() - started, 1)
+        with open(args.manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        generator.log(f"Done in {manifest['elapsed_seconds']}s: {manifest['counts']} (manifest: {args.manifest})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+# benchmarks/socket_load_test.py
+# Socket.IO 负载测试: 模拟大量同时在线的聊天客户端。
+#   1. 通过 POST /api/auth/login 登录 (默认使用 generate_dataset.py 生成的用户: <prefix>0 .. <prefix>N-1)
+#   2. 通过 GET /api/chat/contacts 获取联系人，让每个客户端加入 (join_chat) 模拟客户端最多的那个会话房间
+#   3. 以配置的速率 (泊松过程) 发送 send_message 和 user_typing
+#   4. 统计登录/连接延迟、端到端投递延迟 (发送 -> 房间内其他成员收到 new_message)、
+#      输入状态投递延迟、丢失的投递和各类错误
+# 所有客户端运行在同一个 asyncio 事件循环中，发送时间和接收时间使用同一个单调时钟。
+#
+# 依赖 (仅本脚本需要): pip install "python-socketio[asyncio_client]" aiohttp
+# 用法 (在项目根目录):
+#   python -m benchmarks.socket_load_test --clients 1000 --duration 60 --message-rate 0.2 --typing-rate 0.5
+#   python -m benchmarks.socket_load_test --start-server --clients 200      # 先在本地启动 run.py
+#   python -m benchmarks.socket_load_test --url http://localhost:5001 --output socket_load.json
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+from benchmarks.common import summarize, format_summary, PROJECT_ROOT
+
+
+class LoadStats:
+    def __init__(self):
+        self.login_latencies = []
+        self.connect_latencies = []
+        self.delivery_latencies = []
+        self.typing_latencies = []
+        self.errors = Counter()
+        self.sent = 0
+        self.expected_deliveries = 0
+        self.delivered = 0
+        self.typing_sent = 0
+        self.typing_received = 0
+
+
+class SimulatedClient:
+    def __init__(self, index, username, harness):
+        import socketio
+        self.index = index
+        self.username = username
+        self.harness = harness
+        self.stats = harness.stats
+        self.user_id = None
+        self.token = None
+        self.contacts = []
+        self.room = None # (conversation_key, contact_type, contact_id)
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self._register_handlers()
+
+    def _register_handlers(self):
+        sio, stats, harness = self.sio, self.stats, self.harness
+
+        @sio.on('new_message')
+        async def on_new_message(payload):
+            if str(payload.get('sender_id')) == self.user_id:
+                return # 发送者自己也在房间里，只统计其他成员收到的投递
+            sent_at = harness.pending_messages.get(payload.get('client_msg_id'))
+            if sent_at is not None:
+                stats.delivered += 1
+                stats.delivery_latencies.append(time.monotonic() - sent_at)
+
+        def record_typing(user_id):
+            sent_at = harness.last_typing.get(str(user_id))
+            stats.typing_received += 1
+            if sent_at is not None:
+                stats.typing_latencies.append(time.monotonic() - sent_at)
+
+        @sio.on('is_typing')
+        async def on_is_typing(payload):
+            record_typing(payload.get('user_id'))
+
+        # TYPING_COALESCE_ENABLED 时服务端按房间合并，一条 typing_update 可能包含多个用户
+        @sio.on('typing_update')
+        async def on_typing_update(payload):
+            for entry in payload.get('typing', []):
+                if str(entry.get('user_id')) != self.user_id:
+                    record_typing(entry.get('user_id'))
+
+        for event in ('message_error', 'chat_error', 'auth_error', 'unauthorized'):
+            sio.on(event, lambda payload, event=event: stats.errors.update([event]))
+
+        @sio.on('joined_chat_room')
+        async def on_joined(payload):
+            harness.joined.add(self.index)
+
+    async def login(self, http):
+        started = time.monotonic()
+        async with http.post(f"{self.harness.args.url}/api/auth/login",
+                             json={'username': self.username, 'password': self.harness.args.password}) as response:
+            if response.status != 200:
+                self.stats.errors.update([f"login_http_{response.status}"])
+                return False
+            data = await response.json()
+        self.stats.login_latencies.append(time.monotonic() - started)
+        self.token, self.user_id = data['access_token'], str(data['user_id'])
+        async with http.get(f"{self.harness.args.url}/api/chat/contacts",
+                            headers={'Authorization': f"Bearer {self.token}"}) as response:
+            if response.status != 200:
+                self.stats.errors.update([f"contacts_http_{response.status}"])
+                return False
+            self.contacts = (await response.json()).get('contacts', [])
+        return True
+
+    async def connect(self):
+        started = time.monotonic()
+        try:
+            await self.sio.connect(self.harness.args.url, auth={'token': self.token},
+                                   transports=['websocket'], wait_timeout=self.harness.args.connect_timeout)
+        except Exception as e:
+            self.stats.errors.update([f"connect_failed:{type(e).__name__}"])
+            return False
+        self.stats.connect_latencies.append(time.monotonic() - started)
+        return True
+
+    def conversation_keys(self):
+        for contact in self.contacts:
+            contact_id = int(contact['contact_id'])
+            if contact['type'] == 'group':
+                yield f"group_{contact_id}", 'group', contact_id
+            else:
+                low, high = sorted((int(self.user_id), contact_id))
+                yield f"friend_{low}_{high}", 'friend', contact_id
+
+    async def join(self):
+        _, contact_type, contact_id = self.room
+        await self.sio.emit('join_chat', {'contact_type': contact_type, 'contact_id': contact_id})
+
+    async def drive(self, deadline):
+        """在 deadline 之前按泊松过程发送消息和输入状态。"""
+        args, harness, rng = self.harness.args, self.harness, self.harness.rng
+        room_size = harness.room_members[self.room[0]]
+        _, contact_type, contact_id = self.room
+        rates = [(args.message_rate, 'message'), (args.typing_rate, 'typing')]
+        total_rate = sum(rate for rate, _ in rates)
+        if total_rate <= 0:
+            return
+        while True:
+            await asyncio.sleep(rng.expovariate(total_rate))
+            if time.monotonic() >= deadline or not self.sio.connected:
+                return
+            kind = 'message' if rng.random() < args.message_rate / total_rate else 'typing'
+            if kind == 'message':
+                client_msg_id = uuid.uuid4().hex
+                harness.pending_messages[client_msg_id] = time.monotonic()
+                self.stats.sent += 1
+                self.stats.expected_deliveries += room_size - 1
+                await self.sio.emit('send_message', {
+                    'message_content': f"load test {client_msg_id[:8]}",
+                    'contact_id': contact_id, 'contact_type': contact_type, 'client_msg_id': client_msg_id})
+            else:
+                harness.last_typing[self.user_id] = time.monotonic()
+                self.stats.typing_sent += 1
+                await self.sio.emit('user_typing', {'contact_id': contact_id, 'contact_type': contact_type})
+
+
+class LoadHarness:
+    def __init__(self, args):
+        self.args = args
+        self.stats = LoadStats()
+        self.rng = random.Random(args.seed)
+        self.pending_messages = {} # client_msg_id -> 发送时间
+        self.last_typing = {} # user_id -> 最近一次发送 user_typing 的时间
+        self.room_members = Counter()
+        self.joined = set()
+
+    async def _paced(self, clients, rate, func, concurrency):
+        """以每秒 rate 个的速度启动 func(client)，同时最多 concurrency 个在执行。"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(client):
+            async with semaphore:
+                return await func(client)
+
+        tasks = []
+        for client in clients:
+            tasks.append(asyncio.ensure_future(run(client)))
+            if rate > 0:
+                await asyncio.sleep(1.0 / rate)
+        return await asyncio.gather(*tasks)
+
+    def assign_rooms(self, clients):
+        """每个客户端加入在模拟客户端中成员最多的会话，保证消息有接收者。"""
+        popularity = Counter(key for client in clients for key, _, _ in client.conversation_keys())
+        for client in clients:
+            options = list(client.conversation_keys())
+            if not options:
+                continue
+            best = max(options, key=lambda option: (popularity[option[0]], option[0]))
+            client.room = best
+            self.room_members[best[0]] += 1
+
+    async def run(self):
+        import aiohttp
+        args = self.args
+        clients = [SimulatedClient(i, f"{args.prefix}{args.first_user + i}", self) for i in range(args.clients)]
+        timeout = aiohttp.ClientTimeout(total=args.connect_timeout * 3)
+        async with aiohttp.ClientSession(timeout=timeout) as http:
+            print(f"Logging in {len(clients)} users ...", flush=True)
+            logged_in = await self._paced(clients, args.login_rate, lambda c: c.login(http), args.login_concurrency)
+        clients = [c for c, ok in zip(clients, logged_in) if ok]
+        self.assign_rooms(clients)
+        clients = [c for c in clients if c.room is not None]
+
+        print(f"Connecting {len(clients)} Socket.IO clients ...", flush=True)
+        connected = await self._paced(clients, args.connect_rate, lambda c: c.connect(), args.connect_concurrency)
+        clients = [c for c, ok in zip(clients, connected) if ok]
+        # 只统计已连接的成员
+        self.room_members = Counter(c.room[0] for c in clients)
+        await asyncio.gather(*(c.join() for c in clients))
+        await asyncio.sleep(1.0)
+        shared = sum(1 for c in clients if self.room_members[c.room[0]] > 1)
+        print(f"{len(clients)} connected, {len(self.joined)} joined rooms "
+              f"({len(self.room_members)} rooms, {shared} clients share a room); driving load for {args.duration}s",
+              flush=True)
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(c.drive(deadline) for c in clients))
+        await asyncio.sleep(args.drain) # 等待在途消息送达
+        elapsed = time.monotonic() - started
+        await asyncio.gather(*(c.sio.disconnect() for c in clients), return_exceptions=True)
+        return self.report(len(clients), elapsed)
+
+    def report(self, connected, elapsed):
+        stats = self.stats
+        result = {
+            'clients': {'requested': self.args.clients, 'connected': connected, 'rooms': len(self.room_members)},
+            'login': summarize(stats.login_latencies),
+            'connect': summarize(stats.connect_latencies),
+            'delivery': summarize(stats.delivery_latencies, elapsed=elapsed),
+            'typing': summarize(stats.typing_latencies, elapsed=elapsed),
+            'messages_sent': stats.sent,
+            'send_rate_per_s': round(stats.sent / elapsed, 2) if elapsed else None,
+            'expected_deliveries': stats.expected_deliveries,
+            'delivered': stats.delivered,
+            'delivery_ratio': round(stats.delivered / stats.expected_deliveries, 4) if stats.expected_deliveries else None,
+            'typing_sent': stats.typing_sent,
+            'typing_received': stats.typing_received,
+            'errors': dict(stats.errors),
+            'settings': {k: v for k, v in vars(self.args).items() if k != 'password'},
+        }
+        for name in ('login', 'connect', 'delivery', 'typing'):
+            print(format_summary(name, result[name]))
+        print(f"messages sent={stats.sent} delivered={stats.delivered}/{stats.expected_deliveries} "
+              f"ratio={result['delivery_ratio']} typing={stats.typing_received} received / {stats.typing_sent} sent "
+              f"errors={dict(stats.errors) or 0}")
+        return result
+
+
+def start_server(url):
+    """在本地启动 run.py 并等待端口可连接。"""
+    from urllib.parse import urlparse
+    import socket
+    parsed = urlparse(url)
+    port = parsed.port or 5001
+    env = dict(os.environ, FLASK_RUN_PORT=str(port), FLASK_RUN_HOST=parsed.hostname or '127.0.0.1',
+               KAGUCHAT_WORKER_ID='loadtest') # 关闭 debug reloader
+    process = subprocess.Popen([sys.executable, os.path.join(PROJECT_ROOT, 'run.py')], env=env, cwd=PROJECT_ROOT)
+    for _ in range(300):
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}")
+        try:
+            with socket.create_connection((parsed.hostname or '127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("Server did not start listening within 30s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Socket.IO load test with many concurrent chat clients.")
+    parser.add_argument('--url', default='http://127.0.0.1:5001')
+    parser.add_argument('--start-server', action='store_true', help='在本地启动 run.py，测试结束后停止')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--prefix', default='bench_', help='用户名前缀 (与 generate_dataset.py 相同)')
+    parser.add_argument('--first-user', type=int, default=0, help='从 <prefix><first-user> 开始使用用户')
+    parser.add_argument('--password', default='benchpass')
+    parser.add_argument('--duration', type=float, default=60.0, help='稳定负载阶段的秒数')
+    parser.add_argument('--drain', type=float, default=5.0, help='停止发送后等待在途消息的秒数')
+    parser.add_argument('--message-rate', type=float, default=0.1, help='每个客户端每秒发送的消息数')
+    parser.add_argument('--typing-rate', type=float, default=0.3, help='每个客户端每秒发送的 user_typing 数')
+    parser.add_argument('--login-rate', type=float, default=50.0, help='每秒发起的登录数 (0 表示不限速)')
+    parser.add_argument('--login-concurrency', type=int, default=20)
+    parser.add_argument('--connect-rate', type=float, default=100.0, help='每秒建立的连接数 (0 表示不限速)')
+    parser.add_argument('--connect-concurrency', type=int, default=100)
+    parser.add_argument('--connect-timeout', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='把结果写入 JSON 文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        import socketio # noqa: F401
+        import aiohttp # noqa: F401
+    except ImportError:
+        raise SystemExit('This load test needs: pip install "python-socketio[asyncio_client]" aiohttp')
+
+    server = start_server(args.url) if args.start_server else None
+    try:
+        result = asyncio.run(LoadHarness(args).run())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
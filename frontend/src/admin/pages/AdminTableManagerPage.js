@@ -98,16 +98,21 @@ const AdminTableManagerPage = () => {
     const [primaryKey, setPrimaryKey] = useState('');
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState(null);
+    // 服务端分页/排序参数
+    const [query, setQuery] = useState({ page: 1, limit: 10, sort: undefined, order: 'asc' });
+    const [total, setTotal] = useState(0);
+    const [isDataLoading, setIsDataLoading] = useState(false);
 
     const [isModalVisible, setIsModalVisible] = useState(false);
     const [editingRecord, setEditingRecord] = useState(null);
     const [form] = Form.useForm();
     const [modalLoading, setModalLoading] = useState(false);
 
-    const loadSchemaAndData = useCallback(async () => {
+    const loadSchema = useCallback(async () => {
         if (!tableName) return;
         setIsLoading(true);
         setError(null);
+        setQuery(q => ({ ...q, page: 1, sort: undefined, order: 'asc' }));
         try {
             const schemaData = await getTableSchema(tableName);
             if (!schemaData || !schemaData.columns_for_display) {
@@ -115,11 +120,8 @@ const AdminTableManagerPage = () => {
             }
             setSchema(schemaData);
             setPrimaryKey(schemaData.primary_key || '');
-
-            const tableDataResponse = await getTableData(tableName);
-            setData(tableDataResponse.data || []);
         } catch (err) {
-            console.error(`Failed to load data for table ${tableName}:`, err);
+            console.error(`Failed to load schema for table ${tableName}:`, err);
             const errorMsg = err.msg || `Could not load data for ${tableName}`;
             setError(errorMsg);
             message.error(errorMsg);
@@ -128,10 +130,38 @@ const AdminTableManagerPage = () => {
         }
     }, [tableName]);
 
+    const loadSchemaAndData = useCallback(async () => {
+        if (!tableName || !schema) return;
+        setIsDataLoading(true);
+        try {
+            const tableDataResponse = await getTableData(tableName, query);
+            setData(tableDataResponse.data || []);
+            setTotal(tableDataResponse.total ?? ((query.page - 1) * query.limit + (tableDataResponse.data || []).length + (tableDataResponse.has_more ? 1 : 0)));
+        } catch (err) {
+            console.error(`Failed to load data for table ${tableName}:`, err);
+            message.error(err.msg || `Could not load data for ${tableName}`);
+        } finally {
+            setIsDataLoading(false);
+        }
+    }, [tableName, schema, query]);
+
+    useEffect(() => {
+        loadSchema();
+    }, [loadSchema]);
+
     useEffect(() => {
         loadSchemaAndData();
     }, [loadSchemaAndData]);
 
+    const handleTableChange = (pagination, _filters, sorter) => {
+        setQuery({
+            page: pagination.current,
+            limit: pagination.pageSize,
+            sort: sorter && sorter.order ? sorter.field : undefined,
+            order: sorter && sorter.order === 'descend' ? 'desc' : 'asc',
+        });
+    };
+
     const handleAdd = () => {
         setEditingRecord(null);
         form.resetFields();
@@ -221,11 +251,8 @@ const AdminTableManagerPage = () => {
                 title: colName.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase()),
                 dataIndex: colName,
                 key: colName,
-                sorter: (a, b) => {
-                    if (a[colName] < b[colName]) return -1;
-                    if (a[colName] > b[colName]) return 1;
-                    return 0;
-                },
+                sorter: true, // 服务端排序
+                sortOrder: query.sort === colName ? (query.order === 'desc' ? 'descend' : 'ascend') : null,
                 render: (text, record) => {
                     const colDef = schema.all_columns?.find(c => c.name === colName);
                     if (colDef?.type === 'boolean') return <Checkbox checked={!!text} disabled />;
@@ -253,7 +280,7 @@ const AdminTableManagerPage = () => {
                 ),
             },
         ];
-    }, [schema, primaryKey, handleEdit, handleDelete]); // handleEdit, handleDelete 是稳定的，但作为依赖项是好习惯
+    }, [schema, primaryKey, query, handleEdit, handleDelete]); // handleEdit, handleDelete 是稳定的，但作为依赖项是好习惯
 
     const formFieldsForModal = useMemo(() => {
         if (!schema) return [];
@@ -281,11 +308,12 @@ const AdminTableManagerPage = () => {
                 columns={tableColumns}
                 dataSource={data}
                 rowKey={record => record[primaryKey] || JSON.stringify(record)}
-                loading={isLoading}
+                loading={isLoading || isDataLoading}
                 bordered
                 size="middle"
                 scroll={{ x: 'max-content' }}
-                pagination={{ pageSize: 10, showSizeChanger: true, pageSizeOptions: ['10', '20', '50'] }}
+                onChange={handleTableChange}
+                pagination={{ current: query.page, pageSize: query.limit, total, showSizeChanger: true, pageSizeOptions: ['10', '20', '50', '100'] }}
             />
             <Modal
                 title={editingRecord ? `Edit Record (ID: ${editingRecord && primaryKey ? editingRecord[primaryKey] : 'N/A'})` : `Add New Record to ${schema?.table_name_display}`}
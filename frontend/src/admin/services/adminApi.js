@@ -95,13 +95,14 @@ export const getTableSchema = async (tableNameDisplay) => {
 };
 
 /**
- * 获取指定表的所有数据记录。
+ * 分页获取指定表的数据记录 (排序、过滤、分页都在服务端完成)。
  * @param {string} tableNameDisplay - 表的显示名。
- * @returns {Promise<{data: Array<object>, primary_key: string}>} Object containing data array and primary key name.
+ * @param {object} [params] - 查询参数: page, limit, cursor, sort, order ('asc'|'desc'), count, f_<列名>[__<操作>]。
+ * @returns {Promise<{data: Array<object>, primary_key: string, total: number|null, total_is_estimate: boolean, next_cursor: string|null, has_more: boolean}>}
  */
-export const getTableData = async (tableNameDisplay) => {
-    // API 返回 { data: [...], primary_key: "..." }
-    return await adminApiClient.get(`/table/${tableNameDisplay}/data`);
+export const getTableData = async (tableNameDisplay, params = {}) => {
+    // API 返回 { data: [...], primary_key: "...", total: N, page: 1, limit: 50, next_cursor: ..., has_more: ... }
+    return await adminApiClient.get(`/table/${tableNameDisplay}/data`, { params });
 };
 
 /**
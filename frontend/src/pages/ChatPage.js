@@ -82,15 +82,19 @@ const MessageItem = ({ message, currentUser }) => {
 };
 
 // --- 子组件：消息区域 (这里是补充的定义) ---
-const MessagesArea = ({ messages, currentUser, isLoading, error }) => {
+const MessagesArea = ({ messages, currentUser, isLoading, error, hasMore, isLoadingOlder, onLoadOlder }) => {
     const messagesEndRef = useRef(null);
+    const lastMessageKeyRef = useRef(null);
 
-    const scrollToBottom = () => {
-        console.log("有新消息,滚动到消息底部");
-        messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
-    };
-
-    useEffect(scrollToBottom, [messages]);
+    // 只在最后一条消息变化 (新消息) 时滚动到底部，加载更早的消息 (插入到顶部) 时保持当前位置
+    useEffect(() => {
+        const last = messages && messages.length ? messages[messages.length - 1] : null;
+        const lastKey = last ? (last.message_id ?? last.id ?? last.client_msg_id) : null;
+        if (lastKey !== lastMessageKeyRef.current) {
+            lastMessageKeyRef.current = lastKey;
+            messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
+        }
+    }, [messages]);
 
     if (isLoading) return <div className="flex-1 p-6 text-center text-gray-500"><Spin tip="Loading messages..." /></div>;
     if (error) return <div className="flex-1 p-6 text-center text-red-500"><Alert message="Error" description={error} type="error" showIcon /></div>;
@@ -100,6 +104,11 @@ const MessagesArea = ({ messages, currentUser, isLoading, error }) => {
 
     return (
         <div className="messages-area-content"> {/* 使用 ChatPage.css 中定义的样式 */}
+            {hasMore && (
+                <div style={{ textAlign: 'center', marginBottom: 12 }}>
+                    <Button size="small" loading={isLoadingOlder} onClick={onLoadOlder}>Load older messages</Button>
+                </div>
+            )}
             {messages.map(message => (
                 <MessageItem key={message.message_id || `msg-${Math.random()}`} message={message} currentUser={currentUser} />
             ))}
@@ -182,6 +191,11 @@ function ChatPage() {
     const [isLoadingMessages, setIsLoadingMessages] = useState(false);
     const [errorContacts, setErrorContacts] = useState(null);
     const [errorMessages, setErrorMessages] = useState(null);
+    // 消息分页: 接口只返回最新的一页，next_cursor 用于继续加载更早的消息
+    const [olderCursor, setOlderCursor] = useState(null);
+    const [hasMoreMessages, setHasMoreMessages] = useState(false);
+    const [isLoadingOlder, setIsLoadingOlder] = useState(false);
+    const activeContactKeyRef = useRef(null); // 加载更早消息期间切换了联系人时丢弃返回结果
     // messageInput 状态移到 MessageInput 组件内部，或者在这里管理并通过 props 传递给 MessageInput
 
     const socketRef = useRef(null);
@@ -251,9 +265,14 @@ function ChatPage() {
         setIsLoadingMessages(true);
         setErrorMessages(null);
         setMessages([]); 
+        activeContactKeyRef.current = `${contact.type}_${contact.contact_id}`;
+        setOlderCursor(null);
+        setHasMoreMessages(false);
         try {
             const response = await axios.get(`${API_BASE_URL}/api/chat/messages/${contact.type}/${contact.contact_id}`);
             setMessages(response.data.messages || []);
+            setOlderCursor(response.data.next_cursor || null);
+            setHasMoreMessages(Boolean(response.data.has_more));
         } catch (err) {
             setErrorMessages(err.response?.data?.error || 'Could not load messages.');
         } finally {
@@ -261,6 +280,30 @@ function ChatPage() {
         }
     }, [API_BASE_URL]);
 
+    const loadOlderMessages = useCallback(async () => {
+        if (!selectedContact || !olderCursor || isLoadingOlder) return;
+        const contact = selectedContact;
+        setIsLoadingOlder(true);
+        try {
+            const response = await axios.get(
+                `${API_BASE_URL}/api/chat/messages/${contact.type}/${contact.contact_id}`,
+                { params: { before: olderCursor } }
+            );
+            if (activeContactKeyRef.current !== `${contact.type}_${contact.contact_id}`) return;
+            const older = response.data.messages || [];
+            setMessages(prev => {
+                const known = new Set(prev.map(m => m.message_id ?? m.id));
+                return [...older.filter(m => !known.has(m.message_id ?? m.id)), ...prev];
+            });
+            setOlderCursor(response.data.next_cursor || null);
+            setHasMoreMessages(Boolean(response.data.has_more));
+        } catch (err) {
+            setErrorMessages(err.response?.data?.error || 'Could not load older messages.');
+        } finally {
+            setIsLoadingOlder(false);
+        }
+    }, [API_BASE_URL, selectedContact, olderCursor, isLoadingOlder]);
+
     const handleSelectContact = useCallback((contact) => {
         if (selectedContact && selectedContact.type === contact.type && selectedContact.contact_id === contact.contact_id) {
             if (isMobileView) setShowChatPaneOnMobile(true);
@@ -342,7 +385,15 @@ function ChatPage() {
             <Layout className="chat-window-layout"> {/* 使用 class 以便 CSS 控制 */}
                 <ChatHeader contact={selectedContact} onBack={handleBackToContacts} isMobileView={isMobileView && showChatPaneOnMobile} />
                 <Content className="messages-area-container"> {/* 这个 Content 就是之前的 MessagesArea */}
-                    <MessagesArea messages={messages} currentUser={currentUser} isLoading={isLoadingMessages} error={errorMessages} />
+                    <MessagesArea
+                        messages={messages}
+                        currentUser={currentUser}
+                        isLoading={isLoadingMessages}
+                        error={errorMessages}
+                        hasMore={hasMoreMessages}
+                        isLoadingOlder={isLoadingOlder}
+                        onLoadOlder={loadOlderMessages}
+                    />
                 </Content>
                 <Footer className="message-input-footer">
                     <MessageInput onSendMessage={handleSendMessage} disabled={isLoadingMessages || !selectedContact} />
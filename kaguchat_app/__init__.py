@@ -6,8 +6,17 @@ import uuid
 
 from kaguchat_app.data.db_access import close_request_db_connection
 from .config import current_config # 使用 . 从当前包导入
-from .extensions import socketio,  jwt, chat_service, table_service, logger
+from .extensions import socketio,  jwt, chat_service, table_service, login_service, password_hasher, message_writer, presence_service, typing_service, logger
 from .socket_events import register_socketio_events
+from .commands import register_commands
+from .data.id_generator import message_id_generator
+from .data.schema_cache import schema_cache
+from .data.query_stats import query_stats
+from .data.profile_cache import profile_cache
+from .data.contact_cache import contact_cache
+from .data.membership_cache import membership_index
+from .metrics import metrics
+from .log_config import configure_logging
 from .processors import get_table_processor as get_processor_func
 from flask_cors import CORS
 import os
@@ -17,7 +26,13 @@ def create_app(config_object=current_config):
     app.config.from_object(config_object)
 
     # 初始化扩展
-    socketio.init_app(app) 
+    # 配置了 SOCKETIO_MESSAGE_QUEUE 时，多个 worker 进程通过消息队列共享 emit
+    message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if message_queue:
+        socketio.init_app(app, message_queue=message_queue, channel=app.config.get('SOCKETIO_CHANNEL', 'flask-socketio'))
+        logger.info(f"SocketIO using message queue {message_queue} (channel: {app.config.get('SOCKETIO_CHANNEL')})")
+    else:
+        socketio.init_app(app)
     jwt.init_app(app)
 
     CORS(
@@ -30,27 +45,51 @@ def create_app(config_object=current_config):
     logger.info(f"CORS configured for origins: {app.config.get('CORS_ORIGINS', ['http://localhost:3000', 'http://localhost:5173'])} on /api/* routes")
 
 
-    # 配置日志 (可以做得更细致)
-    logging.basicConfig(level=app.config.get('LOG_LEVEL', 'INFO'))
-    # 如果 extensions.py 中的 logger 和这里的 logger 冲突，可以重命名或只用一个
-    # app.logger.handlers.extend(ext_logger.handlers) # 合并 handler
-    # app.logger.setLevel(ext_logger.level)
+    # 配置日志: 记录经队列交给后台线程写出，请求线程不做同步 I/O (见 log_config.py)
+    configure_logging(app)
 
     app.teardown_appcontext(close_request_db_connection)
+    # 每个请求的查询次数/数据库耗时统计 (teardown_request 在 teardown_appcontext 之前执行)
+    query_stats.init_app(app)
 
     # 注册蓝图
     from .routes.auth_routes import auth_bp
     from .routes.chat_routes import chat_bp
     from .routes.admin_routes import admin_bp
     from .routes.user_routes import user_bp
+    from .routes.metrics_routes import metrics_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(chat_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(user_bp)
+    app.register_blueprint(metrics_bp)
 
+    # Prometheus 指标 (/metrics)，需在注册 SocketIO 事件之前配置
+    metrics.init_app(app, socketio)
     # 注册 SocketIO 事件 (从 socket_events.py)
     register_socketio_events(socketio)
+    # 用户资料缓存 (进程内 LRU，可选 Redis 共享)，登录/认证、联系人列表和 socket 消息共用
+    profile_cache.init_app(app, socketio)
+    # Redis 中的联系人列表缓存 (新消息增量更新，联系人变化时失效)
+    contact_cache.init_app(app)
+    # join_chat / send_message 的好友、群成员权限索引 (进程内，可选 Redis 共享)
+    membership_index.init_app(app, socketio)
+    login_service.init_app(app)
+    # 在线状态: Redis 中的连接计数、心跳过期和合并后的好友上下线通知
+    presence_service.init_app(app, socketio)
+    # 密码哈希放到线程/进程池中执行，避免阻塞事件循环
+    password_hasher.init_app(app, socketio)
+    # 管理后台的表结构元数据缓存 (首次使用时加载)
+    schema_cache.init_app(app)
+    # 配置消息 ID 生成器的节点号
+    message_id_generator.init_app(app)
+    # MESSAGE_WRITE_MODE = 'write_behind' 时启动后台批量写入任务
+    message_writer.init_app(app, socketio)
+    # 输入状态 (user_typing / user_stopped_typing) 按房间合并后定时发送
+    typing_service.init_app(app, socketio)
+    # 注册 Flask CLI 命令 (从 commands.py)
+    register_commands(app)
     Session(app)
     # 头像上传文件夹
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -1,110 +1,466 @@
-from ..data.db_access import DatabaseAccess
+from ..data.db_access import DatabaseAccess, run_after_commit
+from ..data.pagination import encode_cursor, decode_cursor
+from ..data.id_generator import message_id_generator
+from ..data.profile_cache import profile_cache
+from ..data.contact_cache import contact_cache
+from ..data.membership_cache import membership_index
+from .presence_service import presence_service
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import time
+from datetime import datetime
+
+SUMMARY_PREVIEW_LENGTH = 255 # 与 Conversation_Summaries.last_message 列宽一致
+
+# 与 get_conversation_key 等价的 SQL 表达式，用于回填和按好友关系关联消息
+CONVERSATION_KEY_SQL = """
+    CASE WHEN group_id IS NOT NULL THEN CONCAT('group_', group_id)
+         ELSE CONCAT('friend_', LEAST(sender_id, receiver_id), '_', GREATEST(sender_id, receiver_id))
+    END
+"""
+
+
+def get_conversation_key(user_id, contact_id, contact_type):
+    """
+    返回会话的规范化键 (也用作 Socket.IO 房间名)。
+    私聊对双方相同: friend_<较小id>_<较大id>；群聊: group_<group_id>
+    """
+    if contact_type == 'friend':
+        user1, user2 = sorted((int(user_id), int(contact_id)))
+        return f"friend_{user1}_{user2}"
+    if contact_type == 'group':
+        return f"group_{int(contact_id)}"
+    raise ValueError(f"Invalid contact type: {contact_type}")
+
+
 class ChatService:
     def __init__(self):
         self.db_access = DatabaseAccess()
+        self.id_generator = message_id_generator
 
     def get_contact_list(self, user_id):
-        """获取联系人列表（基于 ContactListView）"""
+        """获取联系人列表（基于 Conversation_Summaries 摘要表，按最近消息时间倒序）"""
+        # 启用 CONTACT_CACHE_ENABLED 时优先读取 Redis 中的联系人列表，未命中时从摘要表读取并写回
+        entries = generation = None
+        if contact_cache.enabled:
+            entries, generation = contact_cache.get(user_id)
+        if entries is None:
+            entries = self._load_contact_entries(user_id)
+            if contact_cache.enabled:
+                contact_cache.store(user_id, entries, generation)
+            entries = [dict(entry, last_message_time=self._format_time(entry['last_message_time'])) for entry in entries]
+
+        # 好友的昵称/头像从共享的用户资料缓存中批量获取，不再每次关联 Users 表
+        friend_ids = [entry['contact_id'] for entry in entries if entry['type'] == 'friend']
+        profiles = profile_cache.get_many(friend_ids)
+        # 好友是否在线: 一次管道化的 Redis 查询
+        online = presence_service.online_many(friend_ids)
+        contacts = []
+        for entry in entries:
+            if entry['type'] == 'friend':
+                profile = profiles.get(str(entry['contact_id']))
+                if profile is None:
+                    continue # 好友账号已不存在
+                name, avatar_url = profile['nickname'], profile['avatar_url']
+            else:
+                name, avatar_url = entry['name'], entry['avatar_url']
+            contact = {
+                'contact_id': entry['contact_id'],
+                'type': entry['type'],
+                'name': name,
+                'avatar_url': avatar_url,
+                'last_message': entry['last_message'],
+                'last_message_time': entry['last_message_time']
+            }
+            if entry['type'] == 'friend':
+                contact['online'] = online.get(str(entry['contact_id']), False)
+            contacts.append(contact)
+        return contacts
+
+    def get_friends_presence(self, user_id, friend_ids):
+        """返回 {friend_id: 是否在线}，只包含 friend_ids 中确实是 user_id 好友的用户。"""
+        if not friend_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(friend_ids))
+        rows = self.db_access.execute_query(
+            f"SELECT friend_id FROM Friends WHERE user_id = %s AND status = 1 AND friend_id IN ({placeholders})",
+            (user_id, *friend_ids))
+        friends = [row['friend_id'] for row in rows]
+        online = presence_service.online_many(friends)
+        return {friend_id: online.get(str(friend_id), False) for friend_id in friends}
+
+    @staticmethod
+    def _format_time(value):
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%f') if value else None
+
+    def _load_contact_entries(self, user_id):
+        """从 Conversation_Summaries 读取联系人摘要 (群聊附带群名和头像)，按最后消息时间倒序。"""
         query = """
-            SELECT contact_id, type, name, avatar_url, last_message, last_message_time
-            FROM ContactListView
-            WHERE user_id = %s
+            SELECT cs.contact_id, cs.contact_type AS type,
+                   g.group_name, g.group_avatar,
+                   cs.last_message_id, cs.last_message, cs.last_message_time
+            FROM Conversation_Summaries cs
+            LEFT JOIN `Groups` g ON cs.contact_type = 'group' AND g.group_id = cs.contact_id
+            WHERE cs.user_id = %s
+              AND (cs.contact_type = 'friend' OR g.group_id IS NOT NULL)
+            ORDER BY cs.last_message_time DESC
         """
         results = self.db_access.execute_query(query, (user_id,))
-        # 格式化 last_message_time
-        return [
-            {
+        entries = []
+        for row in results:
+            entry = {
                 'contact_id': row['contact_id'],
                 'type': row['type'],
-                'name': row['name'],
-                'avatar_url': row['avatar_url'],
+                'last_message_id': row['last_message_id'],
                 'last_message': row['last_message'],
-                'last_message_time': row['last_message_time'].strftime('%Y-%m-%dT%H:%M:%S.%f') if row['last_message_time'] else None
-            } for row in results
-        ]
+                'last_message_time': row['last_message_time'],
+            }
+            if row['type'] == 'group':
+                entry.update(name=row['group_name'], avatar_url=row['group_avatar'])
+            entries.append(entry)
+        return entries
 
-    def get_messages(self, user_id, contact_id, contact_type):
-        """获取与某个联系人的消息"""
-        if contact_type == 'friend':
-            query = """
-                SELECT message_id, sender_id, receiver_id, group_id, content, sent_at,
-                       CASE WHEN sender_id = %s THEN 1 ELSE 0 END AS is_self
-                FROM Messages
-                WHERE (sender_id = %s AND receiver_id = %s)
-                   OR (sender_id = %s AND receiver_id = %s)
-                ORDER BY sent_at ASC
-            """
-            params = (user_id, user_id, contact_id, contact_id, user_id)
-        else:  # group
-            query = """
-                SELECT message_id, sender_id, receiver_id, group_id, content, sent_at,
-                       CASE WHEN sender_id = %s THEN 1 ELSE 0 END AS is_self
-                FROM Messages
-                WHERE group_id = %s
-                ORDER BY sent_at ASC
-            """
-            params = (user_id, contact_id)
-        messages = self.db_access.execute_query(query, params)
-        return [
-            {
-                'id': msg['message_id'],
-                'sender_id': msg['sender_id'],
-                'receiver_id': msg['receiver_id'],
-                'group_id': msg['group_id'],
-                'content': msg['content'],
-                'sent_at': msg['sent_at'].strftime('%Y-%m-%dT%H:%M:%S.%f'),
-                'is_self': msg['is_self']
-            } for msg in messages
-        ]
+    def get_contact_cache_stats(self):
+        return contact_cache.stats()
+
+    def get_messages(self, user_id, contact_id, contact_type, limit=50, before=None, after=None):
+        """
+        获取与某个联系人的消息 (基于 (sent_at, message_id) 的游标分页)。
+        - 默认从最新的消息开始加载，before 游标用于继续向更早的消息翻页
+        - after 游标用于加载比游标更新的消息 (例如断线重连后补齐)
+        返回 {'messages': [...按时间升序], 'next_cursor': str 或 None, 'has_more': bool}
+        """
+        if before and after:
+            raise ValueError("Only one of 'before' or 'after' may be given.")
+        newest_first = not after
+        cursor = decode_cursor(before or after, expected_length=2) if (before or after) else None
+
+        # 按会话键过滤，命中 (conversation_key, sent_at, message_id) 复合索引
+        where = "conversation_key = %s"
+        params = [user_id, get_conversation_key(user_id, contact_id, contact_type)]
+
+        if cursor:
+            # message_id 作为 sent_at 相同时的决胜键，保证翻页稳定不重不漏
+            op = '<' if newest_first else '>'
+            where += f" AND (sent_at {op} %s OR (sent_at = %s AND message_id {op} %s))"
+            params.extend([cursor[0], cursor[0], cursor[1]])
+
+        direction = 'DESC' if newest_first else 'ASC'
+        query = f"""
+            SELECT message_id, sender_id, receiver_id, group_id, content, sent_at,
+                   CASE WHEN sender_id = %s THEN 1 ELSE 0 END AS is_self
+            FROM Messages
+            WHERE {where}
+            ORDER BY sent_at {direction}, message_id {direction}
+            LIMIT %s
+        """
+        params.append(limit + 1) # 多取一条用于判断是否还有下一页
+        rows = self.db_access.execute_query(query, tuple(params))
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor((rows[-1]['sent_at'], rows[-1]['message_id'])) if has_more else None
+        if newest_first:
+            rows.reverse() # 前端按时间升序展示
+        return {
+            'messages': [
+                {
+                    'id': msg['message_id'],
+                    'sender_id': msg['sender_id'],
+                    'receiver_id': msg['receiver_id'],
+                    'group_id': msg['group_id'],
+                    'content': msg['content'],
+                    'sent_at': msg['sent_at'].strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                    'is_self': msg['is_self']
+                } for msg in rows
+            ],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
 
     """TODO: 目前只支持文本消息, 如需扩展需要链接 Attachment 表"""
     def send_message(self, sender_id, contact_id, contact_type, content):
-        if contact_type == 'firend':
-            receiver_id = contact_id
-            group_id = None
-        else:  # group
-            receiver_id = None
-            group_id = contact_id
-        """发送消息"""
-        query = """
-            INSERT INTO Messages (sender_id, receiver_id, group_id, content, message_type, sent_at)
-            VALUES (%s, %s, %s, %s, 0, NOW())
+        """发送消息，返回新消息的 message_id"""
+        return self.send_message_and_get_info(sender_id, contact_id, contact_type, content)['message_id']
+
+    def build_message(self, sender_id, contact_id, contact_type, content, message_id=None):
+        """
+        在内存中构造一条待写入的消息记录 (不访问数据库)。
+        message_id 由应用生成 (按时间排序、跨进程唯一)，在写入数据库之前就已确定。
         """
-        params = (sender_id, receiver_id, group_id, content)
-        message_id = self.db_access.execute_update(query, params)
-        return message_id
+        if contact_type == 'friend':
+            receiver_id, group_id = contact_id, None
+        elif contact_type == 'group':
+            receiver_id, group_id = None, contact_id
+        else:
+            raise ValueError(f"Invalid contact type: {contact_type}")
+        # Messages.sent_at 是 DATETIME (秒精度)，MySQL 会对小数秒四舍五入，这里先截断到秒，保证返回值与库中一致
+        # 注意: 应用服务器与 MySQL 会话应使用相同时区 (原来的 NOW() 使用的是 MySQL 会话时区)
+        return {
+            'message_id': message_id if message_id is not None else self.id_generator.next_id(),
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'group_id': group_id,
+            'conversation_key': get_conversation_key(sender_id, contact_id, contact_type),
+            'content': content,
+            'sent_at': datetime.now().replace(microsecond=0)
+        }
+
+    def format_message(self, message):
+        """将消息记录转换为返回给客户端的格式。"""
+        return {
+            'message_id': message['message_id'],
+            'sender_id': message['sender_id'],
+            'receiver_id': message['receiver_id'],
+            'group_id': message['group_id'],
+            'content': message['content'],
+            'sent_at': message['sent_at'].strftime('%Y-%m-%dT%H:%M:%S.%f')
+        }
 
     def send_message_and_get_info(self, sender_id, contact_id, contact_type, content):
-        receiver_id = None
-        group_id = None
-        if contact_type == 'friend':
-            receiver_id = contact_id
-            group_id = None
-        elif contact_type == 'group':  # group
-            receiver_id = None
-            group_id = contact_id
-        """发送消息"""
+        """
+        发送消息并返回完整的消息记录。
+        message_id 和 sent_at 都由应用生成并随 INSERT 写入，因此不需要再 SELECT 读回刚插入的行。
+        """
+        message = self.build_message(sender_id, contact_id, contact_type, content)
         query = """
-            INSERT INTO Messages (sender_id, receiver_id, group_id, content, message_type, sent_at)
-            VALUES (%s, %s, %s, %s, 0, NOW())
+            INSERT INTO Messages (message_id, sender_id, receiver_id, group_id, conversation_key, content, message_type, sent_at)
+            VALUES (%s, %s, %s, %s, %s, %s, 0, %s)
         """
-        params = (sender_id, receiver_id, group_id, content)
-        message_id = self.db_access.execute_update(query, params, fetch_id=True)
+        params = (message['message_id'], message['sender_id'], message['receiver_id'], message['group_id'],
+                  message['conversation_key'], message['content'], message['sent_at'])
+        self.db_access.execute_update(query, params)
+        # 在同一事务中更新双方 (或全部群成员) 的会话摘要
+        self._update_conversation_summaries(message)
+        return self.format_message(message)
+
+    def persist_messages(self, messages):
+        """
+        批量写入已构造好的消息 (写后模式下由后台写入线程调用)。
+        使用一条多行 INSERT；主键冲突视为已写入 (重试时保持幂等)。
+        同一批中每个会话只用最新的一条消息更新一次会话摘要。调用方负责提交事务。
+        """
+        if not messages:
+            return 0
         query = """
-            SELECT message_id, sender_id, receiver_id, group_id, content, sent_at
-            FROM Messages
-            WHERE message_id = %s
+            INSERT INTO Messages (message_id, sender_id, receiver_id, group_id, conversation_key, content, message_type, sent_at)
+            VALUES (%s, %s, %s, %s, %s, %s, 0, %s)
+            ON DUPLICATE KEY UPDATE message_id = message_id
         """
-        params = (message_id,)
-        message = self.db_access.execute_query(query, params)
-        # print(message)
-        return {
-            'message_id': message[0]['message_id'],
-            'sender_id': message[0]['sender_id'],
-            'receiver_id': message[0]['receiver_id'],
-            'group_id': message[0]['group_id'],
-            'content': message[0]['content'],
-            'sent_at': message[0]['sent_at'].strftime('%Y-%m-%dT%H:%M:%S.%f')
-        }
\ No newline at end of file
+        rows = self.db_access.execute_many(query, [
+            (m['message_id'], m['sender_id'], m['receiver_id'], m['group_id'],
+             m['conversation_key'], m['content'], m['sent_at'])
+            for m in messages
+        ])
+        latest_by_conversation = {}
+        for message in messages:
+            current = latest_by_conversation.get(message['conversation_key'])
+            if current is None or message['message_id'] > current['message_id']:
+                latest_by_conversation[message['conversation_key']] = message
+        for message in latest_by_conversation.values():
+            self._update_conversation_summaries(message)
+        return rows
+
+    # ---- 会话摘要 (Conversation_Summaries) 维护 ----
+
+    def _update_conversation_summaries(self, message):
+        """
+        用一条新消息更新所有相关用户的会话摘要。
+        好友消息更新收发双方 (仅限仍为好友关系的一方)，群消息更新所有群成员。
+        只有当新消息比摘要中的更新时才覆盖，避免并发写入时乱序。
+        """
+        preview = (message['content'] or '')[:SUMMARY_PREVIEW_LENGTH]
+        message_id = message['message_id']
+        sent_at = message['sent_at']
+        # 注意 ON DUPLICATE KEY UPDATE 按顺序求值，last_message_id 必须最后更新
+        newer = "last_message_id IS NULL OR %s > last_message_id"
+        on_duplicate = f"""
+            ON DUPLICATE KEY UPDATE
+                last_message = IF({newer}, %s, last_message),
+                last_message_time = IF({newer}, %s, last_message_time),
+                last_message_id = IF({newer}, %s, last_message_id)
+        """
+        on_duplicate_params = (message_id, preview, message_id, sent_at, message_id, message_id)
+
+        if message['group_id'] is not None:
+            query = f"""
+                INSERT INTO Conversation_Summaries
+                    (user_id, contact_type, contact_id, last_message_id, last_message, last_message_time)
+                SELECT gm.user_id, 'group', gm.group_id, %s, %s, %s
+                FROM Group_Members gm
+                WHERE gm.group_id = %s
+                {on_duplicate}
+            """
+            params = (message_id, preview, sent_at, message['group_id']) + on_duplicate_params
+        else:
+            sender_id, receiver_id = message['sender_id'], message['receiver_id']
+            query = f"""
+                INSERT INTO Conversation_Summaries
+                    (user_id, contact_type, contact_id, last_message_id, last_message, last_message_time)
+                SELECT f.user_id, 'friend', f.friend_id, %s, %s, %s
+                FROM Friends f
+                WHERE f.status = 1
+                  AND ((f.user_id = %s AND f.friend_id = %s) OR (f.user_id = %s AND f.friend_id = %s))
+                {on_duplicate}
+            """
+            params = (message_id, preview, sent_at, sender_id, receiver_id, receiver_id, sender_id) + on_duplicate_params
+        self.db_access.execute_update(query, params)
+        if contact_cache.enabled:
+            self._update_cached_contact_lists(message, preview)
+
+    def _update_cached_contact_lists(self, message, preview):
+        """
+        事务提交后把新消息写入 Redis 中的联系人列表。
+        私聊更新双方的列表；群聊只更新群共用的最后一条消息，不需要查询群成员。
+        """
+        if message['group_id'] is not None:
+            run_after_commit(lambda: contact_cache.apply_group_message(message, preview))
+        else:
+            user_ids = [message['sender_id'], message['receiver_id']]
+            run_after_commit(lambda: contact_cache.apply_message(user_ids, message, preview))
+
+    def rebuild_conversation_summaries(self, user_ids):
+        """
+        从 Friends / Group_Members / Messages 重新计算指定用户的全部会话摘要。
+        用于回填，以及好友关系或群成员变化后修正摘要。返回写入的行数。
+        提交后这些用户在 Redis 中的联系人列表会被删除，下次读取时重建。
+        """
+        user_ids = [int(uid) for uid in user_ids]
+        if not user_ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        self.db_access.execute_update(
+            f"DELETE FROM Conversation_Summaries WHERE user_id IN ({placeholders})", tuple(user_ids))
+        if contact_cache.enabled:
+            run_after_commit(lambda: contact_cache.invalidate(user_ids))
+        friend_rows = self.db_access.execute_update(f"""
+            INSERT INTO Conversation_Summaries
+                (user_id, contact_type, contact_id, last_message_id, last_message, last_message_time)
+            SELECT f.user_id, 'friend', f.friend_id, m.message_id, LEFT(m.content, {SUMMARY_PREVIEW_LENGTH}), m.sent_at
+            FROM Friends f
+            LEFT JOIN Messages m ON m.message_id = (
+                SELECT m2.message_id FROM Messages m2
+                WHERE m2.conversation_key = CONCAT('friend_', LEAST(f.user_id, f.friend_id), '_', GREATEST(f.user_id, f.friend_id))
+                ORDER BY m2.sent_at DESC, m2.message_id DESC
+                LIMIT 1
+            )
+            WHERE f.status = 1 AND f.user_id IN ({placeholders})
+        """, tuple(user_ids))
+        group_rows = self.db_access.execute_update(f"""
+            INSERT INTO Conversation_Summaries
+                (user_id, contact_type, contact_id, last_message_id, last_message, last_message_time)
+            SELECT gm.user_id, 'group', gm.group_id, m.message_id, LEFT(m.content, {SUMMARY_PREVIEW_LENGTH}), m.sent_at
+            FROM Group_Members gm
+            LEFT JOIN Messages m ON m.message_id = (
+                SELECT m2.message_id FROM Messages m2
+                WHERE m2.conversation_key = CONCAT('group_', gm.group_id)
+                ORDER BY m2.sent_at DESC, m2.message_id DESC
+                LIMIT 1
+            )
+            WHERE gm.user_id IN ({placeholders})
+        """, tuple(user_ids))
+        return friend_rows + group_rows
+
+    def rebuild_all_conversation_summaries(self, batch_size=500, progress_callback=None):
+        """按 user_id 分批重建所有用户的会话摘要，每批单独提交，避免长事务。"""
+        last_user_id = 0
+        total_rows = 0
+        while True:
+            batch = self.db_access.execute_query(
+                "SELECT user_id FROM Users WHERE user_id > %s ORDER BY user_id LIMIT %s",
+                (last_user_id, batch_size))
+            if not batch:
+                break
+            user_ids = [row['user_id'] for row in batch]
+            total_rows += self.rebuild_conversation_summaries(user_ids)
+            self.db_access.commit()
+            last_user_id = user_ids[-1]
+            if progress_callback:
+                progress_callback(last_user_id, total_rows)
+        return total_rows
+
+    def remove_group_summaries(self, group_id):
+        """删除某个群在所有成员摘要中的记录 (群被删除时调用)。"""
+        self.on_group_changed(group_id, removed=True)
+        return self.db_access.execute_update(
+            "DELETE FROM Conversation_Summaries WHERE contact_type = 'group' AND contact_id = %s", (group_id,))
+
+    def on_group_changed(self, group_id, removed=False):
+        """
+        群资料 (群名、头像) 修改或群被删除时调用，提交后使所有成员缓存的联系人列表失效。
+        群被删除时 (成员已被级联删除) 同时使成员的消息权限索引失效。
+        """
+        if not contact_cache.enabled and not removed:
+            return
+        rows = self.db_access.execute_query(
+            "SELECT user_id FROM Conversation_Summaries WHERE contact_type = 'group' AND contact_id = %s", (group_id,))
+        user_ids = [row['user_id'] for row in rows]
+        if removed:
+            membership_index.invalidate(user_ids)
+        if contact_cache.enabled:
+            run_after_commit(lambda: contact_cache.invalidate(user_ids))
+
+    def on_contacts_changed(self, user_ids):
+        """好友关系或群成员变化后调用，刷新受影响用户的联系人数据和消息权限索引。"""
+        user_ids = {int(uid) for uid in user_ids if uid is not None}
+        if user_ids:
+            membership_index.invalidate(user_ids)
+            self.rebuild_conversation_summaries(sorted(user_ids))
+
+    def can_message(self, user_id, contact_id, contact_type):
+        """user_id 是否是该好友的好友 / 该群的成员 (使用缓存的权限索引，通常不访问数据库)。"""
+        return membership_index.can_message(user_id, contact_id, contact_type)
+
+    def get_membership_stats(self):
+        return membership_index.stats()
+
+    def on_messages_imported(self, messages):
+        """
+        管理后台批量导入消息后调用。导入的消息可能带有历史 sent_at，不能直接按新消息更新摘要，
+        因此对受影响的用户重建摘要 (群成员用一条 IN 查询取得)。
+        """
+        user_ids = set()
+        group_ids = set()
+        for message in messages:
+            if message.get('group_id') is not None:
+                group_ids.add(int(message['group_id']))
+            else:
+                user_ids.update(int(uid) for uid in (message.get('sender_id'), message.get('receiver_id')) if uid is not None)
+        if group_ids:
+            placeholders = ', '.join(['%s'] * len(group_ids))
+            rows = self.db_access.execute_query(
+                f"SELECT DISTINCT user_id FROM Group_Members WHERE group_id IN ({placeholders})", tuple(group_ids))
+            user_ids.update(row['user_id'] for row in rows)
+        self.on_contacts_changed(user_ids)
+
+    # ---- Messages.conversation_key 回填 (迁移 002) ----
+
+    def backfill_conversation_keys(self, batch_size=5000, pause_seconds=0.0, progress_callback=None):
+        """
+        分批回填 conversation_key，每批单独提交，每次只锁定一小段主键区间内的行，不会长时间阻塞写入。可重复执行。
+        按 message_id 键集分页，只遍历仍为 NULL 的行 (message_id 是稀疏的 Snowflake ID，不能按固定步长遍历区间)，
+        某一批没有返回任何行时结束。返回更新的行数。
+        """
+        last_id = 0
+        total_updated = 0
+        while True:
+            rows = self.db_access.execute_query("""
+                SELECT message_id FROM Messages
+                WHERE conversation_key IS NULL AND message_id > %s
+                ORDER BY message_id
+                LIMIT %s
+            """, (last_id, batch_size))
+            if not rows:
+                break
+            high = rows[-1]['message_id']
+            total_updated += self.db_access.execute_update(f"""
+                UPDATE Messages SET conversation_key = {CONVERSATION_KEY_SQL}
+                WHERE message_id > %s AND message_id <= %s AND conversation_key IS NULL
+            """, (last_id, high))
+            self.db_access.commit()
+            last_id = high
+            if progress_callback:
+                progress_callback(last_id, total_updated)
+            if pause_seconds:
+                time.sleep(pause_seconds)
+        return total_updated
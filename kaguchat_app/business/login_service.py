@@ -1,23 +1,110 @@
+import hashlib
+import hmac
+import time
 from ..data.db_access import DatabaseAccess
-from werkzeug.security import generate_password_hash, check_password_hash
+from ..data.cache import TTLCache
+from ..data.profile_cache import profile_cache
+from .password_hasher import password_hasher, is_password_hash, PasswordHasherBusyError
 from ..exceptions import IntegrityError
 
+import logging
+logger = logging.getLogger(__name__)
+
+# 写入 JWT 的用户资料 claims，socket 连接时可以直接从 token 中取得身份信息而不查库
+PROFILE_CLAIMS = ('username', 'nickname', 'avatar_url')
+
 class LoginService:
     def __init__(self):
         self.db_access = DatabaseAccess()
-    
+        self.password_hasher = password_hasher
+        # 用户资料使用共享的 profile_cache；token 摘要 -> 已验证的身份信息 (只在本进程内有效)
+        self.profile_cache = profile_cache
+        self.token_cache = TTLCache(maxsize=20000, ttl=600)
+        # user_id -> 资料最后修改时间 (time.time())，在此之前签发的 token 中的 claims 和缓存的身份信息都视为过期
+        self._profile_changed_at = TTLCache(maxsize=10000, ttl=3600)
+        # token 中资料 claims 的最长可信时间 (秒)，None 表示直到 token 过期 (资料修改通过 Redis 通知到所有 worker)
+        self.claims_max_age = None
+        # 本进程或其他 worker (Redis pub/sub) 使资料失效时，记录修改时间
+        self.profile_cache.add_invalidation_listener(self._on_profile_invalidated)
+
+    def init_app(self, app):
+        token_expires = app.config.get('JWT_ACCESS_TOKEN_EXPIRES')
+        token_lifetime = token_expires.total_seconds() if hasattr(token_expires, 'total_seconds') else 3600
+        token_cache_ttl = app.config.get('AUTH_TOKEN_CACHE_TTL', 600)
+        if not app.config.get('PROFILE_CACHE_REDIS', False):
+            # 其他 worker 修改资料时本进程收不到通知 (_profile_changed_at 只记录本进程的修改)，
+            # 签发较早的 claims 和缓存的身份信息最多信任 AUTH_PROFILE_CACHE_TTL 秒，与资料缓存的延迟一致
+            self.claims_max_age = app.config.get('AUTH_PROFILE_CACHE_TTL', 300)
+            token_cache_ttl = min(token_cache_ttl, self.claims_max_age)
+        self.token_cache = TTLCache(maxsize=app.config.get('AUTH_TOKEN_CACHE_SIZE', 20000), ttl=token_cache_ttl)
+        # 超过 token 有效期后，更早签发的 token 都已过期，不再需要记录修改时间
+        self._profile_changed_at = TTLCache(maxsize=app.config.get('AUTH_PROFILE_CACHE_SIZE', 10000),
+                                            ttl=token_lifetime)
+
     def authenticate_user(self, username, password):
         """验证用户登录"""
-        query = "SELECT user_id, password FROM Users WHERE username = %s"
+        query = "SELECT user_id, username, nickname, avatar_url, password FROM Users WHERE username = %s"
         user_record = self.db_access.execute_query(query,(username,))
         if not user_record:
             return None
         
         user_id, stored_password = user_record[0]['user_id'], user_record[0]['password']
-        if stored_password == password or check_password_hash(stored_password, password): #哈希密码匹配成功
-            return user_id
+        if is_password_hash(stored_password):
+            # 哈希计算在线程/进程池中进行，不阻塞事件循环
+            password_ok = self.password_hasher.verify(stored_password, password)
         else:
+            # 旧数据中的明文密码: 常量时间比较，验证成功后立即升级为哈希
+            password_ok = bool(stored_password) and hmac.compare_digest(
+                stored_password.encode('utf-8'), password.encode('utf-8'))
+        if not password_ok:
             return None # 密码错误
+
+        if self.password_hasher.needs_rehash(stored_password):
+            self._upgrade_password_hash(user_id, stored_password, password)
+        # 登录后马上要用资料生成 token claims，顺便放入缓存
+        self.profile_cache.prime(user_record[0])
+        return user_id
+
+    def _upgrade_password_hash(self, user_id, stored_password, password):
+        """登录成功后把明文或旧算法的密码替换为当前算法的哈希。失败只记录日志，不影响本次登录。"""
+        try:
+            new_hash = self.password_hasher.hash(password)
+            # 以旧值为条件更新，避免覆盖并发修改的新密码
+            updated = self.db_access.execute_update(
+                "UPDATE Users SET password = %s WHERE user_id = %s AND password = %s",
+                (new_hash, user_id, stored_password))
+            if updated:
+                logger.info(f"Upgraded password hash for user_id {user_id}")
+        except PasswordHasherBusyError:
+            logger.warning(f"Skipped password hash upgrade for user_id {user_id}: hasher busy")
+        except Exception as e:
+            logger.error(f"Failed to upgrade password hash for user_id {user_id}: {e}")
+
+    def hash_legacy_passwords(self, batch_size=500, progress_callback=None):
+        """
+        把 Users 表中剩余的明文密码批量替换为哈希 (按 user_id 分批，每批单独提交)。
+        返回更新的行数。
+        """
+        total_updated = 0
+        last_user_id = 0
+        while True:
+            rows = self.db_access.execute_query(
+                "SELECT user_id, password FROM Users WHERE user_id > %s ORDER BY user_id LIMIT %s",
+                (last_user_id, batch_size))
+            if not rows:
+                break
+            last_user_id = rows[-1]['user_id']
+            legacy_rows = [row for row in rows if row['password'] and not is_password_hash(row['password'])]
+            if legacy_rows:
+                hashes = self.password_hasher.hash_many([row['password'] for row in legacy_rows])
+                self.db_access.execute_many(
+                    "UPDATE Users SET password = %s WHERE user_id = %s AND password = %s",
+                    [(new_hash, row['user_id'], row['password']) for new_hash, row in zip(hashes, legacy_rows)])
+                self.db_access.commit()
+                total_updated += len(legacy_rows)
+            if progress_callback:
+                progress_callback(last_user_id, total_updated)
+        return total_updated
         
     def get_profile(self,user_id):
         query = "SELECT user_id, username, nickname, avatar_url FROM Users WHERE user_id = %s"
@@ -25,6 +112,78 @@ class LoginService:
         if not user_record:
             return None
         return user_record
+
+    # ---- 用户资料 / token 身份缓存 ----
+
+    def get_cached_profile(self, user_id):
+        """带缓存的 get_profile，返回单个字典 (副本) 或 None。"""
+        return self.profile_cache.get(user_id)
+
+    def invalidate_profile(self, user_id):
+        """用户资料或头像修改后调用，使缓存的资料 (所有 worker) 和 token 身份信息失效。"""
+        self.profile_cache.invalidate(user_id)
+
+    def _on_profile_invalidated(self, user_id):
+        self._profile_changed_at.set(str(user_id), time.time())
+
+    def get_token_claims(self, user_id):
+        """签发 token 时写入的额外 claims。"""
+        profile = self.get_cached_profile(user_id)
+        if not profile:
+            return {}
+        return {key: profile.get(key) for key in PROFILE_CLAIMS}
+
+    @staticmethod
+    def _token_key(token_string):
+        return hashlib.sha256(token_string.encode('utf-8')).hexdigest()
+
+    def get_cached_token_identity(self, token_string):
+        """返回已验证过的 token 对应的身份信息，未缓存或资料已修改时返回 None。"""
+        entry = self.token_cache.get(self._token_key(token_string))
+        if entry is None:
+            return None
+        cached_at, identity = entry
+        if self._profile_changed_at.get(identity['user_id'], 0) >= cached_at:
+            return None
+        return dict(identity)
+
+    def cache_token_identity(self, token_string, identity, expires_at=None):
+        """缓存已验证的 token 身份信息，缓存时间不超过 token 的过期时间 (exp)。"""
+        now = time.time()
+        ttl = None
+        if expires_at is not None:
+            ttl = expires_at - now
+            if ttl <= 0:
+                return
+        self.token_cache.set(self._token_key(token_string), (now, dict(identity)), ttl=ttl)
+
+    def build_identity(self, user_id, payload):
+        """
+        根据已验证的 JWT payload 构造身份信息。
+        token 中带有资料 claims 且签发后资料未修改时直接使用，否则从 (缓存的) 用户资料中获取。
+        未启用 PROFILE_CACHE_REDIS 时，签发超过 claims_max_age 秒的 claims 也改为从用户资料中获取。
+        用户不存在时返回 None。
+        """
+        user_id = str(user_id)
+        issued_at = payload.get('iat', 0)
+        claims_fresh = payload.get('username') and issued_at > self._profile_changed_at.get(user_id, 0) and \
+            (self.claims_max_age is None or time.time() - issued_at <= self.claims_max_age)
+        if claims_fresh:
+            profile = {key: payload.get(key) for key in PROFILE_CLAIMS}
+        else:
+            profile = self.get_cached_profile(user_id)
+            if not profile:
+                return None
+        username = profile.get('username')
+        return {
+            'user_id': user_id,
+            'username': username or f"user_{user_id}", # 提供一个备用 username
+            'nickname': profile.get('nickname') or username or f"User {user_id}",
+            'avatar_url': profile.get('avatar_url')
+        }
+
+    def cache_stats(self):
+        return {'profile': self.profile_cache.stats(), 'token': self.token_cache.stats()}
     
 
     def register_user(self, username, password, nickname, phone, avatar_url= None):
@@ -42,7 +201,7 @@ class LoginService:
         if self.db_access.execute_query(check_phone_query, (phone,)):
             return {"success": False, "error": "Phone number already registered."}
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = self.password_hasher.hash(password) # 可能抛出 PasswordHasherBusyError，由调用方处理
         
         insert_query = """
             INSERT INTO Users (username, password, phone, nickname, avatar_url)
@@ -55,6 +214,7 @@ class LoginService:
             # execute_update 内部的 with self 会管理连接
             new_user_id = self.db_access.execute_update(insert_query, params, fetch_id=True)
             if new_user_id:
+                self.invalidate_profile(new_user_id) # 清除可能残留的同 user_id 资料 (例如删除后重新导入)
                 return {"success": True, "user_id": new_user_id}
             else:
                 return {"success": False, "error": "User creation failed at database level."}
@@ -68,4 +228,6 @@ class LoginService:
         """更新用户头像"""
         update_query = "UPDATE Users SET avatar_url = %s WHERE user_id = %s"
         params = (avatar_url, user_id)
-        return self.db_access.execute_update(update_query, params)
+        result = self.db_access.execute_update(update_query, params)
+        self.invalidate_profile(user_id)
+        return result
@@ -0,0 +1,218 @@
+# kaguchat_app/business/message_writer.py
+# 写后 (write-behind) 消息持久化管线:
+#   socket 收到消息 -> 由应用生成 message_id (见 data/id_generator.py) -> 立即广播 -> 放入队列
+#   后台写入任务每 N 条或每 M 毫秒将队列中的消息用一条多行 INSERT 写入并一次提交 (group commit)，
+#   写入成功后向发送者发送 'message_persisted' 确认。
+# 仅在 MESSAGE_WRITE_MODE = 'write_behind' 时启用，默认仍为同步写入。
+import atexit
+import queue
+import signal
+import sys
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+class _PendingMessage:
+    __slots__ = ('message', 'ack_sid', 'client_msg_id', 'enqueued_at')
+
+    def __init__(self, message, ack_sid, client_msg_id):
+        self.message = message
+        self.ack_sid = ack_sid
+        self.client_msg_id = client_msg_id
+        self.enqueued_at = time.monotonic()
+
+
+class MessageWriteBehind:
+    """
+    后台批量写入消息的管线。
+    - 每 MESSAGE_WRITE_BATCH_SIZE 条或每 MESSAGE_WRITE_FLUSH_MS 毫秒提交一次
+    - 写入失败按指数退避重试 MESSAGE_WRITE_MAX_RETRIES 次，仍失败则逐条写入，
+      只有逐条写入也失败的消息才通知其发送者并记录完整消息以便补录
+    - 进程退出 (atexit / SIGTERM) 时会先把队列中的消息全部写入
+    - 队列满时 submit 返回 False，调用方应回退为同步写入
+    """
+
+    def __init__(self, chat_service):
+        self.chat_service = chat_service
+        self.app = None
+        self.socketio = None
+        self.enabled = False
+        self.batch_size = 100
+        self.flush_interval = 0.05
+        self.max_retries = 5
+        self.retry_backoff = 0.2
+        self._queue = None
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'persisted': 0, 'failed': 0, 'batches': 0, 'retries': 0, 'rejected': 0}
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.enabled = app.config.get('MESSAGE_WRITE_MODE', 'sync') == 'write_behind'
+        if not self.enabled:
+            return
+        self.batch_size = app.config.get('MESSAGE_WRITE_BATCH_SIZE', 100)
+        self.flush_interval = app.config.get('MESSAGE_WRITE_FLUSH_MS', 50) / 1000.0
+        self.max_retries = app.config.get('MESSAGE_WRITE_MAX_RETRIES', 5)
+        self.retry_backoff = app.config.get('MESSAGE_WRITE_RETRY_BACKOFF_MS', 200) / 1000.0
+        self._queue = queue.Queue(maxsize=app.config.get('MESSAGE_WRITE_QUEUE_MAX', 10000))
+        socketio.start_background_task(self._run)
+        atexit.register(self.shutdown)
+        self._install_sigterm_handler()
+        logger.info(f"Message write-behind enabled (batch_size={self.batch_size}, flush_interval={self.flush_interval * 1000:.0f}ms)")
+
+    def _install_sigterm_handler(self):
+        # 默认的 SIGTERM 会直接终止进程而不执行 atexit，这里转为正常退出以便先刷写队列
+        if threading.current_thread() is not threading.main_thread():
+            return
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handle_sigterm(signum, frame):
+            self.shutdown()
+            if callable(previous):
+                previous(signum, frame)
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    # ---- 生产者接口 (socket 事件处理中调用) ----
+
+    def submit(self, message, ack_sid=None, client_msg_id=None):
+        """将已分配 ID 的消息放入写入队列。队列已满或正在关闭时返回 False。"""
+        if self._stopping.is_set():
+            return False
+        try:
+            self._queue.put_nowait(_PendingMessage(message, ack_sid, client_msg_id))
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            return False
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({'enabled': self.enabled, 'queue_depth': self.queue_depth()})
+        return stats
+
+    # ---- 后台写入任务 ----
+
+    def _collect_batch(self):
+        """阻塞等待第一条消息，然后在 flush_interval 内最多收集 batch_size 条。"""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+        self._stopped.set()
+
+    def _drain(self):
+        """把队列中剩余的消息全部写入 (关闭时调用)。"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _write_batch(self, batch):
+        with self.app.app_context():
+            self.chat_service.persist_messages([p.message for p in batch])
+            self.chat_service.db_access.commit()
+
+    def _flush(self, batch):
+        with self._flush_lock:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._write_batch(batch)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        # 整批仍然失败: 可能只是其中某一行有问题 (例如外键约束)，逐条写入，只放弃真正失败的消息
+                        logger.warning(f"Write-behind batch of {len(batch)} messages still failing, writing rows individually: {e}")
+                        self._flush_individually(batch)
+                        return
+                    with self._stats_lock:
+                        self._stats['retries'] += 1
+                    delay = self.retry_backoff * (2 ** attempt)
+                    logger.warning(f"Write-behind batch of {len(batch)} messages failed (attempt {attempt + 1}), retrying in {delay:.2f}s: {e}")
+                    time.sleep(delay)
+        with self._stats_lock:
+            self._stats['persisted'] += len(batch)
+            self._stats['batches'] += 1
+        self._ack(batch)
+
+    def _flush_individually(self, batch):
+        """逐条写入 (每条单独提交)，成功的照常确认，失败的只通知对应的发送者。"""
+        persisted = []
+        for pending in batch:
+            try:
+                self._write_batch([pending])
+            except Exception as e:
+                self._report_failure([pending], e)
+            else:
+                persisted.append(pending)
+        with self._stats_lock:
+            self._stats['persisted'] += len(persisted)
+            self._stats['batches'] += 1
+        self._ack(persisted)
+
+    def _ack(self, batch):
+        for pending in batch:
+            if pending.ack_sid:
+                self.socketio.emit('message_persisted', {
+                    'message_id': pending.message['message_id'],
+                    'client_msg_id': pending.client_msg_id
+                }, room=pending.ack_sid)
+
+    def _report_failure(self, batch, error):
+        with self._stats_lock:
+            self._stats['failed'] += len(batch)
+        for pending in batch:
+            # 记录完整消息，便于人工补录
+            logger.error(f"Write-behind gave up persisting message {pending.message['message_id']}: {error}. Message: {pending.message}")
+            if pending.ack_sid:
+                self.socketio.emit('message_error', {
+                    'error': 'Failed to save message.',
+                    'message_id': pending.message['message_id'],
+                    'client_msg_id': pending.client_msg_id
+                }, room=pending.ack_sid)
+
+    def shutdown(self, timeout=10.0):
+        """停止后台任务并写入队列中剩余的所有消息。可重复调用。"""
+        if not self.enabled or self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._stopped.wait(timeout=max(timeout, self.flush_interval * 2))
+        self._drain()
+        logger.info(f"Message write-behind stopped: {self.stats()}")
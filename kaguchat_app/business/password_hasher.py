@@ -0,0 +1,210 @@
+# kaguchat_app/business/password_hasher.py
+# 把 CPU 密集的密码哈希 (PBKDF2 / scrypt) 移出事件循环:
+#   - 'thread' 模式 (默认): 在真正的 OS 线程中计算 (eventlet 用 tpool，gevent 用 hub 线程池)，
+#     hashlib 的 pbkdf2_hmac / scrypt 计算时会释放 GIL，不会阻塞其他 socket
+#   - 'process' 模式: 在独立的进程池中计算，适合 CPU 核数多、登录量特别大的部署
+#   - 'inline' 模式: 直接在当前线程计算 (CLI 脚本、调试)
+# 同时在执行中的哈希任务数有上限，超出时等待，等待超时则抛出 PasswordHasherBusyError。
+import collections
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+import logging
+logger = logging.getLogger(__name__)
+
+# werkzeug 生成的哈希格式为 "method$salt$hash"
+_HASH_METHOD_PREFIXES = ('pbkdf2:', 'scrypt:', 'scrypt$', 'pbkdf2$')
+
+
+class PasswordHasherBusyError(Exception):
+    """等待哈希执行槽位超时 (登录/注册请求过多)。"""
+    pass
+
+
+def is_password_hash(value):
+    """判断数据库中的密码是否为 werkzeug 生成的哈希 (否则视为旧数据中的明文)。"""
+    return bool(value) and value.count('$') >= 2 and value.startswith(_HASH_METHOD_PREFIXES)
+
+
+def _hash_method_of(stored_hash):
+    return stored_hash.split('$', 1)[0]
+
+
+def _default_hash_method():
+    """当前安装的 werkzeug 中 generate_password_hash 的默认算法 (例如 'scrypt' 或 'pbkdf2')。"""
+    return inspect.signature(generate_password_hash).parameters['method'].default
+
+
+# ---- 在线程/进程池中执行的任务 (进程模式下需要能被 pickle，因此定义在模块级) ----
+
+def _hash_task(password, method):
+    started_at = time.time()
+    if method:
+        result = generate_password_hash(password, method=method)
+    else:
+        result = generate_password_hash(password)
+    return result, started_at, time.time()
+
+
+def _check_task(stored_hash, password):
+    started_at = time.time()
+    result = check_password_hash(stored_hash, password)
+    return result, started_at, time.time()
+
+
+class PasswordHasher:
+    """
+    带并发上限和排队时间统计的密码哈希执行器。
+    - hash(password) / verify(stored_hash, password) 会阻塞调用方 (green thread) 直到计算完成，
+      但不会阻塞事件循环
+    - needs_rehash(stored_hash) 用于登录时把明文或旧算法的哈希升级为当前算法
+    """
+
+    def __init__(self):
+        self.mode = 'inline'
+        self.method = None # None 表示使用 werkzeug 的默认算法
+        self.max_workers = 4
+        self.max_pending = 64
+        self.acquire_timeout = 5.0
+        self._async_mode = 'threading'
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._compute_slots = threading.BoundedSemaphore(self.max_workers)
+        self._stats_lock = threading.Lock()
+        self._queue_times = collections.deque(maxlen=1000)
+        self._run_times = collections.deque(maxlen=1000)
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'in_flight': 0, 'max_queue_ms': 0.0}
+
+    def init_app(self, app, socketio=None):
+        self.mode = app.config.get('PASSWORD_HASHER_MODE', 'thread')
+        self.method = app.config.get('PASSWORD_HASH_METHOD')
+        self.max_workers = app.config.get('PASSWORD_HASHER_WORKERS', 4)
+        self.max_pending = app.config.get('PASSWORD_HASHER_MAX_PENDING', 64)
+        self.acquire_timeout = app.config.get('PASSWORD_HASHER_ACQUIRE_TIMEOUT', 5.0)
+        self._async_mode = getattr(socketio, 'async_mode', None) or 'threading'
+        # 执行槽位: 同时最多 max_workers 个任务在计算，其余最多 max_pending - max_workers 个在排队
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # 没有本地线程/进程池时 (eventlet tpool、gevent hub 线程池) 由该信号量限制同时计算的任务数
+        self._compute_slots = threading.BoundedSemaphore(self.max_workers)
+        self._queue_times.clear()
+        self._run_times.clear()
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'in_flight': 0, 'max_queue_ms': 0.0}
+        self.shutdown()
+        if self.mode == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        elif self.mode == 'thread' and self._async_mode not in ('eventlet', 'gevent'):
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hasher')
+        elif self.mode == 'thread' and self._async_mode == 'eventlet':
+            # tpool 是进程内共享的线程池 (大小由环境变量 EVENTLET_THREADPOOL_SIZE 控制，默认 20)，
+            # 同时计算的哈希数由 _compute_slots 限制为 PASSWORD_HASHER_WORKERS
+            logger.info(f"Password hashing uses eventlet.tpool worker threads (at most {self.max_workers} concurrent)")
+        elif self.mode not in ('thread', 'inline'):
+            raise ValueError(f"Unknown PASSWORD_HASHER_MODE: {self.mode}")
+        logger.info(f"Password hasher initialized (mode={self.mode}, async_mode={self._async_mode}, "
+                    f"workers={self.max_workers}, max_pending={self.max_pending})")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # ---- 执行 ----
+
+    def _run_in_os_thread(self, func, *args):
+        """在真正的 OS 线程中执行阻塞调用，调用方 (green thread) 让出事件循环。"""
+        if self._async_mode == 'eventlet':
+            from eventlet import tpool
+            return tpool.execute(func, *args)
+        if self._async_mode == 'gevent':
+            import gevent
+            return gevent.get_hub().threadpool.apply(func, args)
+        return func(*args)
+
+    def _execute(self, task, *args):
+        submitted_at = time.time()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            raise PasswordHasherBusyError("Too many concurrent password hashing requests.")
+        with self._stats_lock:
+            self._stats['in_flight'] += 1
+        try:
+            if self.mode == 'inline':
+                result, started_at, finished_at = task(*args)
+            elif self._executor is not None:
+                future = self._executor.submit(task, *args)
+                result, started_at, finished_at = self._run_in_os_thread(future.result)
+            else:
+                with self._compute_slots:
+                    result, started_at, finished_at = self._run_in_os_thread(task, *args)
+        finally:
+            self._slots.release()
+            with self._stats_lock:
+                self._stats['in_flight'] -= 1
+        queue_ms = max(started_at - submitted_at, 0.0) * 1000.0
+        with self._stats_lock:
+            self._queue_times.append(queue_ms)
+            self._run_times.append((finished_at - started_at) * 1000.0)
+            self._stats['max_queue_ms'] = max(self._stats['max_queue_ms'], queue_ms)
+        return result
+
+    def hash(self, password):
+        result = self._execute(_hash_task, password, self.method)
+        with self._stats_lock:
+            self._stats['hashed'] += 1
+        return result
+
+    def verify(self, stored_hash, password):
+        result = self._execute(_check_task, stored_hash, password)
+        with self._stats_lock:
+            self._stats['verified'] += 1
+        return result
+
+    def hash_many(self, passwords):
+        """批量哈希 (CLI 迁移脚本、后台批量导入使用)，在线程/进程池中并行计算。"""
+        if self._executor is None:
+            if self.mode == 'inline':
+                return [_hash_task(p, self.method)[0] for p in passwords]
+            # eventlet/gevent 下没有本地线程池: 逐个交给 OS 线程计算，避免阻塞事件循环
+            return [self.hash(p) for p in passwords]
+        methods = [self.method] * len(passwords)
+        return [result for result, _, _ in self._executor.map(_hash_task, passwords, methods)]
+
+    def needs_rehash(self, stored_password):
+        """
+        明文密码，或与当前算法不同的哈希，需要在登录成功后重新哈希。
+        当前算法为 PASSWORD_HASH_METHOD，未配置时为 werkzeug 的默认算法。
+        """
+        if not is_password_hash(stored_password):
+            return True
+        # 例如当前算法为 'pbkdf2:sha256' 时 'pbkdf2:sha256:600000' 视为同一算法；需要提升迭代次数时配置完整的方法字符串
+        method = self.method or _default_hash_method()
+        stored_method = _hash_method_of(stored_password)
+        return stored_method != method and not stored_method.startswith(method + ':')
+
+    # ---- 监控 ----
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            queue_times = sorted(self._queue_times)
+            run_times = list(self._run_times)
+        stats.update({
+            'mode': self.mode,
+            'async_mode': self._async_mode,
+            'workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'avg_queue_ms': round(sum(queue_times) / len(queue_times), 3) if queue_times else None,
+            'p95_queue_ms': round(queue_times[int(len(queue_times) * 0.95) - 1], 3) if queue_times else None,
+            'avg_hash_ms': round(sum(run_times) / len(run_times), 3) if run_times else None,
+        })
+        stats['max_queue_ms'] = round(stats['max_queue_ms'], 3)
+        return stats
+
+
+# 进程级共享的密码哈希执行器，在 create_app 中通过 init_app 配置
+password_hasher = PasswordHasher()
@@ -0,0 +1,283 @@
+# kaguchat_app/business/presence_service.py
+# 在线状态 (presence)，所有 worker 通过 Redis 共享:
+#   kaguchat:presence:user:<user_id>  ZSET  该用户的所有连接 (<worker>:<sid>)，分数为过期时间
+#   kaguchat:presence:online          ZSET  在线用户 -> 最近一次心跳的过期时间
+# 一个用户的任意一个连接 (多个标签页、多台设备) 未过期即为在线。
+# - 每个 worker 每 PRESENCE_HEARTBEAT 秒刷新本进程所有连接的过期时间；worker 崩溃后其连接在 PRESENCE_TTL 秒后过期，
+#   由任意 worker 的清理任务发现并把用户标记为离线
+# - online_many(user_ids) 用一次管道化的 ZCOUNT 查询一批用户是否在线 (联系人列表使用)
+# - 上线/离线变化不立即通知，而是在 PRESENCE_NOTIFY_WINDOW_MS 内合并: 窗口内状态又变回原样的用户不通知，
+#   每个在线的好友在一个窗口内最多收到一条 'presence_update' 事件 (包含本窗口内所有变化的好友)，
+#   大量客户端同时重连时不会产生 好友数² 量级的 emit。
+import threading
+import time
+import uuid
+
+from redis.exceptions import RedisError
+
+from ..data.db_access import DatabaseAccess
+
+import logging
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'kaguchat:presence:'
+ONLINE_KEY = KEY_PREFIX + 'online'
+
+# KEYS: 用户连接集合, 在线用户集合；ARGV: 连接 ID, 当前时间, 过期时间, user_id, 键的 ttl
+# 返回 1 表示用户由离线变为在线
+_TOUCH_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+local current = redis.call('ZSCORE', KEYS[2], ARGV[4])
+if not current or tonumber(ARGV[3]) > tonumber(current) then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4])
+end
+if current then
+    return 0
+end
+return 1
+"""
+
+# KEYS: 用户连接集合, 在线用户集合；ARGV: 连接 ID (为空表示只清理过期连接), 当前时间, user_id
+# 返回 1 表示用户由在线变为离线
+_RELEASE_SCRIPT = """
+if ARGV[1] ~= '' then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    local latest = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+    redis.call('ZADD', KEYS[2], latest[2], ARGV[3])
+    return 0
+end
+return redis.call('ZREM', KEYS[2], ARGV[3])
+"""
+
+
+def _user_key(user_id):
+    return f"{KEY_PREFIX}user:{user_id}"
+
+
+class PresenceService:
+    def __init__(self):
+        self.db_access = DatabaseAccess()
+        self.app = None
+        self.socketio = None
+        self.enabled = False
+        self.ttl = 60
+        self.heartbeat_interval = 20
+        self.notify_window = 1.0
+        self._redis_url = None
+        self._scripts = None
+        self._worker_token = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._connections = {} # sid -> user_id (本进程的连接)
+        self._pending = {} # user_id -> (窗口开始时的状态, 最新状态)
+        self._stats = {'online_transitions': 0, 'offline_transitions': 0, 'expired': 0,
+                       'notifications': 0, 'coalesced': 0, 'errors': 0}
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.enabled = app.config.get('PRESENCE_ENABLED', True)
+        if not self.enabled:
+            return
+        self.ttl = int(app.config.get('PRESENCE_TTL', 60))
+        self.heartbeat_interval = app.config.get('PRESENCE_HEARTBEAT', 20)
+        self.notify_window = app.config.get('PRESENCE_NOTIFY_WINDOW_MS', 1000) / 1000.0
+        self._redis_url = app.config.get('REDIS_URL')
+        socketio.start_background_task(self._run)
+        logger.info(f"Presence enabled (ttl={self.ttl}s, heartbeat={self.heartbeat_interval}s, "
+                    f"notify window={self.notify_window * 1000:.0f}ms)")
+
+    def _redis(self):
+        from ..data.redis_access import get_redis
+        return get_redis(self._redis_url)
+
+    def _script(self, name):
+        if self._scripts is None:
+            redis_client = self._redis()
+            self._scripts = {'touch': redis_client.register_script(_TOUCH_SCRIPT),
+                             'release': redis_client.register_script(_RELEASE_SCRIPT)}
+        return self._scripts[name]
+
+    def _connection_id(self, sid):
+        return f"{self._worker_token}:{sid}"
+
+    # ---- 连接 / 断开 (socket 事件中调用) ----
+
+    def connect(self, user_id, sid):
+        if not self.enabled:
+            return
+        user_id = str(user_id)
+        with self._lock:
+            self._connections[sid] = user_id
+        now = time.time()
+        try:
+            came_online = self._script('touch')(
+                keys=[_user_key(user_id), ONLINE_KEY],
+                args=[self._connection_id(sid), now, now + self.ttl, user_id, self.ttl * 2])
+        except RedisError as e:
+            self._error('connect', e)
+            return
+        if came_online:
+            self._queue_change(user_id, True)
+
+    def disconnect(self, user_id, sid):
+        if not self.enabled:
+            return
+        user_id = str(user_id)
+        with self._lock:
+            self._connections.pop(sid, None)
+        try:
+            went_offline = self._script('release')(
+                keys=[_user_key(user_id), ONLINE_KEY], args=[self._connection_id(sid), time.time(), user_id])
+        except RedisError as e:
+            self._error('disconnect', e)
+            return
+        if went_offline:
+            self._queue_change(user_id, False)
+
+    # ---- 查询 ----
+
+    def online_many(self, user_ids):
+        """返回 {str(user_id): bool}。Redis 不可用时全部视为离线。"""
+        keys = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        if not keys or not self.enabled:
+            return {key: False for key in keys}
+        now = time.time()
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            for key in keys:
+                pipe.zcount(_user_key(key), now, '+inf')
+            counts = pipe.execute()
+        except RedisError as e:
+            self._error('query', e)
+            return {key: False for key in keys}
+        return {key: count > 0 for key, count in zip(keys, counts)}
+
+    def connection_count(self, user_id):
+        """用户当前的连接数 (所有 worker)。"""
+        try:
+            return self._redis().zcount(_user_key(user_id), time.time(), '+inf')
+        except RedisError as e:
+            self._error('query', e)
+            return 0
+
+    # ---- 通知合并 ----
+
+    def _queue_change(self, user_id, online):
+        with self._lock:
+            if online:
+                self._stats['online_transitions'] += 1
+            else:
+                self._stats['offline_transitions'] += 1
+            initial, _ = self._pending.get(user_id, (not online, None))
+            self._pending[user_id] = (initial, online)
+
+    def _take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            changes = {user_id: latest for user_id, (initial, latest) in pending.items() if initial != latest}
+            self._stats['coalesced'] += len(pending) - len(changes)
+        return changes
+
+    def _friends_of(self, user_ids):
+        """返回 {好友 user_id: [把其加为好友的 user_id, ...]} 的反向映射: 谁的好友列表中有这些用户。"""
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        rows = self.db_access.execute_query(
+            f"SELECT user_id, friend_id FROM Friends WHERE status = 1 AND friend_id IN ({placeholders})",
+            tuple(int(user_id) for user_id in user_ids))
+        watchers = {}
+        for row in rows:
+            watchers.setdefault(str(row['user_id']), []).append(str(row['friend_id']))
+        return watchers
+
+    def flush_notifications(self):
+        """把本窗口内的状态变化按接收者合并后发送，每个在线的接收者一条 'presence_update'。"""
+        changes = self._take_pending()
+        if not changes:
+            return
+        with self.app.app_context():
+            watchers = self._friends_of(list(changes))
+        online_watchers = self.online_many(watchers)
+        for watcher, friend_ids in watchers.items():
+            if not online_watchers.get(watcher):
+                continue
+            self.socketio.emit('presence_update', {
+                'changes': [{'user_id': int(friend_id), 'online': changes[friend_id]} for friend_id in friend_ids]
+            }, room=watcher)
+            self._stats['notifications'] += 1
+
+    # ---- 心跳 / 过期清理 ----
+
+    def heartbeat(self):
+        """刷新本进程所有连接的过期时间 (worker 仍然存活)。被清理任务误判为离线的用户会重新上线。"""
+        with self._lock:
+            connections = list(self._connections.items())
+        if not connections:
+            return
+        now = time.time()
+        script = self._script('touch')
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            for sid, user_id in connections:
+                script(keys=[_user_key(user_id), ONLINE_KEY],
+                       args=[self._connection_id(sid), now, now + self.ttl, user_id, self.ttl * 2], client=pipe)
+            results = pipe.execute()
+        except RedisError as e:
+            self._error('heartbeat', e)
+            return
+        for (sid, user_id), came_online in zip(connections, results):
+            if came_online:
+                self._queue_change(user_id, True)
+
+    def sweep_expired(self, limit=1000):
+        """找出心跳已过期的在线用户 (其 worker 可能已崩溃)，清理过期连接并标记为离线。"""
+        now = time.time()
+        try:
+            redis_client = self._redis()
+            candidates = redis_client.zrangebyscore(ONLINE_KEY, '-inf', now, start=0, num=limit)
+            if not candidates:
+                return
+            script = self._script('release')
+            pipe = redis_client.pipeline(transaction=False)
+            for user_id in candidates:
+                script(keys=[_user_key(user_id), ONLINE_KEY], args=['', now, user_id], client=pipe)
+            results = pipe.execute()
+        except RedisError as e:
+            self._error('sweep', e)
+            return
+        for user_id, went_offline in zip(candidates, results):
+            if went_offline:
+                self._stats['expired'] += 1
+                self._queue_change(user_id, False)
+
+    def _run(self):
+        next_heartbeat = time.monotonic() + self.heartbeat_interval
+        while True:
+            time.sleep(self.notify_window)
+            try:
+                if time.monotonic() >= next_heartbeat:
+                    next_heartbeat = time.monotonic() + self.heartbeat_interval
+                    self.heartbeat()
+                    self.sweep_expired()
+                self.flush_notifications()
+            except Exception as e:
+                logger.error(f"Presence background task error: {e}", exc_info=True)
+
+    def _error(self, action, e):
+        self._stats['errors'] += 1
+        logger.warning(f"Presence {action} failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'enabled': self.enabled, 'local_connections': len(self._connections),
+                          'pending_changes': len(self._pending)})
+        return stats
+
+
+# 进程级共享的在线状态服务，在 create_app 中通过 init_app 配置
+presence_service = PresenceService()
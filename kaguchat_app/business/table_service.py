@@ -1,17 +1,49 @@
 from ..data.db_access import DatabaseAccess
+from ..data.schema_cache import schema_cache
+from ..data.query_stats import query_stats
 
 class TableService:
     def __init__(self):
         self.db_access = DatabaseAccess()
 
+    def get_db_pool_stats(self):
+        return self.db_access.get_pool_stats()
+
+    def get_query_stats(self, top=20):
+        return query_stats.stats(top=top)
+
+    def reset_query_stats(self):
+        query_stats.reset()
+
     def get_table_columns(self, table_name_actual):
         return self.db_access.get_table_columns(table_name_actual)
 
     def get_primary_key(self, table_name_actual):
         return self.db_access.get_primary_key(table_name_actual)
 
-    def get_table_data(self, table_name_actual):
-        return self.db_access.get_table_data(table_name_actual)
+    def get_table_schema(self, table_name_actual):
+        return self.db_access.get_table_schema(table_name_actual)
+
+    def refresh_schema_cache(self):
+        schema_cache.refresh()
+
+    def get_schema_cache_stats(self):
+        return schema_cache.stats()
+
+    def get_table_data(self, table_name_actual, order_by=None, limit=None, offset=None,
+                       filters=None, descending=False, after=None):
+        return self.db_access.get_table_data(table_name_actual, order_by=order_by, limit=limit, offset=offset,
+                                             filters=filters, descending=descending, after=after)
+
+    def stream_table_rows(self, table_name_actual, columns, order_by=None, filters=None, chunk_size=1000):
+        return self.db_access.stream_table_rows(table_name_actual, columns, order_by=order_by,
+                                                filters=filters, chunk_size=chunk_size)
+
+    def count_table_rows(self, table_name_actual, filters=None):
+        return self.db_access.count_table_rows(table_name_actual, filters=filters)
+
+    def estimate_table_rows(self, table_name_actual):
+        return self.db_access.estimate_table_rows(table_name_actual)
 
     def add_record(self, table_name_actual, values_dict):
         # values_dict 是 {column_name: value}
@@ -23,6 +55,24 @@ class TableService:
         params = tuple(values_dict.values())
         return self.db_access.execute_update(query, params, fetch_id=True) # 假设返回ID
 
+    def add_records(self, table_name_actual, columns, rows_values):
+        """
+        批量插入多行 (列相同)，mysql.connector 会把 executemany 改写为一条多行 INSERT。
+        rows_values 是与 columns 对应的值元组列表，返回插入的行数。
+        """
+        if not rows_values:
+            return 0
+        placeholders = ', '.join(['%s'] * len(columns))
+        sql_columns = ', '.join(f"`{col}`" for col in columns)
+        query = f"INSERT INTO `{table_name_actual}` ({sql_columns}) VALUES ({placeholders})"
+        return self.db_access.execute_many(query, rows_values)
+
+    def find_existing_values(self, table_name_actual, columns, values):
+        return self.db_access.find_existing_values(table_name_actual, columns, values)
+
+    def commit(self):
+        self.db_access.commit()
+
     def update_record(self, table_name_actual, primary_key_column, record_id, values_dict):
         if not values_dict:
             return True # 没有要更新的
@@ -64,16 +114,11 @@ class TableService:
         """根据主键获取单条记录，返回字典形式。"""
         query = f"SELECT * FROM {table_name_actual} WHERE {primary_key_column} = %s"
         result_rows = self.db_access.execute_query(query, (record_id,))
-        if result_rows:
-            columns = self.get_table_columns(table_name_actual)
-            return dict(zip(columns, result_rows[0]))
-        return None
+        # execute_query 使用 dictionary 游标，行本身已是 {列名: 值}
+        return result_rows[0] if result_rows else None
 
     def get_record_by_field(self, table_name_actual, field_name, field_value):
         """根据特定字段和值获取单条记录（假设该字段唯一或取第一条），返回字典。"""
         query = f"SELECT * FROM {table_name_actual} WHERE {field_name} = %s LIMIT 1"
         result_rows = self.db_access.execute_query(query, (field_value,))
-        if result_rows:
-            columns = self.get_table_columns(table_name_actual)
-            return dict(zip(columns, result_rows[0]))
-        return None
\ No newline at end of file
+        return result_rows[0] if result_rows else None
\ No newline at end of file
@@ -0,0 +1,155 @@
+# kaguchat_app/business/typing_service.py
+# "正在输入" 状态的服务端去抖与合并。
+# user_typing / user_stopped_typing 不再逐个转发给整个聊天室，而是:
+# - 按 (user, room) 去抖: 已在输入的用户再次发送 user_typing 只刷新过期时间，不产生任何 emit
+# - 输入状态在 TYPING_TTL 秒内没有刷新时自动过期 (客户端断网、标签页关闭等没有发送 user_stopped_typing 的情况)
+# - 每 TYPING_FLUSH_MS 毫秒把每个房间的变化合并为一条 'typing_update' 事件:
+#     {'room': 房间名, 'typing': [{'user_id', 'nickname'}, ...新开始输入的用户], 'stopped': [user_id, ...]}
+#   同一窗口内开始又停止的用户不通知。事件发给整个房间，客户端自行忽略自己的 user_id。
+#   状态只保存在本 worker 中，事件是增量的，因此多个 worker 各自发送的更新可以直接叠加。
+# - 负载过高 (后台任务调度延迟超过 TYPING_SHED_LAG_MS，或写后队列积压超过 TYPING_SHED_WRITE_BACKLOG) 时
+#   丢弃新的 "开始输入"，只发送 "停止输入"，把 worker 留给聊天消息。
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TypingCoalescer:
+    def __init__(self, message_writer=None):
+        self.message_writer = message_writer
+        self.app = None
+        self.socketio = None
+        self.enabled = False
+        self.ttl = 5.0
+        self.flush_interval = 0.5
+        self.shed_lag = 0.25
+        self.shed_write_backlog = 1000
+        self._lock = threading.Lock()
+        self._active = {} # room -> {user_id: [nickname, expires_at]}
+        self._pending = {} # room -> ({user_id: nickname} 新开始输入, {user_id} 停止输入)
+        self._lag = 0.0 # 最近一次合并任务的调度延迟 (秒)
+        self._stats = {'received': 0, 'debounced': 0, 'expired': 0, 'coalesced': 0, 'updates': 0,
+                       'shed': 0}
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.enabled = app.config.get('TYPING_COALESCE_ENABLED', True)
+        if not self.enabled:
+            return
+        self.ttl = app.config.get('TYPING_TTL', 5)
+        self.flush_interval = app.config.get('TYPING_FLUSH_MS', 500) / 1000.0
+        self.shed_lag = app.config.get('TYPING_SHED_LAG_MS', 250) / 1000.0
+        self.shed_write_backlog = app.config.get('TYPING_SHED_WRITE_BACKLOG', 1000)
+        socketio.start_background_task(self._run)
+        logger.info(f"Typing indicators coalesced every {self.flush_interval * 1000:.0f}ms (ttl={self.ttl}s)")
+
+    def overloaded(self):
+        """本 worker 是否过载: 后台任务调度明显延迟，或待写入的消息积压。"""
+        if self._lag > self.shed_lag:
+            return True
+        return bool(self.message_writer and self.message_writer.enabled
+                    and self.message_writer.queue_depth() > self.shed_write_backlog)
+
+    # ---- 事件 (socket 事件中调用) ----
+
+    def typing(self, user_id, nickname, room):
+        now = time.monotonic()
+        with self._lock:
+            self._stats['received'] += 1
+            users = self._active.get(room)
+            entry = users.get(user_id) if users else None
+            if entry is not None:
+                entry[1] = now + self.ttl # 已在输入: 只刷新过期时间
+                self._stats['debounced'] += 1
+                return
+        if self.overloaded():
+            self._stats['shed'] += 1
+            return
+        with self._lock:
+            self._active.setdefault(room, {})[user_id] = [nickname, now + self.ttl]
+            started, stopped = self._pending.setdefault(room, ({}, set()))
+            started[user_id] = nickname
+            stopped.discard(user_id)
+
+    def stopped(self, user_id, room):
+        if not room:
+            return
+        with self._lock:
+            self._stop(user_id, room)
+
+    def _stop(self, user_id, room):
+        users = self._active.get(room)
+        if not users or users.pop(user_id, None) is None:
+            return
+        if not users:
+            del self._active[room]
+        started, stopped = self._pending.setdefault(room, ({}, set()))
+        if started.pop(user_id, None) is not None:
+            # 同一窗口内开始又停止，不需要通知
+            self._stats['coalesced'] += 1
+            if not started and not stopped:
+                del self._pending[room]
+        else:
+            stopped.add(user_id)
+
+    # ---- 合并发送 ----
+
+    def _expire(self, now):
+        with self._lock:
+            expired = [(room, user_id) for room, users in self._active.items()
+                       for user_id, (_, expires_at) in users.items() if expires_at <= now]
+            for room, user_id in expired:
+                self._stop(user_id, room)
+            self._stats['expired'] += len(expired)
+
+    def flush(self):
+        """发送本窗口内每个房间的输入状态变化，每个房间一条 'typing_update'。"""
+        self._expire(time.monotonic())
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        shed = self.overloaded()
+        for room, (started, stopped) in pending.items():
+            if shed and started:
+                self._stats['shed'] += len(started)
+                self._forget(room, started)
+                started = {}
+            if not started and not stopped:
+                continue
+            self.socketio.emit('typing_update', {
+                'room': room,
+                'typing': [{'user_id': user_id, 'nickname': nickname} for user_id, nickname in started.items()],
+                'stopped': list(stopped),
+            }, room=room)
+            self._stats['updates'] += 1
+
+    def _forget(self, room, user_ids):
+        """丢弃未通知的 "开始输入" 后，同时移出 _active，负载下降后下一次 user_typing 会重新开始而不是被去抖。"""
+        with self._lock:
+            users = self._active.get(room)
+            if not users:
+                return
+            for user_id in user_ids:
+                users.pop(user_id, None)
+            if not users:
+                del self._active[room]
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            time.sleep(self.flush_interval)
+            self._lag = max(time.monotonic() - started - self.flush_interval, 0.0)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Typing indicator flush error: {e}", exc_info=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'enabled': self.enabled, 'active_rooms': len(self._active),
+                          'active_typers': sum(len(users) for users in self._active.values()),
+                          'lag_ms': round(self._lag * 1000, 2), 'overloaded': self.overloaded()})
+        return stats
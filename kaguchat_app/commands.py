@@ -0,0 +1,47 @@
+# kaguchat_app/commands.py
+# Flask CLI 命令 (运行方式: FLASK_APP=run.py flask <command>)
+import click
+
+from .extensions import chat_service, login_service
+
+
+def register_commands(app):
+
+    @app.cli.command('rebuild-conversation-summaries')
+    @click.option('--user-id', 'user_ids', type=int, multiple=True,
+                  help='只重建指定用户的摘要，可重复指定；不指定则重建全部用户。')
+    @click.option('--batch-size', default=500, show_default=True,
+                  help='全量重建时每批处理的用户数 (每批单独提交)。')
+    def rebuild_conversation_summaries_command(user_ids, batch_size):
+        """回填或重建 Conversation_Summaries 会话摘要表。"""
+        if user_ids:
+            rows = chat_service.rebuild_conversation_summaries(list(user_ids))
+            chat_service.db_access.commit()
+        else:
+            def report(last_user_id, total_rows):
+                click.echo(f"  ... rebuilt up to user_id {last_user_id} ({total_rows} rows)")
+            rows = chat_service.rebuild_all_conversation_summaries(batch_size=batch_size, progress_callback=report)
+        click.echo(f"Rebuilt {rows} conversation summary rows.")
+
+    @app.cli.command('backfill-conversation-keys')
+    @click.option('--batch-size', default=5000, show_default=True,
+                  help='每批回填的行数 (每批单独提交)。')
+    @click.option('--pause-ms', default=0, show_default=True,
+                  help='每批之间休眠的毫秒数，用于降低对线上写入的影响。')
+    def backfill_conversation_keys_command(batch_size, pause_ms):
+        """分批回填 Messages.conversation_key (迁移 002 的第 2 步)。"""
+        def report(upto_id, total_updated):
+            click.echo(f"  ... message_id <= {upto_id} ({total_updated} rows updated)")
+        rows = chat_service.backfill_conversation_keys(
+            batch_size=batch_size, pause_seconds=pause_ms / 1000.0, progress_callback=report)
+        click.echo(f"Backfilled conversation_key for {rows} messages.")
+
+    @app.cli.command('hash-legacy-passwords')
+    @click.option('--batch-size', default=500, show_default=True,
+                  help='每批检查的用户数 (每批单独提交)。')
+    def hash_legacy_passwords_command(batch_size):
+        """把 Users 表中仍为明文的密码替换为哈希。"""
+        def report(last_user_id, total_updated):
+            click.echo(f"  ... checked up to user_id {last_user_id} ({total_updated} passwords hashed)")
+        rows = login_service.hash_legacy_passwords(batch_size=batch_size, progress_callback=report)
+        click.echo(f"Hashed {rows} legacy plaintext passwords.")
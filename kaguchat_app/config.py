@@ -26,6 +26,15 @@ class Config:
     SESSION_USE_SIGNER = True
     SESSION_KEY_PREFIX = 'kaguchat:session:' # 可选，但推荐
 
+    # Redis 连接 (缓存、ID 分配等共享状态)
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+    # Socket.IO 多进程/多节点配置
+    # 设置消息队列后，emit 会通过消息队列广播给所有 worker 进程，支持 redis:// (推荐)、amqp://、kafka:// 等
+    # 为空时为单进程模式，emit 只能到达连接在本进程上的客户端
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') # 例如 'redis://localhost:6379/1'
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'kaguchat-socketio') # 同一消息队列上区分不同部署
+
     # JWT 配置
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'your-jwt-secret-key-for-development' # 必须设置
     JWT_TOKEN_LOCATION = ['headers', 'cookies'] # (可选) 定义 Token 的位置
@@ -35,9 +44,103 @@ class Config:
     JWT_CSRF_METHODS = ['POST', 'PUT', 'PATCH', 'DELETE'] # <--- 这是关键修改
     JWT_CSRF_IN_COOKIES = False
     
+    # 认证缓存 (进程内): socket 连接时 token -> 身份信息、user_id -> 用户资料
+    AUTH_TOKEN_CACHE_SIZE = 20000
+    AUTH_TOKEN_CACHE_TTL = 600 # 秒，实际不超过 token 自身的过期时间；未启用 PROFILE_CACHE_REDIS 时也不超过 AUTH_PROFILE_CACHE_TTL
+    AUTH_PROFILE_CACHE_SIZE = 10000
+    # 秒，未启用 PROFILE_CACHE_REDIS 时，其他 worker 进程修改资料后最多延迟这么久生效
+    # (资料缓存、token 身份缓存，以及签发超过该时间的 token 中的资料 claims 都不再直接使用)
+    AUTH_PROFILE_CACHE_TTL = 300
+    # 用户资料缓存的 Redis 层 (见 data/profile_cache.py): 多个 worker 共享资料并通过 pub/sub 同步失效
+    PROFILE_CACHE_REDIS = os.environ.get('PROFILE_CACHE_REDIS', '0') == '1'
+    PROFILE_CACHE_REDIS_TTL = 3600 # 秒
+    # 消息权限索引 (见 data/membership_cache.py): user_id -> 好友 id / 群 id 集合
+    MEMBERSHIP_CACHE_SIZE = 10000
+    MEMBERSHIP_CACHE_TTL = 60 # 秒，未启用 MEMBERSHIP_CACHE_REDIS 时，其他 worker 中删除好友/移出群后最多延迟这么久生效
+    MEMBERSHIP_CACHE_REDIS = os.environ.get('MEMBERSHIP_CACHE_REDIS', '0') == '1'
+    MEMBERSHIP_CACHE_REDIS_TTL = 3600 # 秒
+    MEMBERSHIP_RECHECK_SECONDS = 5 # 检查不通过且缓存条目超过该时间时，从数据库重新加载再判断一次
+
+    # 密码哈希 (见 business/password_hasher.py)
+    # 'thread': OS 线程池 (默认)；'process': 独立进程池；'inline': 在请求线程中直接计算
+    PASSWORD_HASHER_MODE = os.environ.get('PASSWORD_HASHER_MODE', 'thread')
+    PASSWORD_HASHER_WORKERS = int(os.environ.get('PASSWORD_HASHER_WORKERS', 4)) # 同时计算的哈希数 (eventlet 下应不大于 EVENTLET_THREADPOOL_SIZE)
+    PASSWORD_HASHER_MAX_PENDING = 64 # 计算中 + 排队中的上限
+    PASSWORD_HASHER_ACQUIRE_TIMEOUT = 5.0 # 秒，排队超时后登录/注册返回 503
+    PASSWORD_HASH_METHOD = None # 例如 'scrypt' 或 'pbkdf2:sha256:600000'；为 None 时使用 werkzeug 默认算法，与之不同的旧哈希会在登录时升级
+
     # 其他应用配置可以放在这里
     DEBUG = True # 开发时设为True，生产环境设为False
     LOG_LEVEL = 'DEBUG'
+    # 日志 (见 log_config.py): 默认经队列由后台线程写出
+    LOG_ASYNC = True
+    LOG_QUEUE_SIZE = 10000 # 队列满时丢弃新记录而不是阻塞请求线程
+    LOG_FILE = os.environ.get('KAGUCHAT_LOG_FILE') # 为空时只输出到 stderr
+    LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+    LOG_SAMPLE_TYPING = 100 # 输入状态事件每 N 次记录一条 DEBUG 日志
+
+    # 数据库查询统计 (见 data/query_stats.py)
+    QUERY_STATS_ENABLED = True
+    QUERY_SLOW_MS = 100 # 超过该耗时 (毫秒) 的语句记为慢查询
+    QUERY_N_PLUS_ONE_THRESHOLD = 5 # 同一请求/事件内同一形状的 SQL 执行次数达到该值时记为可能的 N+1
+    QUERY_STATS_MAX_SHAPES = 500 # 进程级汇总最多保留的 SQL 形状数
+    QUERY_STATS_SAMPLES = 50 # 保留的慢查询 / N+1 样本数
+    QUERY_STATS_HEADER = None # 是否在响应中添加 X-DB-Stats 头，None 表示只在 DEBUG 模式下添加
+
+    # Prometheus 指标 (见 metrics.py)；多进程时由 run_cluster.py 设置 PROMETHEUS_MULTIPROC_DIR
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    # /metrics 的访问控制 (见 routes/metrics_routes.py):
+    #   配置了 METRICS_AUTH_TOKEN 时只认 Authorization: Bearer <token>；
+    #   否则只允许来自 METRICS_ALLOWED_IPS (IP 或 CIDR，逗号分隔) 且未经反向代理转发的请求。
+    #   默认列表只适用于 worker 直接对外的单进程部署；run_cluster.py 启动的 worker 默认为空列表 (前面有代理)
+    METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get(
+        'METRICS_ALLOWED_IPS', '127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16').split(',') if ip.strip()]
+    METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN') or None
+
+    # 联系人列表的 Redis 缓存 (见 data/contact_cache.py)
+    CONTACT_CACHE_ENABLED = os.environ.get('CONTACT_CACHE_ENABLED', '1') == '1'
+    CONTACT_CACHE_TTL = 6 * 3600 # 秒，长时间不活跃的用户的缓存自动过期
+
+    # 在线状态 (见 business/presence_service.py)，依赖 REDIS_URL，多个 worker 共享
+    PRESENCE_ENABLED = os.environ.get('PRESENCE_ENABLED', '1') == '1'
+    PRESENCE_TTL = 60 # 秒，连接超过该时间没有心跳即视为断开 (worker 崩溃)
+    PRESENCE_HEARTBEAT = 20 # 秒，每个 worker 刷新本进程连接的间隔，应明显小于 PRESENCE_TTL
+    PRESENCE_NOTIFY_WINDOW_MS = 1000 # 上下线通知的合并窗口
+    PRESENCE_QUERY_MAX = 500 # GET /api/chat/presence 每次最多查询的用户数
+
+    # 输入状态的去抖与合并 (见 business/typing_service.py)；关闭时每个事件立即转发给聊天室 (is_typing / is_not_typing)
+    TYPING_COALESCE_ENABLED = os.environ.get('TYPING_COALESCE_ENABLED', '1') == '1'
+    TYPING_TTL = 5 # 秒，没有再收到 user_typing 时自动视为停止输入
+    TYPING_FLUSH_MS = 500 # 每个房间最多每隔这么久发送一条 typing_update
+    TYPING_SHED_LAG_MS = 250 # 后台任务调度延迟超过该值时丢弃新的输入状态
+    TYPING_SHED_WRITE_BACKLOG = 1000 # 写后队列积压超过该条数时丢弃新的输入状态
+
+    # 聊天消息分页配置
+    MESSAGE_PAGE_SIZE = 50 # 默认每页消息数
+    MESSAGE_PAGE_SIZE_MAX = 200 # 客户端可请求的最大每页消息数
+
+    # 管理后台表数据分页
+    ADMIN_TABLE_PAGE_SIZE = 50
+    SCHEMA_CACHE_TTL = 300 # 秒，表结构元数据缓存的有效期 (0 表示只在显式刷新时重新加载)
+    ADMIN_TABLE_PAGE_SIZE_MAX = 500
+    ADMIN_TABLE_EXACT_COUNT_THRESHOLD = 100000 # 估算行数超过该值时 (且无过滤条件) 返回估算总数而非 COUNT(*)
+    ADMIN_EXPORT_CHUNK_SIZE = 1000 # 流式导出时每次从数据库读取并输出的行数
+    ADMIN_IMPORT_CHUNK_SIZE = 500 # 批量导入时每批校验、插入并提交的行数
+    ADMIN_IMPORT_MAX_ROWS = 50000 # 单次导入请求允许的最大行数，更大的数据应拆分或使用命令行脚本
+
+    # 消息 ID 生成 (Snowflake 风格，见 data/id_generator.py)
+    # 每个 worker 进程的节点号必须唯一 (0-63)；不设置时自动在 Redis 中租用一个空闲节点号
+    MESSAGE_ID_NODE_ID = os.environ.get('KAGUCHAT_NODE_ID')
+
+    # 消息写入模式
+    # 'sync': 每条消息同步写入数据库后再广播 (默认)
+    # 'write_behind': 预先分配 message_id 并立即广播，由后台任务批量写入并统一提交 (适合突发的群聊流量)
+    MESSAGE_WRITE_MODE = os.environ.get('MESSAGE_WRITE_MODE', 'sync')
+    MESSAGE_WRITE_BATCH_SIZE = 100 # 每累计 N 条提交一次
+    MESSAGE_WRITE_FLUSH_MS = 50 # 或每 M 毫秒提交一次
+    MESSAGE_WRITE_MAX_RETRIES = 5 # 批量写入失败后的重试次数 (指数退避)
+    MESSAGE_WRITE_RETRY_BACKOFF_MS = 200
+    MESSAGE_WRITE_QUEUE_MAX = 10000 # 队列上限，满了之后回退为同步写入
 
     # 用户头像配置
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static/avatars')
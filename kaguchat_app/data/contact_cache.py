@@ -0,0 +1,260 @@
+# kaguchat_app/data/contact_cache.py
+# 联系人列表 (ChatService.get_contact_list) 的 Redis 缓存，每个用户三个键:
+#   kaguchat:contacts:<user_id>:order  ZSET  成员 "friend:<id>" / "group:<id>"，分数为最后一条消息的时间戳
+#   kaguchat:contacts:<user_id>:items  HASH  成员 -> 摘要 JSON (最后一条消息、时间、message_id；群聊另有群名和头像)
+#   kaguchat:contacts:<user_id>:gen    版本号，每次增量更新或失效时加一
+#   kaguchat:contacts:group:<group_id>  HASH  该群最后一条消息 (message_id、预览、时间)，所有成员共用
+# 好友的昵称和头像不进入缓存，读取时从 profile_cache 批量获取，资料修改不需要使联系人列表失效。
+# - 私聊新消息提交后由 apply_message() 增量更新双方的缓存 (Lua 脚本，只在消息比缓存中的更新时覆盖)
+# - 群聊新消息只由 apply_group_message() 更新群的最后一条消息，读取时覆盖到成员列表中的群条目上，
+#   发送群消息时不需要查询群成员
+# - 好友关系 / 群成员 / 群资料变化后由 invalidate() 删除，下次读取时从 Conversation_Summaries 完整重建
+# - 重建时比较读取数据库之前的版本号，期间发生过更新或失效则放弃写入，避免旧数据覆盖新数据
+# Redis 不可用时所有读取回退到数据库。
+import json
+
+from redis.exceptions import RedisError
+
+import logging
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'kaguchat:contacts:'
+SENTINEL_FIELD = '_' # items 中的占位字段，用于区分 "联系人列表为空" 和 "未缓存"
+
+# KEYS: 每个参与者的 (items, order, gen)；ARGV: message_id, 预览, 时间, 分数, ttl, 然后是每个参与者对应的成员名
+_APPLY_MESSAGE_SCRIPT = """
+local message_id, preview, sent_at, score, ttl = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+for i = 1, #KEYS, 3 do
+    local items, order, gen = KEYS[i], KEYS[i + 1], KEYS[i + 2]
+    local member = ARGV[5 + (i + 2) / 3]
+    redis.call('INCR', gen)
+    redis.call('EXPIRE', gen, ttl)
+    if redis.call('EXISTS', items) == 1 then
+        local raw = redis.call('HGET', items, member)
+        if not raw then
+            -- 缓存中没有该联系人 (例如刚添加的好友)，删除后由下次读取重建
+            redis.call('DEL', items, order)
+        else
+            local entry = cjson.decode(raw)
+            local last = entry['last_message_id']
+            if type(last) ~= 'string' or tonumber(message_id) > tonumber(last) then
+                entry['last_message_id'] = message_id
+                entry['last_message'] = preview
+                entry['last_message_time'] = sent_at
+                redis.call('HSET', items, member, cjson.encode(entry))
+                redis.call('ZADD', order, score, member)
+            end
+        end
+    end
+end
+return 1
+"""
+
+# KEYS: 群的最后一条消息；ARGV: message_id, 预览, 时间, ttl
+_GROUP_LAST_SCRIPT = """
+local last = redis.call('HGET', KEYS[1], 'last_message_id')
+if not last or tonumber(ARGV[1]) > tonumber(last) then
+    redis.call('HSET', KEYS[1], 'last_message_id', ARGV[1], 'last_message', ARGV[2], 'last_message_time', ARGV[3])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# KEYS: items, order, gen；ARGV: 读取前的版本号, ttl, 然后是 (成员, JSON, 分数) 三元组
+_STORE_SCRIPT = """
+if (redis.call('GET', KEYS[3]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[1], '""" + SENTINEL_FIELD + """', '1')
+for i = 3, #ARGV, 3 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    redis.call('ZADD', KEYS[2], ARGV[i + 2], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def _keys(user_id):
+    prefix = f"{KEY_PREFIX}{user_id}:"
+    return prefix + 'items', prefix + 'order', prefix + 'gen'
+
+
+def _group_key(group_id):
+    return f"{KEY_PREFIX}group:{group_id}"
+
+
+def _score(sent_at):
+    return sent_at.timestamp() if sent_at else 0
+
+
+def _format_time(sent_at):
+    return sent_at.strftime('%Y-%m-%dT%H:%M:%S.%f') if sent_at else None
+
+
+class ContactListCache:
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 6 * 3600
+        self._redis_url = None
+        self._scripts = None
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'stale_stores': 0, 'updates': 0,
+                       'invalidations': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CONTACT_CACHE_ENABLED', False)
+        self.ttl = int(app.config.get('CONTACT_CACHE_TTL', 6 * 3600))
+        self._redis_url = app.config.get('REDIS_URL')
+
+    def _redis(self):
+        from .redis_access import get_redis
+        return get_redis(self._redis_url)
+
+    def _script(self, name):
+        if self._scripts is None:
+            redis_client = self._redis()
+            self._scripts = {
+                'apply': redis_client.register_script(_APPLY_MESSAGE_SCRIPT),
+                'store': redis_client.register_script(_STORE_SCRIPT),
+                'group_last': redis_client.register_script(_GROUP_LAST_SCRIPT),
+            }
+        return self._scripts[name]
+
+    def _error(self, action, e):
+        self._stats['errors'] += 1
+        logger.warning(f"Contact list cache {action} failed: {e}")
+
+    def get(self, user_id):
+        """
+        返回 (entries, generation)。命中时 entries 为按最后消息时间倒序的摘要列表，未命中时为 None，
+        generation 用于随后的 store()。
+        摘要格式: {'contact_id', 'type', 'last_message', 'last_message_time', 'last_message_id', ['name', 'avatar_url'] (仅群聊)}
+        """
+        items_key, order_key, gen_key = _keys(user_id)
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            pipe.zrevrange(order_key, 0, -1)
+            pipe.hgetall(items_key)
+            pipe.get(gen_key)
+            members, items, generation = pipe.execute()
+        except RedisError as e:
+            self._error('read', e)
+            return None, None
+        if not items:
+            self._stats['misses'] += 1
+            return None, generation
+        self._stats['hits'] += 1
+        entries = []
+        for member in members:
+            raw = items.get(member)
+            if raw is None:
+                continue
+            entry = json.loads(raw)
+            entry['contact_id'] = int(entry['contact_id'])
+            entries.append(entry)
+        if not self._overlay_group_messages(entries):
+            return None, generation
+        return entries, generation
+
+    def _overlay_group_messages(self, entries):
+        """用各群共用的最后一条消息覆盖群条目 (比条目中的更新时)，并重新排序。读取失败返回 False。"""
+        groups = [entry for entry in entries if entry['type'] == 'group']
+        if not groups:
+            return True
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            for entry in groups:
+                pipe.hgetall(_group_key(entry['contact_id']))
+            latest = pipe.execute()
+        except RedisError as e:
+            self._error('read', e)
+            return False
+        changed = False
+        for entry, last in zip(groups, latest):
+            if not last:
+                continue
+            current = entry.get('last_message_id')
+            if current is None or int(last['last_message_id']) > int(current):
+                entry.update(last_message_id=last['last_message_id'], last_message=last['last_message'],
+                             last_message_time=last['last_message_time'])
+                changed = True
+        if changed:
+            entries.sort(key=lambda entry: entry['last_message_time'] or '', reverse=True)
+        return True
+
+    def store(self, user_id, entries, generation):
+        """写入从数据库读取的完整联系人列表 (entries 中的 last_message_time 为 datetime)。版本号已变化时放弃。"""
+        args = [generation or '', self.ttl]
+        for entry in entries:
+            member = f"{entry['type']}:{entry['contact_id']}"
+            cached = dict(entry, contact_id=str(entry['contact_id']),
+                          last_message_id=str(entry['last_message_id']) if entry.get('last_message_id') is not None else None,
+                          last_message_time=_format_time(entry['last_message_time']))
+            args.extend([member, json.dumps(cached), _score(entry['last_message_time'])])
+        try:
+            stored = self._script('store')(keys=_keys(user_id), args=args)
+        except RedisError as e:
+            self._error('store', e)
+            return
+        self._stats['stores' if stored else 'stale_stores'] += 1
+
+    def apply_group_message(self, message, preview):
+        """群消息提交后更新该群的最后一条消息 (所有成员的联系人列表读取时共用)。"""
+        try:
+            self._script('group_last')(
+                keys=[_group_key(message['group_id'])],
+                args=[str(message['message_id']), preview, _format_time(message['sent_at']), self.ttl])
+            self._stats['updates'] += 1
+        except RedisError as e:
+            self._error('update', e)
+
+    def apply_message(self, user_ids, message, preview):
+        """
+        新消息提交后增量更新各参与者的缓存。
+        私聊时成员名对双方不同 (对方的 user_id)，群聊时都是 group:<group_id> (群消息通常使用 apply_group_message)。
+        """
+        keys, members = [], []
+        for user_id in user_ids:
+            keys.extend(_keys(user_id))
+            if message['group_id'] is not None:
+                members.append(f"group:{message['group_id']}")
+            else:
+                other = message['receiver_id'] if int(user_id) == int(message['sender_id']) else message['sender_id']
+                members.append(f"friend:{other}")
+        if not keys:
+            return
+        args = [str(message['message_id']), preview, _format_time(message['sent_at']), _score(message['sent_at']), self.ttl] + members
+        try:
+            self._script('apply')(keys=keys, args=args)
+            self._stats['updates'] += 1
+        except RedisError as e:
+            self._error('update', e)
+            self.invalidate(user_ids)
+
+    def invalidate(self, user_ids):
+        """删除这些用户的缓存，下次读取时从数据库重建。"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            for user_id in user_ids:
+                items_key, order_key, gen_key = _keys(user_id)
+                pipe.incr(gen_key)
+                pipe.expire(gen_key, self.ttl)
+                pipe.delete(items_key, order_key)
+            pipe.execute()
+            self._stats['invalidations'] += len(user_ids)
+        except RedisError as e:
+            self._error('invalidation', e)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update({'enabled': self.enabled, 'ttl': self.ttl})
+        return stats
+
+
+# 进程级共享的联系人列表缓存，在 create_app 中通过 init_app 配置
+contact_cache = ContactListCache()
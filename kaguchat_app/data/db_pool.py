@@ -0,0 +1,208 @@
+# kaguchat_app/data/db_pool.py
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """在 acquire_timeout 内无法从连接池获取连接时抛出。"""
+    pass
+
+
+class _PooledConnection:
+    """连接池内部使用的包装，记录物理连接的创建时间和最近一次归还时间。"""
+    __slots__ = ('raw', 'created_at', 'last_used_at', 'is_overflow')
+
+    def __init__(self, raw, is_overflow=False):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.is_overflow = is_overflow
+
+
+class ConnectionPool:
+    """
+    线程安全的 MySQL 连接池。
+    - pool_size: 常驻的空闲连接上限
+    - max_overflow: 高峰期允许额外创建的连接数，归还时若空闲连接已满则直接关闭
+    - max_lifetime: 连接最长存活秒数，超过后在获取/归还时回收重建 (0 表示不限制)
+    - pre_ping: 获取连接时先 ping 一次，失效连接会被丢弃并重建
+    - acquire_timeout: 连接全部被占用时的最长等待秒数
+    """
+
+    def __init__(self, db_config, pool_size=10, max_overflow=10, max_lifetime=1800,
+                 pre_ping=True, acquire_timeout=10.0):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1.")
+        if max_overflow < 0:
+            raise ValueError("max_overflow must not be negative.")
+        self.db_config = dict(db_config)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = [] # 空闲连接栈，后进先出，让热连接优先被复用
+        self._in_use = {} # id(raw) -> _PooledConnection
+        self._opening = 0 # 正在建立中的连接数 (建立连接时不持有锁)
+        self._waiting = 0
+        self._cond = threading.Condition(threading.Lock())
+
+        # 统计信息
+        self._created = 0
+        self._recycled = 0
+        self._ping_failures = 0
+        self._timeouts = 0
+        self._acquired_total = 0
+
+    # ---- 内部工具 ----
+    def _total(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.db_config)
+        if not raw.is_connected():
+            raise Error("MySQL connection was created but is not connected.")
+        return raw
+
+    def _is_expired(self, pooled):
+        return bool(self.max_lifetime) and time.monotonic() - pooled.created_at > self.max_lifetime
+
+    def _close_quietly(self, raw):
+        try:
+            raw.close()
+        except Error as e:
+            logger.debug(f"Error closing pooled MySQL connection: {e}")
+
+    def _is_healthy(self, pooled):
+        if self._is_expired(pooled):
+            with self._cond:
+                self._recycled += 1
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            pooled.raw.ping(reconnect=False)
+            return True
+        except Error as e:
+            logger.warning(f"Pooled MySQL connection failed pre-ping, discarding it: {e}")
+            with self._cond:
+                self._ping_failures += 1
+                self._recycled += 1
+            return False
+
+    # ---- 对外接口 ----
+    def acquire(self, timeout=None):
+        """从池中获取一个可用的物理连接。"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            pooled = None
+            with self._cond:
+                while not self._idle and self._total() >= self.pool_size + self.max_overflow:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout}s waiting for a database connection "
+                            f"(in use: {len(self._in_use)}, limit: {self.pool_size + self.max_overflow})."
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._in_use[id(pooled.raw)] = pooled
+                else:
+                    is_overflow = self._total() >= self.pool_size
+                    self._opening += 1
+
+            if pooled is not None:
+                # 在锁外做健康检查，避免 ping 阻塞其他线程
+                if self._is_healthy(pooled):
+                    with self._cond:
+                        self._acquired_total += 1
+                    return pooled.raw
+                self._close_quietly(pooled.raw)
+                with self._cond:
+                    self._in_use.pop(id(pooled.raw), None)
+                    self._cond.notify()
+                continue
+
+            # 新建连接 (在锁外进行，避免握手阻塞其他线程)
+            try:
+                raw = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._created += 1
+                self._acquired_total += 1
+                self._in_use[id(raw)] = _PooledConnection(raw, is_overflow=is_overflow)
+            logger.debug(f"Opened new pooled MySQL connection (overflow={is_overflow}).")
+            return raw
+
+    def release(self, raw, discard=False):
+        """
+        将连接归还给连接池。
+        discard=True 表示连接状态不可信 (例如事务出错)，直接关闭而不复用。
+        """
+        with self._cond:
+            pooled = self._in_use.pop(id(raw), None)
+        if pooled is None:
+            logger.warning("Attempted to release a connection that does not belong to this pool.")
+            self._close_quietly(raw)
+            return
+
+        keep = not discard and not self._is_expired(pooled)
+        if keep:
+            try:
+                keep = raw.is_connected()
+            except Error:
+                keep = False
+
+        with self._cond:
+            if keep and len(self._idle) < self.pool_size:
+                pooled.last_used_at = time.monotonic()
+                self._idle.append(pooled)
+                self._cond.notify()
+                return
+            if not discard and self._is_expired(pooled):
+                self._recycled += 1
+            self._cond.notify()
+        self._close_quietly(raw)
+
+    def close_all(self):
+        """关闭所有空闲连接 (正在使用的连接会在归还时关闭)。"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close_quietly(pooled.raw)
+
+    def stats(self):
+        """返回连接池的统计信息，用于监控。"""
+        with self._cond:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'opening': self._opening,
+                'waiting': self._waiting,
+                'created': self._created,
+                'recycled': self._recycled,
+                'ping_failures': self._ping_failures,
+                'timeouts': self._timeouts,
+                'acquired_total': self._acquired_total,
+            }
@@ -0,0 +1,169 @@
+# kaguchat_app/data/id_generator.py
+# Snowflake 风格的按时间排序的 64 位整数 ID 生成器，用于 Messages.message_id。
+#
+# 位布局 (共 53 位，保证 ID 在 JavaScript Number 中不丢精度，前端可以直接使用):
+#   | 40 位: 自 ID_EPOCH 起的毫秒数 (约 34 年) | 6 位: 节点号 (0-63) | 7 位: 毫秒内序号 (0-127) |
+# 每个节点每毫秒最多 128 个 ID (约 12.8 万/秒)。
+#
+# 节点号来源 (按优先级):
+#   1. 配置 MESSAGE_ID_NODE_ID (环境变量 KAGUCHAT_NODE_ID)，多机部署时每个 worker 必须唯一
+#   2. 在 Redis 中租用一个空闲节点号 (SET NX + 过期时间)，适合 run_cluster.py 等动态启动的 worker
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import logging
+logger = logging.getLogger(__name__)
+
+ID_EPOCH_MS = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+TIMESTAMP_BITS = 40
+NODE_BITS = 6
+SEQUENCE_BITS = 7
+
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+MAX_TIMESTAMP = (1 << TIMESTAMP_BITS) - 1
+NODE_SHIFT = SEQUENCE_BITS
+TIMESTAMP_SHIFT = NODE_BITS + SEQUENCE_BITS
+
+NODE_LEASE_KEY_PREFIX = 'kaguchat:idgen:node:'
+
+
+def parse_id(id_value):
+    """将 ID 拆解为 (生成时间 UTC datetime, 节点号, 序号)，用于排查问题。"""
+    id_value = int(id_value)
+    timestamp_ms = (id_value >> TIMESTAMP_SHIFT) + ID_EPOCH_MS
+    node_id = (id_value >> NODE_SHIFT) & MAX_NODE_ID
+    sequence = id_value & MAX_SEQUENCE
+    return datetime.fromtimestamp(timestamp_ms / 1000.0, tz=timezone.utc), node_id, sequence
+
+
+def compose_id(timestamp_ms, node_id, sequence):
+    """由 Unix 毫秒时间戳、节点号和序号拼出 ID (parse_id 的逆操作)，用于生成带历史时间的测试数据。"""
+    timestamp = int(timestamp_ms) - ID_EPOCH_MS
+    if not 0 <= timestamp <= MAX_TIMESTAMP:
+        raise ValueError(f"timestamp {timestamp_ms} is outside the ID time range")
+    if not 0 <= node_id <= MAX_NODE_ID or not 0 <= sequence <= MAX_SEQUENCE:
+        raise ValueError("node_id or sequence out of range")
+    return (timestamp << TIMESTAMP_SHIFT) | (node_id << NODE_SHIFT) | sequence
+
+
+class SnowflakeIdGenerator:
+    """
+    线程安全的 ID 生成器。
+    - 同一毫秒内序号递增，序号用尽时等待下一毫秒
+    - 时钟小幅回拨 (<= max_backward_ms) 时等待时钟追上
+    - 时钟大幅回拨时沿用上一次的时间戳继续生成 (保证单调递增)，并记录警告
+    """
+
+    def __init__(self, node_id=None, max_backward_ms=10, lease_ttl=60):
+        self.max_backward_ms = max_backward_ms
+        self.lease_ttl = lease_ttl
+        self._node_id = node_id
+        self._redis_url = None
+        self._lease_token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lease_refreshed_at = 0.0
+        self._last_timestamp = -1
+        self._sequence = 0
+        self._clock_behind = False # 是否处于时钟回拨状态 (只在进入时记录一次警告)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        configured = app.config.get('MESSAGE_ID_NODE_ID')
+        if configured is not None and configured != '':
+            self.set_node_id(int(configured))
+        self._redis_url = app.config.get('REDIS_URL')
+
+    def set_node_id(self, node_id):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"node_id must be between 0 and {MAX_NODE_ID}, got {node_id}.")
+        self._node_id = node_id
+        self._lease_token = None # 显式配置的节点号不需要租约
+
+    # ---- 节点号租约 ----
+
+    def _redis(self):
+        from .redis_access import get_redis
+        return get_redis(self._redis_url)
+
+    def _acquire_lease(self):
+        redis_client = self._redis()
+        for candidate in range(MAX_NODE_ID + 1):
+            if redis_client.set(NODE_LEASE_KEY_PREFIX + str(candidate), self._lease_token, nx=True, ex=self.lease_ttl):
+                self._node_id = candidate
+                self._lease_refreshed_at = time.monotonic()
+                logger.info(f"Leased message ID node id {candidate} ({self._lease_token})")
+                return
+        raise RuntimeError(f"No free message ID node id available (all {MAX_NODE_ID + 1} are leased).")
+
+    def _ensure_node_id(self):
+        """必须在持有 self._lock 时调用。"""
+        if self._lease_token is None:
+            return # 显式配置
+        now = time.monotonic()
+        if self._node_id is not None and now - self._lease_refreshed_at < self.lease_ttl / 3:
+            return
+        if self._node_id is not None:
+            key = NODE_LEASE_KEY_PREFIX + str(self._node_id)
+            redis_client = self._redis()
+            if redis_client.get(key) == self._lease_token:
+                redis_client.expire(key, self.lease_ttl)
+                self._lease_refreshed_at = now
+                return
+            logger.warning(f"Lost lease on message ID node id {self._node_id}, acquiring a new one")
+        self._acquire_lease()
+
+    # ---- 生成 ----
+
+    @staticmethod
+    def _current_ms():
+        return int(time.time() * 1000) - ID_EPOCH_MS
+
+    def _wait_until_after(self, timestamp):
+        now = self._current_ms()
+        while now <= timestamp:
+            time.sleep(0.0002)
+            now = self._current_ms()
+        return now
+
+    def next_id(self):
+        with self._lock:
+            self._ensure_node_id()
+            timestamp = self._current_ms()
+            if timestamp < self._last_timestamp:
+                drift = self._last_timestamp - timestamp
+                if drift <= self.max_backward_ms:
+                    timestamp = self._wait_until_after(self._last_timestamp - 1)
+                else:
+                    if not self._clock_behind:
+                        logger.warning(f"System clock moved backwards by {drift}ms; continuing from last ID timestamp")
+                        self._clock_behind = True
+                    timestamp = self._last_timestamp
+            elif self._clock_behind:
+                logger.info("System clock caught up with message ID timestamps")
+                self._clock_behind = False
+
+            if timestamp == self._last_timestamp:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 本毫秒序号用尽
+                    if self._current_ms() < self._last_timestamp:
+                        # 时钟仍落后于逻辑时间，只能向前借用一毫秒
+                        timestamp = self._last_timestamp + 1
+                    else:
+                        timestamp = self._wait_until_after(self._last_timestamp)
+            else:
+                self._sequence = 0
+
+            if timestamp > MAX_TIMESTAMP:
+                raise RuntimeError("Message ID timestamp space exhausted; ID_EPOCH_MS must be moved.")
+            self._last_timestamp = timestamp
+            return (timestamp << TIMESTAMP_SHIFT) | (self._node_id << NODE_SHIFT) | self._sequence
+
+
+# 进程级共享的消息 ID 生成器，在 create_app 中通过 init_app 配置节点号
+message_id_generator = SnowflakeIdGenerator()
@@ -0,0 +1,180 @@
+# kaguchat_app/data/membership_cache.py
+# 消息权限索引: user_id -> (好友 id 集合, 所在群 id 集合)，join_chat / send_message 据此判断能否向某个联系人发消息，
+# 命中缓存时是一次集合查找，不需要每条消息查询 Friends / Group_Members。
+#   L1: 进程内 TTLCache
+#   L2: 可选的 Redis (MEMBERSHIP_CACHE_REDIS = True)，键 kaguchat:membership:<user_id>，多个 worker 共享
+# - socket 连接时用一条查询同时加载好友和群 (get)
+# - Friends / Group_Members 变化 (ChatService.on_contacts_changed、群被删除) 时调用 invalidate():
+#   立即删除 L1/L2，并在事务提交后再删除一次；启用 Redis 时通过 pub/sub 通知其他 worker 删除各自的 L1 条目
+# - 检查不通过时，如果缓存条目已超过 MEMBERSHIP_RECHECK_SECONDS，从数据库重新加载后再判断一次，
+#   避免刚添加的好友/刚入群的用户因为缓存尚未失效而被拒绝
+import json
+import os
+import time
+import uuid
+
+from redis.exceptions import RedisError
+
+from .cache import TTLCache
+from .db_access import DatabaseAccess, run_after_commit
+
+import logging
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'kaguchat:membership:'
+INVALIDATION_CHANNEL = 'kaguchat:membership:invalidate'
+
+
+class Membership:
+    """一个用户的好友和群集合 (只读)。"""
+
+    __slots__ = ('friends', 'groups', 'loaded_at')
+
+    def __init__(self, friends, groups, loaded_at=None):
+        self.friends = frozenset(friends)
+        self.groups = frozenset(groups)
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def allows(self, contact_id, contact_type):
+        if contact_type == 'friend':
+            return contact_id in self.friends
+        if contact_type == 'group':
+            return contact_id in self.groups
+        return False
+
+
+class MembershipIndex:
+    def __init__(self):
+        self.db_access = DatabaseAccess()
+        self.local = TTLCache(maxsize=10000, ttl=60)
+        self.redis_enabled = False
+        self.redis_ttl = 3600
+        self.recheck_seconds = 5
+        self._redis_url = None
+        self._instance_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}" # 忽略自己发出的失效通知
+        self._stats = {'allowed': 0, 'denied': 0, 'rechecks': 0, 'redis_hits': 0, 'redis_errors': 0,
+                       'db_loads': 0, 'invalidations': 0}
+
+    def init_app(self, app, socketio=None):
+        self.local = TTLCache(maxsize=app.config.get('MEMBERSHIP_CACHE_SIZE', 10000),
+                              ttl=app.config.get('MEMBERSHIP_CACHE_TTL', 60))
+        self.redis_enabled = app.config.get('MEMBERSHIP_CACHE_REDIS', False)
+        self.redis_ttl = app.config.get('MEMBERSHIP_CACHE_REDIS_TTL', 3600)
+        self.recheck_seconds = app.config.get('MEMBERSHIP_RECHECK_SECONDS', 5)
+        self._redis_url = app.config.get('REDIS_URL')
+        if self.redis_enabled and socketio is not None:
+            socketio.start_background_task(self._listen_invalidations)
+            logger.info(f"Membership index backed by Redis (ttl={self.redis_ttl}s)")
+
+    def _redis(self):
+        from .redis_access import get_redis
+        return get_redis(self._redis_url)
+
+    # ---- 读取 ----
+
+    def get(self, user_id):
+        """返回用户的 Membership (L1 -> Redis -> 数据库)。"""
+        key = str(user_id)
+        membership = self.local.get(key)
+        if membership is None and self.redis_enabled:
+            membership = self._load_from_redis(key)
+        if membership is None:
+            membership = self._load_from_db(key)
+        return membership
+
+    def can_message(self, user_id, contact_id, contact_type):
+        """user_id 能否向 (contact_type, contact_id) 发送消息: 是其好友 (status = 1) 或是该群成员。"""
+        contact_id = int(contact_id)
+        membership = self.get(user_id)
+        if not membership.allows(contact_id, contact_type) and \
+                time.monotonic() - membership.loaded_at >= self.recheck_seconds:
+            self._stats['rechecks'] += 1
+            membership = self._load_from_db(str(user_id))
+        allowed = membership.allows(contact_id, contact_type)
+        self._stats['allowed' if allowed else 'denied'] += 1
+        return allowed
+
+    def _load_from_redis(self, key):
+        try:
+            value = self._redis().get(REDIS_KEY_PREFIX + key)
+        except RedisError as e:
+            self._stats['redis_errors'] += 1
+            logger.warning(f"Membership index Redis read failed, falling back to database: {e}")
+            return None
+        if value is None:
+            return None
+        data = json.loads(value)
+        membership = Membership(data['friends'], data['groups'])
+        self._stats['redis_hits'] += 1
+        self.local.set(key, membership)
+        return membership
+
+    def _load_from_db(self, key):
+        user_id = int(key)
+        rows = self.db_access.execute_query("""
+            SELECT 'friend' AS kind, friend_id AS id FROM Friends WHERE user_id = %s AND status = 1
+            UNION ALL
+            SELECT 'group' AS kind, group_id AS id FROM Group_Members WHERE user_id = %s
+        """, (user_id, user_id))
+        self._stats['db_loads'] += 1
+        friends = [row['id'] for row in rows if row['kind'] == 'friend']
+        groups = [row['id'] for row in rows if row['kind'] == 'group']
+        membership = Membership(friends, groups)
+        self.local.set(key, membership)
+        if self.redis_enabled:
+            try:
+                self._redis().set(REDIS_KEY_PREFIX + key, json.dumps({'friends': friends, 'groups': groups}),
+                                  ex=self.redis_ttl)
+            except RedisError as e:
+                self._stats['redis_errors'] += 1
+                logger.warning(f"Membership index Redis write failed: {e}")
+        return membership
+
+    # ---- 失效 ----
+
+    def invalidate(self, user_ids):
+        """好友关系或群成员变化后调用: 立即失效，并在当前请求的事务提交后再失效一次。"""
+        keys = list(dict.fromkeys(str(user_id) for user_id in user_ids if user_id is not None))
+        if not keys:
+            return
+        self._invalidate(keys)
+        run_after_commit(lambda: self._invalidate(keys))
+
+    def _invalidate(self, keys):
+        for key in keys:
+            self.local.delete(key)
+        self._stats['invalidations'] += len(keys)
+        if self.redis_enabled:
+            try:
+                redis_client = self._redis()
+                redis_client.delete(*[REDIS_KEY_PREFIX + key for key in keys])
+                redis_client.publish(INVALIDATION_CHANNEL, json.dumps({'user_ids': keys, 'origin': self._instance_id}))
+            except RedisError as e:
+                self._stats['redis_errors'] += 1
+                logger.warning(f"Membership index Redis invalidation failed for user_ids {keys}: {e}")
+
+    def _listen_invalidations(self):
+        """后台任务: 订阅失效通知，删除本进程 L1 中的条目。连接断开后自动重新订阅。"""
+        while True:
+            try:
+                pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    data = json.loads(message['data'])
+                    if data.get('origin') == self._instance_id:
+                        continue
+                    for key in data['user_ids']:
+                        self.local.delete(key)
+            except (RedisError, ValueError) as e:
+                logger.warning(f"Membership invalidation subscriber error, resubscribing: {e}")
+                time.sleep(1.0)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update({'local': self.local.stats(), 'redis_enabled': self.redis_enabled,
+                      'recheck_seconds': self.recheck_seconds})
+        return stats
+
+
+# 进程级共享的消息权限索引，在 create_app 中通过 init_app 配置
+membership_index = MembershipIndex()
@@ -0,0 +1,46 @@
+# kaguchat_app/data/pagination.py
+import base64
+import json
+from datetime import datetime
+
+_DATETIME_TAG = '$dt'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {_DATETIME_TAG: value.strftime('%Y-%m-%dT%H:%M:%S.%f')}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and _DATETIME_TAG in value:
+        return datetime.strptime(value[_DATETIME_TAG], '%Y-%m-%dT%H:%M:%S.%f')
+    return value
+
+
+def encode_cursor(values):
+    """
+    将排序键 (例如 (sent_at, message_id)) 编码为对客户端不透明的游标字符串。
+    """
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, expected_length=None):
+    """
+    解码 encode_cursor 生成的游标，返回排序键元组。
+    游标格式无效时抛出 ValueError。
+    """
+    if not cursor:
+        raise ValueError("Empty cursor.")
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        if not isinstance(raw, list):
+            raise ValueError("Cursor payload must be a list.")
+        values = tuple(_decode_value(v) for v in raw)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if expected_length is not None and len(values) != expected_length:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
@@ -0,0 +1,173 @@
+# kaguchat_app/data/profile_cache.py
+# 用户资料缓存 (user_id -> {user_id, username, nickname, avatar_url})，由登录/认证、联系人列表和 socket 消息共用。
+#   L1: 进程内 TTLCache (LRU + TTL)
+#   L2: 可选的 Redis (PROFILE_CACHE_REDIS = True)，多个 worker 共享，未命中时才查询数据库
+# get_many(user_ids) 依次查 L1、L2 (一次 MGET) 和数据库 (一条 IN 查询)，列表接口一次取得所有资料。
+# 资料被修改 (头像上传、注册、管理后台编辑) 时调用 invalidate():
+#   立即删除 L1/L2 中的条目，并在事务提交后再删除一次 (避免其他进程在提交前读到旧数据并重新缓存)；
+#   启用 Redis 时通过 pub/sub 通知其他 worker 删除各自的 L1 条目。
+import json
+import os
+import time
+import uuid
+
+from redis.exceptions import RedisError
+
+from .cache import TTLCache
+from .db_access import DatabaseAccess, run_after_commit
+
+import logging
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ('user_id', 'username', 'nickname', 'avatar_url')
+REDIS_KEY_PREFIX = 'kaguchat:profile:'
+INVALIDATION_CHANNEL = 'kaguchat:profile:invalidate'
+
+
+class ProfileCache:
+    def __init__(self):
+        self.db_access = DatabaseAccess()
+        self.local = TTLCache(maxsize=10000, ttl=300)
+        self.redis_enabled = False
+        self.redis_ttl = 3600
+        self._redis_url = None
+        self._instance_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}" # 忽略自己发出的失效通知
+        self._listeners = []
+        self._stats = {'redis_hits': 0, 'redis_misses': 0, 'redis_errors': 0, 'db_loads': 0, 'invalidations': 0}
+
+    def init_app(self, app, socketio=None):
+        self.local = TTLCache(maxsize=app.config.get('AUTH_PROFILE_CACHE_SIZE', 10000),
+                              ttl=app.config.get('AUTH_PROFILE_CACHE_TTL', 300))
+        self.redis_enabled = app.config.get('PROFILE_CACHE_REDIS', False)
+        self.redis_ttl = app.config.get('PROFILE_CACHE_REDIS_TTL', 3600)
+        self._redis_url = app.config.get('REDIS_URL')
+        if self.redis_enabled and socketio is not None:
+            # 接收其他 worker 的失效通知
+            socketio.start_background_task(self._listen_invalidations)
+            logger.info(f"Profile cache backed by Redis (ttl={self.redis_ttl}s)")
+
+    def add_invalidation_listener(self, callback):
+        """注册 callback(user_id: str)，本进程或其他 worker 使某个用户资料失效时调用。"""
+        self._listeners.append(callback)
+
+    def _redis(self):
+        from .redis_access import get_redis
+        return get_redis(self._redis_url)
+
+    # ---- 读取 ----
+
+    def get(self, user_id):
+        """返回单个用户资料 (副本)，用户不存在时返回 None。"""
+        return self.get_many([user_id]).get(str(user_id))
+
+    def get_many(self, user_ids):
+        """批量获取用户资料，返回 {str(user_id): 资料副本}，不存在的用户不在结果中。"""
+        keys = list(dict.fromkeys(str(user_id) for user_id in user_ids if user_id is not None))
+        profiles = {}
+        missing = []
+        for key in keys:
+            profile = self.local.get(key)
+            if profile is None:
+                missing.append(key)
+            else:
+                profiles[key] = profile
+        if missing and self.redis_enabled:
+            missing = self._load_from_redis(missing, profiles)
+        if missing:
+            self._load_from_db(missing, profiles)
+        return {key: dict(profile) for key, profile in profiles.items()}
+
+    def _load_from_redis(self, keys, profiles):
+        try:
+            values = self._redis().mget([REDIS_KEY_PREFIX + key for key in keys])
+        except RedisError as e:
+            self._stats['redis_errors'] += 1
+            logger.warning(f"Profile cache Redis read failed, falling back to database: {e}")
+            return keys
+        still_missing = []
+        for key, value in zip(keys, values):
+            if value is None:
+                still_missing.append(key)
+                continue
+            profile = json.loads(value)
+            profiles[key] = profile
+            self.local.set(key, profile)
+        self._stats['redis_hits'] += len(keys) - len(still_missing)
+        self._stats['redis_misses'] += len(still_missing)
+        return still_missing
+
+    def _load_from_db(self, keys, profiles):
+        placeholders = ', '.join(['%s'] * len(keys))
+        rows = self.db_access.execute_query(
+            f"SELECT {', '.join(PROFILE_FIELDS)} FROM Users WHERE user_id IN ({placeholders})",
+            tuple(int(key) for key in keys))
+        self._stats['db_loads'] += 1
+        loaded = {}
+        for row in rows:
+            key = str(row['user_id'])
+            profile = {field: row[field] for field in PROFILE_FIELDS}
+            loaded[key] = profile
+            self.local.set(key, profile)
+        profiles.update(loaded)
+        if loaded and self.redis_enabled:
+            try:
+                pipe = self._redis().pipeline(transaction=False)
+                for key, profile in loaded.items():
+                    pipe.set(REDIS_KEY_PREFIX + key, json.dumps(profile), ex=self.redis_ttl)
+                pipe.execute()
+            except RedisError as e:
+                self._stats['redis_errors'] += 1
+                logger.warning(f"Profile cache Redis write failed: {e}")
+
+    def prime(self, profile):
+        """放入刚从数据库读到的资料 (例如登录时查询的用户记录)，只写入本进程缓存。"""
+        key = str(profile['user_id'])
+        self.local.set(key, {field: profile.get(field) for field in PROFILE_FIELDS})
+
+    # ---- 失效 ----
+
+    def invalidate(self, user_id):
+        """用户资料被修改后调用: 立即失效，并在当前请求的事务提交后再失效一次。"""
+        key = str(user_id)
+        self._invalidate(key)
+        run_after_commit(lambda: self._invalidate(key))
+
+    def _invalidate(self, key):
+        self.local.delete(key)
+        self._stats['invalidations'] += 1
+        if self.redis_enabled:
+            try:
+                redis_client = self._redis()
+                redis_client.delete(REDIS_KEY_PREFIX + key)
+                redis_client.publish(INVALIDATION_CHANNEL, json.dumps({'user_id': key, 'origin': self._instance_id}))
+            except RedisError as e:
+                self._stats['redis_errors'] += 1
+                logger.warning(f"Profile cache Redis invalidation failed for user_id {key}: {e}")
+        for callback in self._listeners:
+            callback(key)
+
+    def _listen_invalidations(self):
+        """后台任务: 订阅失效通知，删除本进程 L1 中的条目。连接断开后自动重新订阅。"""
+        while True:
+            try:
+                pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    data = json.loads(message['data'])
+                    if data.get('origin') == self._instance_id:
+                        continue
+                    self.local.delete(data['user_id'])
+                    for callback in self._listeners:
+                        callback(data['user_id'])
+            except (RedisError, ValueError) as e:
+                logger.warning(f"Profile invalidation subscriber error, resubscribing: {e}")
+                time.sleep(1.0)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update({'local': self.local.stats(), 'redis_enabled': self.redis_enabled})
+        return stats
+
+
+# 进程级共享的用户资料缓存，在 create_app 中通过 init_app 配置
+profile_cache = ProfileCache()
@@ -0,0 +1,225 @@
+# kaguchat_app/data/query_stats.py
+# 数据库查询统计: DatabaseAccess 每执行一条语句都会调用 query_stats.record()。
+# - 每个 HTTP 请求 / Socket.IO 事件 (一个 "scope") 统计查询次数、数据库耗时和每种 SQL 形状的执行次数，
+#   同一 scope 内同一形状执行超过 QUERY_N_PLUS_ONE_THRESHOLD 次时记录为可能的 N+1 查询
+# - 进程级汇总: 按 scope 名 (endpoint / socket 事件) 的累计值、按 SQL 形状的累计值、最近的慢查询和 N+1 样本
+# SQL 形状 (normalize_sql) 把字面量和占位符替换为 ?，并折叠 IN (...) / VALUES (...), (...) 列表，
+# 因此参数不同但结构相同的语句会归为同一类。
+# 结果通过 GET /api/admin/db/queries 查看；DEBUG 模式下每个响应带 X-DB-Stats 头。
+import re
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache, wraps
+
+from flask import g, has_app_context, request
+
+from ..metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w`])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_ROW_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_ROW_IN_LIST = re.compile(r"\bIN\s*\(\s*\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(query):
+    """把 SQL 归一化为形状: 字面量/占位符 -> ?，IN 列表和多行 VALUES 折叠为一项。"""
+    shape = _WHITESPACE.sub(' ', query).strip()
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _ROW_IN_LIST.sub('IN ((?+))', shape)
+    shape = _IN_LIST.sub('IN (?+)', shape)
+    shape = _ROW_LIST.sub('(?+), ...', shape)
+    return shape
+
+
+class QueryScope:
+    """一个请求或 socket 事件内的查询统计。"""
+
+    __slots__ = ('name', 'started', 'queries', 'db_time', 'shapes')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+
+    def repeated(self, threshold):
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+class QueryStats:
+    def __init__(self):
+        self.enabled = True
+        self.slow_query_ms = 100
+        self.n_plus_one_threshold = 5
+        self.max_shapes = 500
+        self.add_header = False
+        self._lock = threading.Lock()
+        self._shapes = {} # shape -> [count, total_time, max_time]
+        self._scopes = {} # scope 名 -> {...}
+        self._slow = deque(maxlen=50)
+        self._n_plus_one = deque(maxlen=50)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('QUERY_STATS_ENABLED', True)
+        self.slow_query_ms = app.config.get('QUERY_SLOW_MS', 100)
+        self.n_plus_one_threshold = app.config.get('QUERY_N_PLUS_ONE_THRESHOLD', 5)
+        self.max_shapes = app.config.get('QUERY_STATS_MAX_SHAPES', 500)
+        samples = app.config.get('QUERY_STATS_SAMPLES', 50)
+        self._slow = deque(maxlen=samples)
+        self._n_plus_one = deque(maxlen=samples)
+        header = app.config.get('QUERY_STATS_HEADER')
+        self.add_header = app.debug if header is None else header
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    # --- scope 生命周期 ---
+
+    def begin(self, name):
+        if self.enabled and has_app_context():
+            g.query_scope = QueryScope(name)
+
+    def finish(self):
+        if not has_app_context():
+            return
+        scope = g.pop('query_scope', None)
+        if scope is None:
+            return
+        elapsed = time.perf_counter() - scope.started
+        repeated = scope.repeated(self.n_plus_one_threshold)
+        for shape, count in repeated.items():
+            logger.warning(f"Possible N+1 in {scope.name}: query executed {count} times: {shape}")
+        logger.debug("%s: %d queries, db %.2fms of %.2fms", scope.name, scope.queries, scope.db_time * 1000, elapsed * 1000)
+        with self._lock:
+            entry = self._scopes.get(scope.name)
+            if entry is None:
+                entry = self._scopes[scope.name] = {
+                    'count': 0, 'queries': 0, 'db_time': 0.0, 'time': 0.0, 'max_queries': 0, 'n_plus_one': 0}
+            entry['count'] += 1
+            entry['queries'] += scope.queries
+            entry['db_time'] += scope.db_time
+            entry['time'] += elapsed
+            entry['max_queries'] = max(entry['max_queries'], scope.queries)
+            if repeated:
+                entry['n_plus_one'] += 1
+                for shape, count in repeated.items():
+                    self._n_plus_one.append({'scope': scope.name, 'sql': shape, 'count': count, 'at': time.time()})
+
+    def track_event(self, name):
+        """装饰 Socket.IO 事件处理函数，使每个事件作为一个 scope 统计 (HTTP 请求通过 init_app 注册的钩子统计)。"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                self.begin(f"socket:{name}")
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.finish()
+            return wrapper
+        return decorator
+
+    def _before_request(self):
+        self.begin(request.endpoint or request.path)
+
+    def _after_request(self, response):
+        scope = g.get('query_scope')
+        if self.add_header and scope is not None:
+            response.headers['X-DB-Stats'] = (
+                f"queries={scope.queries}; time_ms={scope.db_time * 1000:.2f}; "
+                f"repeated={len(scope.repeated(self.n_plus_one_threshold))}")
+        return response
+
+    def _teardown_request(self, e=None):
+        self.finish()
+
+    # --- 记录 ---
+
+    def record(self, query, elapsed):
+        """由 DatabaseAccess 在每条语句执行后调用，elapsed 为秒。"""
+        metrics.observe_db_query(query, elapsed)
+        if not self.enabled:
+            return
+        shape = normalize_sql(query)
+        scope = g.get('query_scope') if has_app_context() else None
+        if scope is not None:
+            scope.queries += 1
+            scope.db_time += elapsed
+            scope.shapes[shape] += 1
+        slow = elapsed * 1000 >= self.slow_query_ms
+        if slow:
+            logger.warning(f"Slow query ({elapsed * 1000:.1f}ms) in {scope.name if scope else 'background'}: {shape}")
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                if len(self._shapes) >= self.max_shapes:
+                    shape = '<other>'
+                entry = self._shapes.setdefault(shape, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+            if slow:
+                self._slow.append({'scope': scope.name if scope else None, 'sql': shape,
+                                   'ms': round(elapsed * 1000, 2), 'at': time.time()})
+
+    # --- 查询结果 ---
+
+    def current(self):
+        """当前请求/事件到目前为止的统计 (不在 scope 中时返回 None)。"""
+        scope = g.get('query_scope') if has_app_context() else None
+        if scope is None:
+            return None
+        return {'scope': scope.name, 'queries': scope.queries, 'db_time_ms': round(scope.db_time * 1000, 2),
+                'repeated': scope.repeated(self.n_plus_one_threshold)}
+
+    def stats(self, top=20):
+        with self._lock:
+            scopes = {
+                name: {
+                    'count': entry['count'],
+                    'queries': entry['queries'],
+                    'avg_queries': round(entry['queries'] / entry['count'], 2),
+                    'max_queries': entry['max_queries'],
+                    'avg_db_ms': round(entry['db_time'] * 1000 / entry['count'], 3),
+                    'db_time_ratio': round(entry['db_time'] / entry['time'], 3) if entry['time'] else None,
+                    'n_plus_one': entry['n_plus_one'],
+                }
+                for name, entry in self._scopes.items()
+            }
+            shapes = sorted(self._shapes.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            return {
+                'enabled': self.enabled,
+                'slow_query_ms': self.slow_query_ms,
+                'n_plus_one_threshold': self.n_plus_one_threshold,
+                'scopes': scopes,
+                'top_queries': [
+                    {'sql': shape, 'count': count, 'total_ms': round(total * 1000, 2),
+                     'avg_ms': round(total * 1000 / count, 3), 'max_ms': round(longest * 1000, 2)}
+                    for shape, (count, total, longest) in shapes
+                ],
+                'slow_queries': list(self._slow),
+                'n_plus_one': list(self._n_plus_one),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._scopes.clear()
+            self._slow.clear()
+            self._n_plus_one.clear()
+
+
+# 进程级共享的查询统计，在 create_app 中通过 init_app 配置
+query_stats = QueryStats()
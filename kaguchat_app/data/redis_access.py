@@ -0,0 +1,24 @@
+# kaguchat_app/data/redis_access.py
+import threading
+
+from redis import Redis
+from flask import current_app
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_redis(url=None):
+    """
+    获取共享的 Redis 客户端 (按 URL 缓存，客户端内部自带连接池，线程安全)。
+    url 为空时使用当前应用配置中的 REDIS_URL。
+    """
+    url = url or current_app.config['REDIS_URL']
+    client = _clients.get(url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url)
+            if client is None:
+                client = Redis.from_url(url, decode_responses=True)
+                _clients[url] = client
+    return client
@@ -0,0 +1,114 @@
+# kaguchat_app/data/schema_cache.py
+# 进程级的表结构元数据缓存 (管理后台使用)。
+# 第一次使用时用一条 information_schema 查询加载所有受管理表的列、类型、可空、默认值、键和外键，
+# 之后的 columns / primary_key 查询都直接读内存，不再每个请求执行 DESCRIBE 和 information_schema 联表查询。
+# 表结构变更 (迁移) 后调用 refresh() 或 POST /api/admin/schema/refresh；
+# 每个 worker 进程各有一份缓存，SCHEMA_CACHE_TTL 秒后也会自动重新加载。
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+# 管理后台可以访问的表 (与 DatabaseAccess 中的 allowed_tables 一致)
+MANAGED_TABLES = ("Users", "Friends", "Groups", "Group_Members", "Messages", "Message_Attachments")
+
+_SCHEMA_QUERY = """
+    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.ORDINAL_POSITION, c.DATA_TYPE, c.COLUMN_TYPE,
+           c.IS_NULLABLE, c.COLUMN_DEFAULT, c.COLUMN_KEY, c.EXTRA,
+           k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME
+    FROM information_schema.COLUMNS AS c
+    LEFT JOIN information_schema.KEY_COLUMN_USAGE AS k
+      ON k.TABLE_SCHEMA = c.TABLE_SCHEMA
+      AND k.TABLE_NAME = c.TABLE_NAME
+      AND k.COLUMN_NAME = c.COLUMN_NAME
+      AND k.REFERENCED_TABLE_NAME IS NOT NULL
+    WHERE c.TABLE_SCHEMA = DATABASE() AND c.TABLE_NAME IN ({placeholders})
+    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+"""
+
+
+class SchemaCache:
+    """
+    表结构元数据缓存。get(db_access, table) 返回:
+      {'columns': [列名, ...], 'primary_key': 列名, 'column_info': {列名: {...}}, 'foreign_keys': {列名: (表, 列)}}
+    column_info 中包含 data_type / column_type / nullable / default / key (PRI/UNI/MUL) / auto_increment / references。
+    """
+
+    def __init__(self, tables=MANAGED_TABLES, ttl=0):
+        self.tables = tuple(tables)
+        self.ttl = ttl # 0 表示不过期，只在 refresh() 后重新加载
+        self._schemas = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._loads = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SCHEMA_CACHE_TTL', 0)
+        self.refresh()
+
+    def refresh(self):
+        """丢弃已加载的元数据，下次访问时重新加载 (表结构变更后调用)。"""
+        with self._lock:
+            self._schemas = None
+        logger.info("Table schema cache invalidated")
+
+    def _expired(self):
+        return self._schemas is None or (self.ttl and time.monotonic() - self._loaded_at > self.ttl)
+
+    def _load(self, db_access):
+        placeholders = ', '.join(['%s'] * len(self.tables))
+        rows = db_access.execute_query(_SCHEMA_QUERY.format(placeholders=placeholders), self.tables)
+        schemas = {}
+        for row in rows or []:
+            schema = schemas.setdefault(row['TABLE_NAME'], {
+                'columns': [], 'primary_key': None, 'column_info': {}, 'foreign_keys': {}})
+            name = row['COLUMN_NAME']
+            if name in schema['column_info']:
+                continue # 同一列参与多个外键时只保留第一个
+            references = (row['REFERENCED_TABLE_NAME'], row['REFERENCED_COLUMN_NAME']) if row['REFERENCED_TABLE_NAME'] else None
+            schema['columns'].append(name)
+            schema['column_info'][name] = {
+                'data_type': row['DATA_TYPE'],
+                'column_type': row['COLUMN_TYPE'],
+                'nullable': row['IS_NULLABLE'] == 'YES',
+                'default': row['COLUMN_DEFAULT'],
+                'key': row['COLUMN_KEY'] or None,
+                'auto_increment': 'auto_increment' in (row['EXTRA'] or ''),
+                'references': references,
+            }
+            if row['COLUMN_KEY'] == 'PRI' and schema['primary_key'] is None:
+                schema['primary_key'] = name
+            if references:
+                schema['foreign_keys'][name] = references
+        return schemas
+
+    def get(self, db_access, table_name_actual):
+        if table_name_actual not in self.tables:
+            raise ValueError(f"Invalid table name: {table_name_actual}")
+        schemas = self._schemas
+        if self._expired():
+            with self._lock:
+                if self._expired():
+                    self._schemas = self._load(db_access)
+                    self._loaded_at = time.monotonic()
+                    self._loads += 1
+                    logger.info(f"Loaded schema metadata for {len(self._schemas)} tables")
+                schemas = self._schemas
+        schema = schemas.get(table_name_actual)
+        if schema is None:
+            raise ValueError(f"Table '{table_name_actual}' does not exist in the current database")
+        return schema
+
+    def stats(self):
+        return {
+            'loaded': self._schemas is not None,
+            'tables': sorted(self._schemas) if self._schemas else [],
+            'loads': self._loads,
+            'age_seconds': round(time.monotonic() - self._loaded_at, 1) if self._schemas is not None else None,
+            'ttl': self.ttl,
+        }
+
+
+# 进程级共享的表结构缓存，在 create_app 中通过 init_app 配置
+schema_cache = SchemaCache()
@@ -1,7 +1,15 @@
 # db_config.py
+import os
+import threading
+import logging
+
 import mysql.connector
 from mysql.connector import Error
 
+from .data.db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'db_admin',       # 替换为您的数据库用户名
@@ -10,6 +18,18 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
+# 连接池配置，可通过环境变量覆盖
+DB_POOL_CONFIG = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),             # 常驻空闲连接数
+    'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),  # 高峰期额外允许的连接数
+    'max_lifetime': int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)), # 连接最长存活秒数，应小于 MySQL 的 wait_timeout
+    'pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'False'), # 取出连接前先 ping 检查
+    'acquire_timeout': float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', 10)), # 获取连接的最长等待秒数
+}
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
 
 def get_db_connection():
     try:
@@ -17,8 +37,18 @@ def get_db_connection():
             **DB_CONFIG
         )
         if connection.is_connected():
-            print("Successfully connected to MySQL database")
+            logger.debug("Successfully connected to MySQL database")
             return connection
     except Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
\ No newline at end of file
+        logger.error("Error connecting to MySQL: %s", e)
+        return None
+
+
+def get_db_pool():
+    """获取进程级共享的连接池 (首次调用时创建)。"""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+    return _db_pool
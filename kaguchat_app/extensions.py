@@ -4,6 +4,10 @@ from flask_jwt_extended import JWTManager
 from .business.chat_service import ChatService
 from .business.table_service import TableService
 from .business.login_service import LoginService
+from .business.message_writer import MessageWriteBehind
+from .business.typing_service import TypingCoalescer
+from .business.password_hasher import password_hasher # 密码哈希执行器 (在线程/进程池中计算)，在 create_app 中配置
+from .business.presence_service import presence_service # 在线状态 (Redis 共享)，在 create_app 中配置
 import logging
 
 # 初始化 SocketIO，但不绑定 app
@@ -13,6 +17,8 @@ socketio = SocketIO(manage_session=True, cors_allowed_origins="*") # 允许所
 chat_service = ChatService() # 可以在这里实例化，或者在 app context 中
 table_service = TableService() 
 login_service = LoginService()
+message_writer = MessageWriteBehind(chat_service) # 写后模式的消息写入管线，在 create_app 中根据配置启用
+typing_service = TypingCoalescer(message_writer) # 输入状态的去抖与按房间合并，过载时优先丢弃
 
 logger = logging.getLogger(__name__)
 jwt = JWTManager()
@@ -0,0 +1,109 @@
+# kaguchat_app/log_config.py
+# 非阻塞日志: 请求线程 / socket 事件中的日志调用只把 LogRecord 放入内存队列 (QueueHandler)，
+# 由后台线程 (QueueListener) 负责格式化并写入真正的 handler (stderr、可选的日志文件)，
+# 避免同步的终端/文件 I/O 计入消息投递延迟。
+# - 队列满时丢弃新记录并计数，而不是阻塞调用方
+# - 记录原样入队，msg % args 的格式化在后台线程中完成，调用方应使用 logger.debug("... %s", value) 的惰性写法
+# - LogSampler 用于对输入状态等高频事件的日志进行采样
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录的 QueueHandler，入队时不做格式化。"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 监听线程在同一进程内，不需要像默认实现那样提前合并 msg % args 以便序列化；
+        # 格式化 (包括异常堆栈) 交给后台线程完成
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """高频事件的日志采样: 同一个 key 每 every 次调用返回一次 True。"""
+
+    def __init__(self, every=100):
+        self.every = max(int(every), 1)
+        self._counters = {}
+
+    def should_log(self, key):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        return next(counter) % self.every == 0 # 不加锁: itertools.count 的 next() 由 GIL 保证原子性
+
+
+# 输入状态 (user_typing / user_stopped_typing) 的日志采样，在 configure_logging 中根据 LOG_SAMPLE_TYPING 配置
+typing_log_sampler = LogSampler()
+
+
+def _build_handlers(app):
+    formatter = logging.Formatter(app.config.get('LOG_FORMAT', '%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+    handlers = [logging.StreamHandler(sys.stderr)]
+    log_file = app.config.get('LOG_FILE')
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=app.config.get('LOG_FILE_MAX_BYTES', 50 * 1024 * 1024),
+            backupCount=app.config.get('LOG_FILE_BACKUPS', 5), encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(app):
+    """
+    配置根 logger: 所有记录先进入队列，由后台 QueueListener 写出。
+    LOG_ASYNC = False 时回退为同步 handler (便于调试)。重复调用 (例如测试中多次 create_app) 时会替换之前的配置。
+    """
+    global _listener
+    level = app.config.get('LOG_LEVEL', 'INFO')
+    typing_log_sampler.every = max(int(app.config.get('LOG_SAMPLE_TYPING', 100)), 1)
+    root = logging.getLogger()
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            if isinstance(handler, NonBlockingQueueHandler):
+                continue
+            handler.close()
+        handlers = _build_handlers(app)
+        if app.config.get('LOG_ASYNC', True):
+            log_queue = queue.Queue(maxsize=app.config.get('LOG_QUEUE_SIZE', 10000))
+            root.addHandler(NonBlockingQueueHandler(log_queue))
+            _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            _listener.start()
+        else:
+            for handler in handlers:
+                root.addHandler(handler)
+        root.setLevel(level)
+
+
+@atexit.register
+def _stop_listener():
+    # 进程退出前把队列中剩余的记录写出
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
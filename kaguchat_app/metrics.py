@@ -0,0 +1,164 @@
+# kaguchat_app/metrics.py
+# Prometheus 指标: HTTP 路由、Socket.IO 事件、在线连接/房间数、数据库往返。
+# 通过 GET /metrics (routes/metrics_routes.py) 以 Prometheus 文本格式输出。
+#
+# 多进程: 设置了环境变量 PROMETHEUS_MULTIPROC_DIR 时 (run_cluster.py 会自动设置)，prometheus_client 以多进程模式运行，
+# 每个 worker 把数值写入该目录下的 mmap 文件，任意一个 worker 的 /metrics 都会输出所有 worker 汇总后的结果；
+# 在线连接数和房间数按 pid 分别输出 (liveall)。该目录必须在启动 worker 之前清空。
+# 未安装 prometheus_client 时指标被禁用，/metrics 返回 503。
+import os
+import time
+from functools import wraps
+
+from flask import g, request
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
+    from prometheus_client import multiprocess
+except ImportError: # pragma: no cover - 可选依赖
+    prometheus_client = None
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 聊天室名的前缀 (与 get_conversation_key 一致)；以 user_id 和 sid 命名的个人房间不计入房间数
+CHAT_ROOM_PREFIXES = ('friend_', 'group_')
+
+# 延迟直方图的桶 (秒)，覆盖从缓存命中到慢查询的范围
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = prometheus_client is not None
+        self.socketio = None
+        if not self.enabled:
+            return
+        self.http_requests = Counter(
+            'kaguchat_http_requests_total', 'HTTP requests by endpoint and status.',
+            ['method', 'endpoint', 'status'])
+        self.http_latency = Histogram(
+            'kaguchat_http_request_duration_seconds', 'HTTP request latency.',
+            ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+        self.socket_events = Counter(
+            'kaguchat_socket_events_total', 'Socket.IO events handled, by outcome (ok / rejected / exception).',
+            ['event', 'outcome'])
+        self.socket_latency = Histogram(
+            'kaguchat_socket_event_duration_seconds', 'Socket.IO event handler latency.',
+            ['event'], buckets=LATENCY_BUCKETS)
+        self.connected_clients = Gauge(
+            'kaguchat_socket_connected_clients', 'Socket.IO clients connected to this worker.',
+            multiprocess_mode='liveall')
+        self.rooms = Gauge(
+            'kaguchat_socket_rooms', 'Chat rooms (friend_/group_ conversations, excluding per-user and per-connection rooms) on this worker.',
+            multiprocess_mode='liveall')
+        self.db_queries = Counter(
+            'kaguchat_db_queries_total', 'Database round-trips by statement type.', ['operation'])
+        self.db_latency = Histogram(
+            'kaguchat_db_query_duration_seconds', 'Database round-trip latency by statement type.',
+            ['operation'], buckets=LATENCY_BUCKETS)
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        if not app.config.get('METRICS_ENABLED', True):
+            self.enabled = False
+        if not self.enabled:
+            if prometheus_client is None:
+                logger.warning("prometheus_client is not installed, /metrics is disabled")
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            logger.info(f"Metrics in multiprocess mode (dir: {os.environ['PROMETHEUS_MULTIPROC_DIR']})")
+
+    # --- HTTP ---
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _observe_request(self, status):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        # 用 endpoint 名而不是路径作为标签，避免路径参数导致标签基数无限增长
+        endpoint = request.endpoint or 'unmatched'
+        self.http_requests.labels(request.method, endpoint, str(status)).inc()
+        self.http_latency.labels(request.method, endpoint).observe(time.perf_counter() - started)
+
+    def _after_request(self, response):
+        self._observe_request(response.status_code)
+        return response
+
+    def _teardown_request(self, e=None):
+        # 未处理的异常不会经过 after_request
+        if e is not None:
+            self._observe_request(500)
+
+    # --- Socket.IO ---
+
+    def track_event(self, name):
+        """装饰 Socket.IO 事件处理函数: 计数、耗时，并维护在线连接数和房间数。"""
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = 'ok'
+                try:
+                    result = fn(*args, **kwargs)
+                    if result is False: # connect 返回 False 表示拒绝连接
+                        outcome = 'rejected'
+                    return result
+                except Exception:
+                    outcome = 'exception'
+                    raise
+                finally:
+                    self.socket_latency.labels(name).observe(time.perf_counter() - started)
+                    self.socket_events.labels(name, outcome).inc()
+                    if name == 'connect' and outcome == 'ok':
+                        self.connected_clients.inc()
+                    elif name == 'disconnect':
+                        self.connected_clients.dec()
+                    if name in ('disconnect', 'join_chat', 'leave_chat'):
+                        self._update_rooms()
+            return wrapper
+        return decorator
+
+    def _update_rooms(self):
+        try:
+            namespace_rooms = self.socketio.server.manager.rooms.get('/', {})
+        except AttributeError:
+            return
+        # 每个连接都有以 sid 命名的房间，connect 时还会加入以 user_id 命名的个人房间，None 房间包含所有连接，都不计入聊天房间
+        self.rooms.set(sum(1 for room in namespace_rooms if isinstance(room, str) and room.startswith(CHAT_ROOM_PREFIXES)))
+
+    # --- 数据库 ---
+
+    def observe_db_query(self, query, elapsed):
+        if not self.enabled:
+            return
+        operation = query.lstrip().split(None, 1)[0].upper() if query.strip() else 'OTHER'
+        if operation not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            operation = 'OTHER'
+        self.db_queries.labels(operation).inc()
+        self.db_latency.labels(operation).observe(elapsed)
+
+    # --- 输出 ---
+
+    def render(self):
+        """返回 (body, content_type)；多进程模式下汇总所有 worker 的数值。"""
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# 进程级共享的指标，在 create_app 中通过 init_app 配置
+metrics = Metrics()
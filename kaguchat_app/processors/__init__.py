@@ -1,9 +1,14 @@
 # kaguchat_app/processors/__init__.py
+import threading
+import logging
 from ..extensions import TABLE_NAME_MAPPING # 实际表名到显示名的映射
 from .users_processor import UsersTableProcessor
 from .messages_processor import MessagesTableProcessor
 from .groups_processor import GroupsTableProcessor
 from .friends_processor import FriendsTableProcessor
+from .group_members_processor import GroupMembersTableProcessor
+
+logger = logging.getLogger(__name__)
 # 为其他表导入相应的处理器
 # from .friends_processor import FriendsTableProcessor
 # from .groups_processor import GroupsTableProcessor
@@ -16,6 +21,7 @@ PROCESSOR_CLASSES = {
     "messages": MessagesTableProcessor,
     "friends": FriendsTableProcessor,
     "groups": GroupsTableProcessor,
+    "group_members": GroupMembersTableProcessor,
 }
 
 # 也可以创建一个通用的处理器，用于那些没有特定逻辑的表
@@ -28,12 +34,27 @@ class GenericTableProcessor(BaseTableProcessor):
     # 它将使用 BaseTableProcessor 的默认验证和准备方法
 
 
+# 处理器不保存请求相关的状态，每个显示名只创建一个实例并在进程内复用
+_PROCESSOR_INSTANCES = {}
+_PROCESSOR_INSTANCES_LOCK = threading.Lock()
+
+
 def get_table_processor(table_name_display_url):
     """
-    工厂函数，根据URL中的表名显示名获取相应的表处理器实例。
+    工厂函数，根据URL中的表名显示名获取相应的表处理器实例 (进程内单例)。
     """
     table_name_key = table_name_display_url.lower()
+    processor = _PROCESSOR_INSTANCES.get(table_name_key)
+    if processor is not None:
+        return processor
+    processor = _create_table_processor(table_name_key)
+    if processor is not None:
+        with _PROCESSOR_INSTANCES_LOCK:
+            processor = _PROCESSOR_INSTANCES.setdefault(table_name_key, processor)
+    return processor
+
 
+def _create_table_processor(table_name_key):
     processor_class = PROCESSOR_CLASSES.get(table_name_key)
 
     if processor_class:
@@ -47,5 +68,5 @@ def get_table_processor(table_name_display_url):
         return GenericTableProcessor(actual_table_name, table_name_key)
 
     # 如果连实际表名都找不到，则该表不受支持
-    print(f"Warning: No processor or actual table name found for display name '{table_name_key}'.")
+    logger.warning("No processor or actual table name found for display name '%s'.", table_name_key)
     return None
\ No newline at end of file
@@ -1,7 +1,22 @@
 # kaguchat_app/processors/base_processor.py
+import unicodedata
 from abc import ABC, abstractmethod
 from ..extensions import table_service # 依赖注入或直接导入
-from ..exceptions import ValidationError, NotFoundError
+from ..exceptions import ValidationError, NotFoundError, InvalidDataError, DuplicateEntryError
+from ..data.pagination import encode_cursor, decode_cursor
+
+# 管理后台表数据查询支持的过滤操作 -> SQL 操作符 (URL 参数形如 f_<列名>__<操作>=<值>)
+FILTER_OPERATIONS = {
+    'eq': '=', 'ne': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=',
+    'like': 'LIKE', # 值中自带 % / _ 通配符
+    'contains': 'LIKE', # 子串匹配，值中的通配符会被转义
+    'isnull': None, # 值为 true/false，对应 IS NULL / IS NOT NULL
+}
+
+def _collation_key(value):
+    """字符串比较键: 去掉重音后 casefold，近似 utf8mb4_0900_ai_ci 的比较规则 ('Alice' == 'alice' == 'Alíce')。"""
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
 
 class BaseTableProcessor(ABC):
     """
@@ -13,21 +28,22 @@ class BaseTableProcessor(ABC):
             raise ValueError("Actual table name and display name must be provided.")
         self.table_name_actual = table_name_actual
         self.table_name_display = table_name_display
-        self._columns = None
-        self._primary_key = None
         self._datetime_fields = self._get_auto_datetime_fields()
 
+    # 处理器实例在进程内复用 (见 get_table_processor)，表结构每次从 schema_cache 读取，刷新缓存后立即生效
+
     @property
     def columns(self):
-        if self._columns is None:
-            self._columns = table_service.get_table_columns(self.table_name_actual)
-        return self._columns
+        return table_service.get_table_schema(self.table_name_actual)['columns']
 
     @property
     def primary_key(self):
-        if self._primary_key is None:
-            self._primary_key = table_service.get_primary_key(self.table_name_actual)
-        return self._primary_key
+        return table_service.get_table_schema(self.table_name_actual)['primary_key']
+
+    @property
+    def column_info(self):
+        """{列名: {data_type, column_type, nullable, default, key, auto_increment, references}}"""
+        return table_service.get_table_schema(self.table_name_actual)['column_info']
 
     def _get_auto_datetime_fields(self):
         """定义哪些字段是数据库自动管理的日期时间字段 (通常不应由用户直接编辑)。"""
@@ -55,9 +71,293 @@ class BaseTableProcessor(ABC):
         return [col for col in self.columns if col != self.primary_key and col not in self._datetime_fields]
 
 
-    def get_all_data(self):
-        """获取表的所有数据用于显示。"""
-        return table_service.get_table_data(self.table_name_actual)
+    def get_sortable_columns(self):
+        """允许排序和过滤的列 (默认为显示的列，子类可以覆盖)。"""
+        return self.get_display_columns()
+
+    def _build_filters(self, filters):
+        """把 [(column, operation, value), ...] 校验并转换为 DatabaseAccess 使用的 [(column, sql_operator, value), ...]。"""
+        allowed_columns = self.get_sortable_columns()
+        sql_filters = []
+        for column, operation, value in filters or []:
+            if column not in allowed_columns:
+                raise InvalidDataError(f"Cannot filter on column '{column}'.", field_name=column)
+            if operation not in FILTER_OPERATIONS:
+                raise InvalidDataError(f"Unsupported filter operation '{operation}'.", field_name=column)
+            if operation == 'isnull':
+                is_null = str(value).lower() in ('1', 'true', 'yes')
+                sql_filters.append((column, 'IS NULL' if is_null else 'IS NOT NULL', None))
+            elif operation == 'contains':
+                escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                sql_filters.append((column, 'LIKE', f"%{escaped}%"))
+            else:
+                sql_filters.append((column, FILTER_OPERATIONS[operation], value))
+        return sql_filters
+
+    def _count_rows(self, sql_filters, count_mode, exact_count_threshold):
+        """返回 (total, is_estimate)。count_mode: 'exact' / 'estimate' / 'auto' / 'none'。"""
+        if count_mode == 'none':
+            return None, False
+        if count_mode == 'exact' or sql_filters:
+            # 带过滤条件时无法估算，只能精确计数
+            return table_service.count_table_rows(self.table_name_actual, filters=sql_filters), False
+        estimate = table_service.estimate_table_rows(self.table_name_actual)
+        if count_mode == 'estimate' and estimate is not None:
+            return estimate, True
+        # auto: 小表精确计数，大表使用估算值，避免对整张大表做 COUNT(*)
+        if estimate is not None and estimate >= exact_count_threshold:
+            return estimate, True
+        return table_service.count_table_rows(self.table_name_actual), False
+
+    def get_all_data(self, limit=50, page=None, cursor=None, sort=None, descending=False,
+                     filters=None, count='auto', exact_count_threshold=100000):
+        """
+        分页获取表数据用于显示，排序、过滤和分页都下推到 SQL。
+        - page: 页码 (从 1 开始，OFFSET 分页，可跳页)
+        - cursor: 上一页返回的 next_cursor (键集分页，只支持按主键排序，适合在大表中连续翻页)
+        - sort / descending: 排序列 (必须在 get_sortable_columns 中) 和方向，主键作为次级排序保证顺序稳定
+        - filters: [(column, operation, value), ...]，operation 见 FILTER_OPERATIONS
+        - count: 'auto' (默认，大表返回估算值) / 'exact' / 'estimate' / 'none'
+        返回 {'data', 'total', 'total_is_estimate', 'page', 'limit', 'next_cursor', 'has_more', 'sort', 'order'}。
+        参数无效时抛出 InvalidDataError。
+        """
+        if not self.primary_key:
+            raise ValueError(f"No primary key defined for table {self.table_name_actual}")
+        sort = sort or self.primary_key
+        if sort != self.primary_key and sort not in self.get_sortable_columns():
+            raise InvalidDataError(f"Cannot sort by column '{sort}'.", field_name=sort)
+        order_by = [sort] if sort == self.primary_key else [sort, self.primary_key]
+        sql_filters = self._build_filters(filters)
+
+        after = None
+        offset = None
+        if cursor:
+            if sort != self.primary_key:
+                raise InvalidDataError("Cursor pagination is only supported when sorting by the primary key.")
+            try:
+                after = decode_cursor(cursor, expected_length=len(order_by))
+            except ValueError:
+                raise InvalidDataError("Invalid cursor.")
+            page = None
+        else:
+            page = page or 1
+            offset = (page - 1) * limit
+
+        # 多取一行判断是否还有下一页
+        rows = table_service.get_table_data(self.table_name_actual, order_by=order_by, limit=limit + 1, offset=offset,
+                                            filters=sql_filters, descending=descending, after=after)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more and sort == self.primary_key:
+            next_cursor = encode_cursor([rows[-1][col] for col in order_by])
+
+        total, total_is_estimate = self._count_rows(sql_filters, count, exact_count_threshold)
+        return {
+            'data': rows,
+            'total': total,
+            'total_is_estimate': total_is_estimate,
+            'page': page,
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'sort': sort,
+            'order': 'desc' if descending else 'asc',
+        }
+
+    def get_export_columns(self):
+        """导出的列 (默认为显示的列，因此 Users 的密码哈希不会被导出)。"""
+        return self.get_display_columns()
+
+    def export_rows(self, filters=None, chunk_size=1000):
+        """
+        按主键顺序流式导出表数据，返回 (列名列表, 每次产生一批行字典的迭代器)。
+        过滤条件与 get_all_data 相同；参数无效时立即抛出 InvalidDataError (在开始输出之前)。
+        """
+        columns = self.get_export_columns()
+        sql_filters = self._build_filters(filters)
+        chunks = table_service.stream_table_rows(self.table_name_actual, columns, order_by=[self.primary_key],
+                                                 filters=sql_filters, chunk_size=chunk_size)
+        return columns, chunks
+
+    # ---- 批量导入 ----
+
+    def get_import_columns(self):
+        """批量导入时允许提供的列: 除主键外的所有列 (与表单不同，允许提供 created_at 等时间列以便回填历史数据)。"""
+        return [col for col in self.columns if col != self.primary_key]
+
+    def _normalize_import_row(self, row, allowed_columns):
+        unknown = [key for key in row if key not in allowed_columns]
+        if unknown:
+            raise InvalidDataError(f"Unknown column(s): {', '.join(unknown)}.", field_name=unknown[0])
+        # 与表单提取逻辑一致: 字符串去掉首尾空白，空字符串视为 None
+        return {
+            key: (value.strip() if isinstance(value, str) else value) if value not in ('', None) else None
+            for key, value in row.items()
+        }
+
+    def _check_required(self, rows, errors, fields):
+        for index, row in enumerate(rows):
+            if index in errors:
+                continue
+            for field in fields:
+                if row.get(field) is None:
+                    errors[index] = InvalidDataError(f"{field} is required.", field_name=field)
+                    break
+
+    def _check_references(self, rows, errors, references):
+        """
+        外键存在性检查，每个被引用的表/列只执行一条 IN 查询。
+        references: [(field, referenced_table, referenced_column), ...]
+        """
+        for field, ref_table, ref_column in references:
+            values = {str(rows[i][field]) for i in range(len(rows)) if i not in errors and rows[i].get(field) is not None}
+            if not values:
+                continue
+            existing = table_service.find_existing_values(ref_table, ref_column, values)
+            for index, row in enumerate(rows):
+                if index not in errors and row.get(field) is not None and str(row[field]) not in existing:
+                    errors[index] = InvalidDataError(
+                        f"{ref_table} record with {ref_column} '{row[field]}' does not exist.", field_name=field)
+
+    def _check_unique(self, rows, errors, fields):
+        """
+        唯一性检查 (单列或多列组合): 先检查本批内部重复，再用一条 IN 查询检查已有数据。
+        按 _collation_key 比较，与数据库的 utf8mb4_0900_ai_ci 排序规则一致 (不区分大小写和重音)。
+        """
+        seen = {} # 比较键 -> (行下标, 原始值)
+        for index, row in enumerate(rows):
+            if index in errors or any(row.get(f) is None for f in fields):
+                continue
+            values = tuple(str(row.get(f)) for f in fields)
+            key = tuple(_collation_key(value) for value in values)
+            if key in seen:
+                errors[index] = DuplicateEntryError(
+                    f"Duplicate {'/'.join(fields)} {'/'.join(values)} (same as row {seen[key][0]} in this batch).",
+                    field_name=fields[0])
+            else:
+                seen[key] = (index, values)
+        if not seen:
+            return
+        if len(fields) == 1:
+            found = [(value,) for value in table_service.find_existing_values(
+                self.table_name_actual, fields[0], [values[0] for _, values in seen.values()])]
+        else:
+            found = table_service.find_existing_values(
+                self.table_name_actual, list(fields), [values for _, values in seen.values()])
+        existing = {tuple(_collation_key(value) for value in values) for values in found}
+        for key, (index, values) in seen.items():
+            if key in existing:
+                errors[index] = DuplicateEntryError(f"{'/'.join(fields)} {'/'.join(values)} already exists.", field_name=fields[0])
+
+    def validate_import_rows(self, rows):
+        """
+        批量校验待导入的行，返回 {行下标: ValidationError}。
+        默认逐行调用 validate_add；有数据库约束检查的子类应覆盖为基于集合的检查 (每批几条 IN 查询，而不是每行几条)。
+        """
+        errors = {}
+        for index, raw_values in enumerate(rows):
+            try:
+                self.validate_add(raw_values, raw_values)
+            except ValidationError as e:
+                errors[index] = e
+        return errors
+
+    def prepare_import_rows(self, rows):
+        """把通过校验的行转换为待插入的值字典列表 (默认逐行调用 prepare_data_for_add)。"""
+        return [self.prepare_data_for_add(raw_values.copy(), raw_values) for raw_values in rows]
+
+    def after_import(self, inserted_rows):
+        """一批行插入并提交后调用 (例如刷新会话摘要)，子类可以覆盖。"""
+        pass
+
+    def _insert_import_rows(self, prepared_rows):
+        """
+        按列集合分组，用 executemany 批量插入。某组整体失败时 (例如并发写入导致唯一键冲突) 逐行重试以定位出错的行。
+        返回 (成功插入的行下标列表, {行下标: 错误信息})。
+        """
+        groups = {}
+        for index, values in enumerate(prepared_rows):
+            groups.setdefault(tuple(values.keys()), []).append(index)
+        inserted, errors = [], {}
+        for columns, indexes in groups.items():
+            rows_values = [tuple(prepared_rows[i][col] for col in columns) for i in indexes]
+            try:
+                table_service.add_records(self.table_name_actual, list(columns), rows_values)
+                inserted.extend(indexes)
+                continue
+            except Exception:
+                pass
+            for index, row_values in zip(indexes, rows_values):
+                try:
+                    table_service.add_records(self.table_name_actual, list(columns), [row_values])
+                    inserted.append(index)
+                except Exception as e:
+                    errors[index] = str(e)
+        return inserted, errors
+
+    def import_rows(self, rows, chunk_size=500, dry_run=False):
+        """
+        批量导入 (JSON 数组或 CSV 的每一行为一个字典)。每 chunk_size 行为一批:
+        基于集合的校验 -> 准备数据 -> executemany 插入 -> 提交 -> after_import。
+        出错的行不影响其他行。dry_run=True 时只校验不写入。
+        返回 {'total', 'inserted', 'valid', 'failed', 'errors': [{'row', 'field', 'message'}], 'dry_run'}，
+        row 为输入中的下标 (从 0 开始)。
+        """
+        allowed_columns = set(self.get_import_columns())
+        error_list = []
+        inserted_total = 0
+        valid_total = 0
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            chunk_errors = {}
+            normalized = {}
+            for offset, row in enumerate(chunk):
+                if not isinstance(row, dict):
+                    chunk_errors[offset] = InvalidDataError("Each row must be an object.")
+                    continue
+                try:
+                    normalized[offset] = self._normalize_import_row(row, allowed_columns)
+                except ValidationError as e:
+                    chunk_errors[offset] = e
+
+            offsets = list(normalized)
+            for index, error in self.validate_import_rows([normalized[o] for o in offsets]).items():
+                chunk_errors[offsets[index]] = error
+            valid_offsets = [o for o in offsets if o not in chunk_errors]
+            valid_total += len(valid_offsets)
+
+            if valid_offsets and not dry_run:
+                try:
+                    prepared = self.prepare_import_rows([normalized[o] for o in valid_offsets])
+                except ValidationError as e:
+                    prepared = []
+                    for o in valid_offsets:
+                        chunk_errors[o] = e
+                inserted_indexes, insert_errors = self._insert_import_rows(prepared)
+                for index, message in insert_errors.items():
+                    chunk_errors[valid_offsets[index]] = InvalidDataError(message)
+                table_service.commit() # 每批单独提交，避免长事务
+                if inserted_indexes:
+                    self.after_import([prepared[i] for i in inserted_indexes])
+                    table_service.commit()
+                inserted_total += len(inserted_indexes)
+
+            for offset, error in sorted(chunk_errors.items()):
+                error_list.append({
+                    'row': start + offset,
+                    'field': getattr(error, 'field_name', None),
+                    'message': getattr(error, 'message', str(error)),
+                })
+
+        return {
+            'total': len(rows),
+            'inserted': inserted_total,
+            'valid': valid_total,
+            'failed': len(error_list),
+            'errors': error_list,
+            'dry_run': dry_run,
+        }
 
     def get_record_by_id(self, record_id):
         """根据主键获取单条记录。"""
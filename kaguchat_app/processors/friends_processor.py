@@ -1,5 +1,6 @@
 # kaguchat_app/processors/groups_processor.py
 from .base_processor import BaseTableProcessor
+from ..extensions import chat_service
 # from ..exceptions import InvalidDataError # 如果需要自定义验证
 
 class FriendsTableProcessor(BaseTableProcessor):
@@ -7,6 +8,37 @@ class FriendsTableProcessor(BaseTableProcessor):
         # "Groups" 是数据库中的实际表名, "groups" 是 URL 和显示中使用的名称
         super().__init__(table_name_actual="Friends", table_name_display="fiends")
 
+    # 好友关系变化会影响 user_id 一方的联系人列表，写入后刷新其会话摘要
+    def process_add(self, form_data):
+        new_record_id = super().process_add(form_data)
+        chat_service.on_contacts_changed([form_data.get('user_id')])
+        return new_record_id
+
+    def process_edit(self, record_id, form_data):
+        current_record = self.get_record_by_id(record_id)
+        result = super().process_edit(record_id, form_data)
+        chat_service.on_contacts_changed([current_record.get('user_id'), form_data.get('user_id')])
+        return result
+
+    def process_delete(self, record_id):
+        current_record = self.get_record_by_id(record_id)
+        result = super().process_delete(record_id)
+        chat_service.on_contacts_changed([current_record.get('user_id')])
+        return result
+
+    def validate_import_rows(self, rows):
+        errors = {}
+        self._check_required(rows, errors, ('user_id', 'friend_id'))
+        self._check_references(rows, errors, [
+            ('user_id', 'Users', 'user_id'),
+            ('friend_id', 'Users', 'user_id'),
+        ])
+        self._check_unique(rows, errors, ('user_id', 'friend_id'))
+        return errors
+
+    def after_import(self, inserted_rows):
+        chat_service.on_contacts_changed([row.get('user_id') for row in inserted_rows])
+
     # 如果 Groups 表有特殊的添加验证逻辑，可以覆盖 validate_add
     # def validate_add(self, raw_values, form_data):
     #     super().validate_add(raw_values, form_data)
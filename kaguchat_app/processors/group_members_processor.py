@@ -0,0 +1,39 @@
+# kaguchat_app/processors/group_members_processor.py
+from .base_processor import BaseTableProcessor
+from ..extensions import chat_service
+
+class GroupMembersTableProcessor(BaseTableProcessor):
+    def __init__(self):
+        # "Group_Members" 是数据库中的实际表名, "group_members" 是 URL 和显示中使用的名称
+        super().__init__(table_name_actual="Group_Members", table_name_display="group_members")
+
+    # 群成员变化会影响该成员的联系人列表，写入后刷新其会话摘要
+    def process_add(self, form_data):
+        new_record_id = super().process_add(form_data)
+        chat_service.on_contacts_changed([form_data.get('user_id')])
+        return new_record_id
+
+    def process_edit(self, record_id, form_data):
+        current_record = self.get_record_by_id(record_id)
+        result = super().process_edit(record_id, form_data)
+        chat_service.on_contacts_changed([current_record.get('user_id'), form_data.get('user_id')])
+        return result
+
+    def process_delete(self, record_id):
+        current_record = self.get_record_by_id(record_id)
+        result = super().process_delete(record_id)
+        chat_service.on_contacts_changed([current_record.get('user_id')])
+        return result
+
+    def validate_import_rows(self, rows):
+        errors = {}
+        self._check_required(rows, errors, ('group_id', 'user_id'))
+        self._check_references(rows, errors, [
+            ('group_id', 'Groups', 'group_id'),
+            ('user_id', 'Users', 'user_id'),
+        ])
+        self._check_unique(rows, errors, ('group_id', 'user_id'))
+        return errors
+
+    def after_import(self, inserted_rows):
+        chat_service.on_contacts_changed([row.get('user_id') for row in inserted_rows])
@@ -1,5 +1,6 @@
 # kaguchat_app/processors/groups_processor.py
 from .base_processor import BaseTableProcessor
+from ..extensions import chat_service
 # from ..exceptions import InvalidDataError # 如果需要自定义验证
 
 class GroupsTableProcessor(BaseTableProcessor):
@@ -7,6 +8,25 @@ class GroupsTableProcessor(BaseTableProcessor):
         # "Groups" 是数据库中的实际表名, "groups" 是 URL 和显示中使用的名称
         super().__init__(table_name_actual="Groups", table_name_display="groups")
 
+    def process_edit(self, record_id, form_data):
+        # 群名和头像缓存在成员的联系人列表中
+        result = super().process_edit(record_id, form_data)
+        chat_service.on_group_changed(record_id)
+        return result
+
+    def process_delete(self, record_id):
+        # 群被删除后，成员会被级联删除，这里同时清理该群在成员会话摘要中的记录
+        result = super().process_delete(record_id)
+        chat_service.remove_group_summaries(record_id)
+        return result
+
+    def validate_import_rows(self, rows):
+        errors = {}
+        self._check_required(rows, errors, ('group_name', 'owner_id'))
+        self._check_references(rows, errors, [('owner_id', 'Users', 'user_id')])
+        self._check_unique(rows, errors, ('group_name',))
+        return errors
+
     # 如果 Groups 表有特殊的添加验证逻辑，可以覆盖 validate_add
     # def validate_add(self, raw_values, form_data):
     #     super().validate_add(raw_values, form_data)
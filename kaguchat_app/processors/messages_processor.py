@@ -1,21 +1,27 @@
 # kaguchat_app/processors/messages_processor.py
 from .base_processor import BaseTableProcessor
-from ..extensions import table_service
+from ..extensions import table_service, chat_service
+from ..business.chat_service import get_conversation_key
+from ..data.id_generator import message_id_generator
 from ..exceptions import InvalidDataError, PermissionDeniedError
 
 class MessagesTableProcessor(BaseTableProcessor):
     def __init__(self):
         super().__init__(table_name_actual="Messages", table_name_display="messages")
 
-    def validate_add(self, raw_values, form_data):
-        super().validate_add(raw_values, form_data)
+    def _validate_message_fields(self, raw_values, allow_default_type=False):
+        """不依赖数据库的字段检查 (表单添加和批量导入共用)。"""
         content = raw_values.get('content')
         sender_id = raw_values.get('sender_id')
         receiver_id = raw_values.get('receiver_id')
         group_id = raw_values.get('group_id')
         message_type = raw_values.get('message_type') # 可能是文本、图片等类型
 
-        if not (message_type in [0, 1, 2]): # 假设 0 是文本，1 是图片，2 是其他类型
+        if message_type is None and allow_default_type:
+            pass # 导入时未提供则由 prepare_data_for_add 设为 0
+        elif isinstance(message_type, str) and message_type.isdigit():
+            raw_values['message_type'] = message_type = int(message_type) # CSV 导入的值都是字符串
+        if not (message_type in [0, 1, 2] or (message_type is None and allow_default_type)): # 假设 0 是文本，1 是图片，2 是其他类型
             raise InvalidDataError("Invalid message type.", field_name='message_type')
 
         if not content:
@@ -25,6 +31,13 @@ class MessagesTableProcessor(BaseTableProcessor):
         if not receiver_id and not group_id: # 私聊或群聊必须有一个
             raise InvalidDataError("Either Receiver ID or Group ID must be provided.", field_name='receiver_id')
 
+    def validate_add(self, raw_values, form_data):
+        super().validate_add(raw_values, form_data)
+        self._validate_message_fields(raw_values)
+        sender_id = raw_values.get('sender_id')
+        receiver_id = raw_values.get('receiver_id')
+        group_id = raw_values.get('group_id')
+
         # 进一步验证: sender_id, receiver_id, group_id 是否存在于各自的表中
         if sender_id and not table_service.record_exists("Users", { "user_id": sender_id }):
             raise InvalidDataError(f"Sender with ID '{sender_id}' does not exist.", field_name='sender_id')
@@ -39,8 +52,43 @@ class MessagesTableProcessor(BaseTableProcessor):
         if 'message_type' not in prepared or prepared['message_type'] is None:
             prepared['message_type'] = 0 # 例如，0 代表文本消息
         # sent_at 通常由数据库的 NOW() 或 DEFAULT CURRENT_TIMESTAMP 处理，不需要在这里设置
+        # message_id 与聊天消息使用同一个按时间排序的生成器，保证会话摘要按 ID 比较新旧时仍然正确
+        prepared['message_id'] = message_id_generator.next_id()
+        # conversation_key 由收发双方或群ID推导，不由管理员手动填写
+        if prepared.get('group_id'):
+            prepared['conversation_key'] = get_conversation_key(prepared.get('sender_id'), prepared['group_id'], 'group')
+        else:
+            prepared['conversation_key'] = get_conversation_key(prepared.get('sender_id'), prepared.get('receiver_id'), 'friend')
         return prepared
 
+    def get_import_columns(self):
+        return [col for col in super().get_import_columns() if col != 'conversation_key']
+
+    def validate_import_rows(self, rows):
+        """字段检查逐行进行，发送者/接收者/群的存在性每批各一条 IN 查询。"""
+        errors = {}
+        for index, raw_values in enumerate(rows):
+            try:
+                self._validate_message_fields(raw_values, allow_default_type=True)
+            except InvalidDataError as e:
+                errors[index] = e
+        self._check_references(rows, errors, [
+            ('sender_id', 'Users', 'user_id'),
+            ('receiver_id', 'Users', 'user_id'),
+            ('group_id', 'Groups', 'group_id'),
+        ])
+        return errors
+
+    def after_import(self, inserted_rows):
+        chat_service.on_messages_imported(inserted_rows)
+
+    def get_form_fields_add(self):
+        """conversation_key 是派生列，不出现在表单中。"""
+        return [col for col in super().get_form_fields_add() if col != 'conversation_key']
+
+    def get_form_fields_edit(self, record):
+        return [col for col in super().get_form_fields_edit(record) if col != 'conversation_key']
+
     # 对于 Messages 表，编辑和删除可能通常不被允许或有非常严格的规则
     # 这里可以覆盖 validate_edit, prepare_data_for_edit, validate_delete 来禁止或限制操作
 
@@ -1,7 +1,6 @@
 # kaguchat_app/processors/users_processor.py
-from werkzeug.security import generate_password_hash
 from .base_processor import BaseTableProcessor
-from ..extensions import table_service # 依赖注入或直接导入
+from ..extensions import table_service, login_service, password_hasher # 依赖注入或直接导入
 from ..exceptions import InvalidDataError, DuplicateEntryError
 
 class UsersTableProcessor(BaseTableProcessor):
@@ -43,7 +42,7 @@ class UsersTableProcessor(BaseTableProcessor):
         """哈希密码，并准备其他字段。"""
         prepared = raw_values.copy()
         if prepared.get('password'):
-            prepared['password'] = generate_password_hash(prepared['password'])
+            prepared['password'] = password_hasher.hash(prepared['password'])
         else:
             # validate_add 应该已经捕获了密码为空的情况
             # 如果出于某种原因密码仍然是 None 或空，这里可以抛出错误或设置默认（不推荐）
@@ -54,6 +53,19 @@ class UsersTableProcessor(BaseTableProcessor):
         # 如果有默认值逻辑，可以在这里添加
         return prepared
 
+    def validate_import_rows(self, rows):
+        """用户名和手机号的唯一性在本批内部和已有数据中各检查一次 (每批两条 IN 查询)。"""
+        errors = {}
+        self._check_required(rows, errors, ('username', 'password', 'phone'))
+        self._check_unique(rows, errors, ('username',))
+        self._check_unique(rows, errors, ('phone',))
+        return errors
+
+    def prepare_import_rows(self, rows):
+        """整批密码在哈希线程/进程池中并行计算，而不是逐行排队。"""
+        hashed = password_hasher.hash_many([row['password'] for row in rows])
+        return [dict(row, password=password_hash) for row, password_hash in zip(rows, hashed)]
+
     def validate_edit(self, record_id, raw_values_from_form, current_record_dict, form_data):
         super().validate_edit(record_id, raw_values_from_form, current_record_dict, form_data)
         self._validate_common_user_fields(raw_values_from_form, is_edit=True, record_id=record_id)
@@ -67,7 +79,7 @@ class UsersTableProcessor(BaseTableProcessor):
 
             if key == 'password':
                 if new_value: # 用户输入了新密码
-                    hashed_new_password = generate_password_hash(new_value)
+                    hashed_new_password = password_hasher.hash(new_value)
                     # 只有当新哈希与旧哈希不同时才更新 (虽然通常直接更新也可以)
                     # Werkzeug 的 check_password_hash 不能用来比较两个哈希，所以直接更新
                     update_payload[key] = hashed_new_password
@@ -77,6 +89,17 @@ class UsersTableProcessor(BaseTableProcessor):
 
         return update_payload
 
+    # 管理员修改或删除用户后，使缓存的用户资料和 token 身份信息失效
+    def process_edit(self, record_id, form_data):
+        result = super().process_edit(record_id, form_data)
+        login_service.invalidate_profile(record_id)
+        return result
+
+    def process_delete(self, record_id):
+        result = super().process_delete(record_id)
+        login_service.invalidate_profile(record_id)
+        return result
+
     def get_display_columns(self):
         """从admin视图中排除密码列的直接显示。"""
         cols = super().get_display_columns()
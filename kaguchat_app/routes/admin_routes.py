@@ -1,13 +1,19 @@
 # kaguchat_app/routes/admin_api_routes.py (新文件或修改 admin_routes.py)
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity # 假设你使用 JWT 进行 API 认证
 from ..processors import get_table_processor
 from ..exceptions import (
     ValidationError, PermissionDeniedError, NotFoundError,
     DuplicateEntryError, InvalidDataError, IntegrityError
 )
-from ..extensions import logger # 假设 TABLE_NAME_MAPPING 在 extensions.py
+from ..extensions import logger, table_service, login_service, chat_service, password_hasher, message_writer, presence_service, typing_service # 假设 TABLE_NAME_MAPPING 在 extensions.py
 from functools import wraps
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
 # 如果这是一个新文件，创建一个新的蓝图
 # admin_bp = Blueprint('admin_bp', __name__, url_prefix="/api/admin")
@@ -56,6 +62,102 @@ def get_admin_tables_config():
     return jsonify(tables=tables_for_frontend), 200
 
 
+@admin_bp.route('/db/pool', methods=['GET'])
+@api_admin_required
+def get_db_pool_stats_api():
+    """
+    返回数据库连接池的统计信息，用于监控。
+    包括 in_use / idle / waiting / created / recycled / timeouts 等。
+    """
+    return jsonify(pool=table_service.get_db_pool_stats()), 200
+
+
+@admin_bp.route('/db/queries', methods=['GET'])
+@api_admin_required
+def get_query_stats_api():
+    """
+    返回本进程的数据库查询统计: 按 endpoint / socket 事件的平均查询次数和数据库耗时、
+    累计耗时最高的 SQL 形状 (?top=N)、最近的慢查询和可能的 N+1 查询样本。
+    """
+    try:
+        top = min(max(int(request.args.get('top', 20)), 1), 200)
+    except ValueError:
+        return jsonify(msg="Invalid top"), 400
+    return jsonify(queries=table_service.get_query_stats(top=top)), 200
+
+
+@admin_bp.route('/db/queries/reset', methods=['POST'])
+@api_admin_required
+def reset_query_stats_api():
+    """清空本进程的查询统计 (例如在压测前)。"""
+    table_service.reset_query_stats()
+    return jsonify(msg="Query stats reset"), 200
+
+
+@admin_bp.route('/message_writer', methods=['GET'])
+@api_admin_required
+def get_message_writer_stats_api():
+    """返回写后消息写入管线的状态 (队列深度、已写入/失败/重试次数等)。"""
+    return jsonify(message_writer=message_writer.stats()), 200
+
+
+@admin_bp.route('/auth/cache', methods=['GET'])
+@api_admin_required
+def get_auth_cache_stats_api():
+    """返回本进程 token 身份缓存和用户资料缓存的命中率等统计信息。"""
+    return jsonify(auth_cache=login_service.cache_stats()), 200
+
+
+@admin_bp.route('/chat/contact_cache', methods=['GET'])
+@api_admin_required
+def get_contact_cache_stats_api():
+    """返回 Redis 联系人列表缓存的命中率、增量更新和失效次数 (本进程)。"""
+    return jsonify(contact_cache=chat_service.get_contact_cache_stats()), 200
+
+
+@admin_bp.route('/chat/membership', methods=['GET'])
+@api_admin_required
+def get_membership_stats_api():
+    """返回消息权限索引的命中、拒绝、重新检查和失效次数 (本进程)。"""
+    return jsonify(membership=chat_service.get_membership_stats()), 200
+
+
+@admin_bp.route('/presence', methods=['GET'])
+@api_admin_required
+def get_presence_stats_api():
+    """返回在线状态服务的统计 (本进程的连接数、上下线次数、合并掉的通知、发送的通知数)。"""
+    return jsonify(presence=presence_service.stats()), 200
+
+
+@admin_bp.route('/typing', methods=['GET'])
+@api_admin_required
+def get_typing_stats_api():
+    """返回输入状态合并的统计 (去抖、过期、合并、丢弃次数和当前调度延迟)。"""
+    return jsonify(typing=typing_service.stats()), 200
+
+
+@admin_bp.route('/password_hasher', methods=['GET'])
+@api_admin_required
+def get_password_hasher_stats_api():
+    """返回密码哈希执行器的状态 (执行中任务数、排队时间、拒绝次数等)。"""
+    return jsonify(password_hasher=password_hasher.stats()), 200
+
+
+@admin_bp.route('/schema/cache', methods=['GET'])
+@api_admin_required
+def get_schema_cache_stats_api():
+    """返回本进程表结构元数据缓存的状态。"""
+    return jsonify(schema_cache=table_service.get_schema_cache_stats()), 200
+
+
+@admin_bp.route('/schema/refresh', methods=['POST'])
+@api_admin_required
+def refresh_schema_cache_api():
+    """表结构变更 (迁移) 后重新加载本进程的元数据缓存；其他 worker 进程在 SCHEMA_CACHE_TTL 内自动刷新。"""
+    table_service.refresh_schema_cache()
+    return jsonify(msg="Schema cache refreshed"), 200
+
+
 @admin_bp.route('/table/<table_name_display>/schema', methods=['GET'])
 @api_admin_required
 def get_table_schema_api(table_name_display):
@@ -73,18 +175,21 @@ def get_table_schema_api(table_name_display):
         # 这里是一个简化的示例，你需要充实它
         all_columns_details = []
         db_cols = processor.columns # 原始数据库列名
+        column_info = processor.column_info # 来自表结构缓存的类型、可空、默认值、外键信息
         form_add_fields = processor.get_form_fields_add()
         # 理想情况下，get_form_fields_edit 应该返回字段名列表，而不是 HTML
         # 或者，你需要一个新的方法来获取编辑字段的定义
 
         for col_name in db_cols:
-            # 这里需要更智能的逻辑来确定类型、标签等
-            # 例如，从数据库元数据或预定义配置中获取
+            info = column_info.get(col_name, {})
             field_info = {
                 "name": col_name,
                 "label": col_name.replace('_', ' ').title(), # 简单的标签生成
-                "type": "text", # 需要根据实际列类型推断 (varchar, int, bool, date, etc.)
-                "required": False, # 需要根据数据库约束或业务逻辑确定
+                "type": "text", # 下面根据列名推断前端控件类型
+                "dataType": info.get('column_type'),
+                # 不可空、没有默认值且不是自增列时必填
+                "required": bool(info) and not info['nullable'] and info['default'] is None and not info['auto_increment'],
+                "references": dict(zip(('table', 'column'), info['references'])) if info.get('references') else None,
                 "editable": col_name not in [processor.primary_key] + processor._datetime_fields, # 简单示例
                 "isPrimaryKey": col_name == processor.primary_key,
                 "autoGenerated": col_name in processor._datetime_fields
@@ -130,19 +235,180 @@ def get_table_schema_api(table_name_display):
         return jsonify(msg=f"Error fetching schema: {str(e)}"), 500
 
 
+def _parse_filter_args(args):
+    """解析 f_<列名>=<值> / f_<列名>__<操作>=<值> 形式的过滤参数。"""
+    filters = []
+    for key, value in args.items(multi=True):
+        if not key.startswith('f_'):
+            continue
+        column, _, operation = key[2:].partition('__')
+        filters.append((column, operation or 'eq', value))
+    return filters
+
+
+def _export_value(value):
+    """把数据库返回的值转换为可写入 JSON / CSV 的值。"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    return value
+
+
+def _iter_ndjson(columns, chunks):
+    try:
+        for rows in chunks:
+            yield ''.join(
+                json.dumps({col: _export_value(row[col]) for col in columns}, ensure_ascii=False) + '\n'
+                for row in rows)
+    finally:
+        chunks.close() # 客户端断开时立即关闭数据库游标 (取消查询)，不等待垃圾回收
+
+
+def _iter_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    try:
+        for rows in chunks:
+            for row in rows:
+                writer.writerow(['' if row[col] is None else _export_value(row[col]) for col in columns])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    finally:
+        chunks.close()
+    if buffer.tell(): # 空表时只输出表头
+        yield buffer.getvalue()
+
+
+@admin_bp.route('/table/<table_name_display>/export', methods=['GET'])
+@api_admin_required
+def export_table_api(table_name_display):
+    """
+    流式导出整张表 (或过滤后的结果)，按主键排序。查询参数:
+      format=ndjson (默认) / csv，以及与数据接口相同的 f_<列名>[__<操作>] 过滤参数
+    数据通过服务端非缓冲游标分批读取并边读边写，内存占用不随表大小增长；
+    客户端断开连接时会取消数据库中仍在执行的查询。
+    """
+    processor = get_table_processor(table_name_display)
+    if not processor:
+        return jsonify(msg=f"Table '{table_name_display}' not found or not managed."), 404
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify(msg="Invalid format, expected 'ndjson' or 'csv'"), 400
+
+    try:
+        columns, chunks = processor.export_rows(
+            filters=_parse_filter_args(request.args),
+            chunk_size=current_app.config.get('ADMIN_EXPORT_CHUNK_SIZE', 1000))
+    except (ValidationError, InvalidDataError) as e:
+        return jsonify(msg=str(e), field_name=getattr(e, 'field_name', None)), 400
+    except Exception as e:
+        logger.error(f"Error preparing export for table '{table_name_display}': {str(e)}", exc_info=True)
+        return jsonify(msg=f"Error exporting table: {str(e)}"), 500
+
+    if export_format == 'csv':
+        body, mimetype = _iter_csv(columns, chunks), 'text/csv; charset=utf-8'
+    else:
+        body, mimetype = _iter_ndjson(columns, chunks), 'application/x-ndjson; charset=utf-8'
+    filename = f"{processor.table_name_actual}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{export_format}"
+    logger.info(f"Streaming {export_format} export of table '{processor.table_name_actual}'")
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no', # 禁止 nginx 缓冲整个响应
+        'Cache-Control': 'no-store',
+    })
+
+
+def _read_import_rows():
+    """从请求中读取待导入的行: JSON 数组、{"rows": [...]}，或 multipart 上传的 CSV 文件 (字段名 file，首行为列名)。"""
+    upload = request.files.get('file')
+    if upload is not None:
+        text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        return list(csv.DictReader(text))
+    json_data = request.get_json(silent=True)
+    if isinstance(json_data, dict):
+        json_data = json_data.get('rows')
+    return json_data if isinstance(json_data, list) else None
+
+
+@admin_bp.route('/table/<table_name_display>/import', methods=['POST'])
+@api_admin_required
+def import_table_api(table_name_display):
+    """
+    批量导入记录。请求体为 JSON 数组 (每个元素一行) 或上传的 CSV 文件；dry_run=1 时只校验不写入。
+    每 ADMIN_IMPORT_CHUNK_SIZE 行为一批: 约束检查用每批几条 IN 查询完成，插入用 executemany，每批单独提交。
+    出错的行不会影响其他行，返回每行的错误信息 (row 为输入中的下标，从 0 开始)。
+    """
+    processor = get_table_processor(table_name_display)
+    if not processor:
+        return jsonify(msg=f"Table '{table_name_display}' not found or not managed."), 404
+    try:
+        rows = _read_import_rows()
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify(msg=f"Invalid CSV file: {str(e)}"), 400
+    if rows is None:
+        return jsonify(msg="Expected a JSON array of rows or a CSV file upload"), 400
+    max_rows = current_app.config.get('ADMIN_IMPORT_MAX_ROWS', 50000)
+    if len(rows) > max_rows:
+        return jsonify(msg=f"Too many rows ({len(rows)}), at most {max_rows} per request"), 413
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        result = processor.import_rows(
+            rows, chunk_size=current_app.config.get('ADMIN_IMPORT_CHUNK_SIZE', 500), dry_run=dry_run)
+    except Exception as e:
+        logger.error(f"Error importing into table '{table_name_display}': {str(e)}", exc_info=True)
+        return jsonify(msg=f"Error importing records: {str(e)}"), 500
+    logger.info(f"Imported {result['inserted']}/{result['total']} rows into '{processor.table_name_actual}' "
+                f"({result['failed']} failed, dry_run={dry_run})")
+    return jsonify(**result), 200
+
+
 @admin_bp.route('/table/<table_name_display>/data', methods=['GET'])
 @api_admin_required
 def get_table_data_api(table_name_display):
     """
     对应前端 getTableData()
-    获取指定表的所有数据记录。
+    分页获取指定表的数据记录。查询参数:
+      page / limit          页码分页 (page 从 1 开始)
+      cursor                键集分页，传入上一页的 next_cursor (仅按主键排序时)
+      sort / order          排序列和方向 (asc / desc)
+      count                 auto (默认) / exact / estimate / none
+      f_<列名>=<值>          等值过滤；f_<列名>__<操作>=<值>，操作为 eq/ne/gt/gte/lt/lte/like/contains/isnull
     """
     processor = get_table_processor(table_name_display)
     if not processor:
         return jsonify(msg=f"Table '{table_name_display}' not found or not managed."), 404
     try:
-        data = processor.get_all_data() # 应该返回字典列表
-        return jsonify(data=data, primary_key=processor.primary_key), 200
+        limit = int(request.args.get('limit', current_app.config.get('ADMIN_TABLE_PAGE_SIZE', 50)))
+        page = request.args.get('page', type=int)
+    except ValueError:
+        return jsonify(msg="Invalid limit"), 400
+    limit = max(1, min(limit, current_app.config.get('ADMIN_TABLE_PAGE_SIZE_MAX', 500)))
+    if page is not None and page < 1:
+        return jsonify(msg="Invalid page"), 400
+    order = request.args.get('order', 'asc').lower()
+    count = request.args.get('count', 'auto').lower()
+    if order not in ('asc', 'desc') or count not in ('auto', 'exact', 'estimate', 'none'):
+        return jsonify(msg="Invalid order or count parameter"), 400
+
+    filters = _parse_filter_args(request.args)
+
+    try:
+        result = processor.get_all_data(
+            limit=limit, page=page, cursor=request.args.get('cursor'),
+            sort=request.args.get('sort'), descending=order == 'desc', filters=filters, count=count,
+            exact_count_threshold=current_app.config.get('ADMIN_TABLE_EXACT_COUNT_THRESHOLD', 100000))
+        return jsonify(primary_key=processor.primary_key, **result), 200
+    except (ValidationError, InvalidDataError) as e:
+        logger.warning(f"Invalid data query for table '{table_name_display}': {str(e)}")
+        return jsonify(msg=str(e), field_name=getattr(e, 'field_name', None)), 400
     except Exception as e:
         logger.error(f"Error fetching data for table '{table_name_display}': {str(e)}", exc_info=True)
         return jsonify(msg=f"Error fetching data: {str(e)}"), 500
@@ -2,6 +2,7 @@
 from flask import Blueprint, request, session, jsonify
 from flask_jwt_extended import create_access_token, unset_jwt_cookies, jwt_required, get_jwt_identity,decode_token
 from ..extensions import login_service, chat_service, logger # 使用 .. 从父目录导入
+from ..business.password_hasher import PasswordHasherBusyError
 import json, uuid, os
 from werkzeug.utils import secure_filename
 from flask import current_app
@@ -24,19 +25,22 @@ def login_api():
     if not username or not password:
         return jsonify({"msg" : "Missing username or password"}), 400
     
-    user_id = login_service.authenticate_user(username, password)
+    try:
+        user_id = login_service.authenticate_user(username, password)
+    except PasswordHasherBusyError:
+        logger.warning(f"Login rejected for username : {username} - password hasher busy")
+        return jsonify({"msg": "Server busy, please retry"}), 503
     if not user_id:
         logger.debug(f"Login failed for username : {username} - User not found")
         return jsonify({"msg" : "Bad username or password"}), 401
     
     user_id = str(user_id)
-    access_token = create_access_token(identity=user_id)
-    logger.debug(f"Login successful for user_id : {user_id}, username : {username}")
+    # 把用户资料写入 token，socket 连接时无需再查询数据库
+    access_token = create_access_token(identity=user_id, additional_claims=login_service.get_token_claims(user_id))
+    logger.debug("Login successful for user_id : %s, username : %s", user_id, username)
 
     decoded_token_payload = decode_token(access_token)
     csrf_token_value = decoded_token_payload.get('csrf')
-    print(f"Decoded token payload: {decoded_token_payload}")
-    print(f"CSRF token value: {csrf_token_value}")
     
     return jsonify(
         access_token = access_token,
@@ -49,11 +53,10 @@ def login_api():
 def get_current_user_info_api():
     FLASK_URL = current_app.config['FLASK_URL']
     current_user_id = get_jwt_identity()
-    user_record = login_service.get_profile(current_user_id)
-    if not user_record:
+    user_data = login_service.get_cached_profile(current_user_id)
+    if not user_data:
         logger.debug(f"Get profile Failed for user_id : {current_user_id}")
         return jsonify({"msg":"User not found for current token"}), 404
-    user_data = user_record[0]
     if user_data.get("avatar_url"):
         user_data["avatar_url"] = FLASK_URL + user_data["avatar_url"] # 这里假设你在本地开发，实际部署时需要根据你的域名或IP来设置
     return jsonify(user_data), 200
@@ -88,13 +91,17 @@ def signup_api():
     
     # 1. 先尝试注册用户（不包含头像URL，因为头像还未处理）
     # login_service.register_user 需要修改，允许 avatar_url 为 None 或在之后更新
-    registration_result = login_service.register_user(
-        username,
-        password,
-        nickname,
-        phone,
-        avatar_url=None # 初始注册时不提供头像 URL
-    )
+    try:
+        registration_result = login_service.register_user(
+            username,
+            password,
+            nickname,
+            phone,
+            avatar_url=None # 初始注册时不提供头像 URL
+        )
+    except PasswordHasherBusyError:
+        logger.warning(f"Signup rejected for username : {username} - password hasher busy")
+        return jsonify({"msg": "Server busy, please retry"}), 503
 
     if not registration_result.get("success"):
         return jsonify({"msg": registration_result.get("error", "Registration failed")}), 400
@@ -106,9 +113,7 @@ def signup_api():
     if new_user_id and avatar_file and avatar_file.filename != '' and allowed_file(avatar_file.filename):
         try:
             original_filename = secure_filename(avatar_file.filename)
-            print(f"Original filename: {original_filename}")
             extension = original_filename.rsplit('.', 1)[1].lower()
-            print(f"File extension: {extension}")
             unique_filename = f"user_{new_user_id}_{uuid.uuid4().hex}.{extension}"
             filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
             
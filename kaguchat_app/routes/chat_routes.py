@@ -27,12 +27,31 @@ def get_contacts():
     for contact in contacts
 ]
 
-        print(contacts)
+        logger.debug("Chat: %d contacts for user_id %s", len(contacts), user_id_str)
         return jsonify(contacts=contacts), 200 # 返回 { "contacts": [...] }
     except Exception as e:
         logger.error(f"Chat: Error fetching contacts for user_id {user_id_str}: {e}", exc_info=True)
         return jsonify({"error": "Internal server error fetching contacts"}), 500
 
+@chat_bp.route('/presence', methods=['GET']) # API端点: GET /api/chat/presence?user_ids=1,2,3
+@jwt_required()
+def get_presence():
+    """批量查询好友是否在线 (非好友的 user_id 不在结果中)。"""
+    user_id_str = get_jwt_identity()
+    try:
+        friend_ids = list(dict.fromkeys(int(value) for value in request.args.get('user_ids', '').split(',') if value.strip()))
+    except ValueError:
+        return jsonify({"error": "user_ids must be a comma-separated list of integers"}), 400
+    max_ids = current_app.config.get('PRESENCE_QUERY_MAX', 500)
+    if len(friend_ids) > max_ids:
+        return jsonify({"error": f"At most {max_ids} user_ids per request"}), 400
+    try:
+        presence = chat_service.get_friends_presence(int(user_id_str), friend_ids)
+        return jsonify(presence={str(friend_id): online for friend_id, online in presence.items()}), 200
+    except Exception as e:
+        logger.error(f"Chat: Error fetching presence for user_id {user_id_str}: {e}", exc_info=True)
+        return jsonify({"error": "Internal server error fetching presence"}), 500
+
 # @jwt_required() # 这个装饰器应该在 @chat_bp.route 下面
 @chat_bp.route('/messages/<contact_type>/<contact_id_str>', methods=['GET']) # API端点
 @jwt_required() # 需要JWT认证
@@ -52,11 +71,27 @@ def get_messages(contact_type, contact_id_str): # 从URL路径获取参数
         logger.error(f"Chat: Invalid ID format. UserID: {user_id_str}, ContactID: {contact_id_str}")
         return jsonify({"error": "Invalid ID format for user or contact"}), 400
     
+    # 游标分页参数: ?limit=50&before=<cursor> 或 ?after=<cursor>
+    before_cursor = request.args.get('before')
+    after_cursor = request.args.get('after')
+    if before_cursor and after_cursor:
+        return jsonify({"error": "Only one of 'before' or 'after' may be given"}), 400
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('MESSAGE_PAGE_SIZE', 50)))
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    limit = max(1, min(limit, current_app.config.get('MESSAGE_PAGE_SIZE_MAX', 200)))
+
     try:
         # 确保 chat_service.get_messages 接收正确的参数类型
-        messages = chat_service.get_messages(user_id_int, contact_id_int, contact_type)
+        page = chat_service.get_messages(user_id_int, contact_id_int, contact_type,
+                                         limit=limit, before=before_cursor, after=after_cursor)
         # messages.map(lambda msg: msg.update({"contact_avatar_url": f"http://localhost:5001/{msg['contact_avatar_url']}"}) if msg.get("contact_avatar_url") else None) # 处理消息中的头像URL
-        return jsonify(messages=messages), 200 # 返回 { "messages": [...] }
+        # 返回 { "messages": [...], "next_cursor": ..., "has_more": ... }
+        return jsonify(messages=page['messages'], next_cursor=page['next_cursor'], has_more=page['has_more']), 200
+    except ValueError as e:
+        logger.warning(f"Chat: Invalid pagination cursor for user_id {user_id_str}: {e}")
+        return jsonify({"error": "Invalid cursor"}), 400
     except Exception as e:
         logger.error(f"Error fetching messages for user_id {user_id_str} and contact {contact_type}/{contact_id_str}: {e}", exc_info=True)
         return jsonify({"error": "Internal server error fetching messages"}), 500
@@ -90,6 +125,9 @@ def send_message():
         logger.error(f"Chat: Invalid ID format. UserID: {user_id_str}, ContactID: {contact_id_str}")
         return jsonify({"error": "Invalid ID format for user or contact"}), 400
     
+    if not chat_service.can_message(user_id_int, contact_id_int, contact_type):
+        return jsonify({"error": "Not a friend or group member"}), 403
+
     try:
         # 确保 chat_service.send_message 接收正确的参数类型
         chat_service.send_message(user_id_int, contact_id_int, contact_type, message_content)
@@ -0,0 +1,53 @@
+# kaguchat_app/routes/metrics_routes.py
+import hmac
+import ipaddress
+
+from flask import Blueprint, Response, jsonify, request, current_app
+from ..metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics_bp', __name__) # 不加前缀: Prometheus 默认抓取 /metrics
+
+# 反向代理添加的请求头；出现时 remote_addr 是代理而不是真正的客户端
+_PROXY_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+
+def _scrape_allowed():
+    """
+    抓取端校验:
+    - 配置了 METRICS_AUTH_TOKEN 时必须携带 Authorization: Bearer <token>，不再按来源地址放行
+    - 否则来源地址须在 METRICS_ALLOWED_IPS 中。经过反向代理的请求 (带 X-Forwarded-For / Forwarded 头) 的
+      remote_addr 是代理的地址 (通常为 127.0.0.1)，不能据此判断，一律拒绝；
+      run_cluster.py 的内置 TCP 代理不加这些头，因此它启动的 worker 默认不放行任何地址 (见 run_cluster.py)
+    """
+    token = current_app.config.get('METRICS_AUTH_TOKEN')
+    if token:
+        auth_header = request.headers.get('Authorization', '')
+        return auth_header.startswith('Bearer ') and hmac.compare_digest(auth_header[len('Bearer '):], token)
+    if any(header in request.headers for header in _PROXY_HEADERS):
+        return False
+    try:
+        remote = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    for network in current_app.config.get('METRICS_ALLOWED_IPS', ()):
+        try:
+            if remote in ipaddress.ip_network(network, strict=False):
+                return True
+        except ValueError:
+            logger.warning("Invalid entry in METRICS_ALLOWED_IPS: %s", network)
+    return False
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 文本格式的指标 (多进程模式下为所有 worker 的汇总)。只对 METRICS_ALLOWED_IPS / 持有 token 的抓取端开放。"""
+    if not metrics.enabled:
+        return jsonify(msg="Metrics are disabled"), 503
+    if not _scrape_allowed():
+        logger.warning(f"Rejected /metrics request from {request.remote_addr}")
+        return jsonify(msg="Forbidden"), 403
+    body, content_type = metrics.render()
+    return Response(body, mimetype=None, content_type=content_type)
@@ -3,7 +3,7 @@ from flask_jwt_extended import create_access_token, unset_jwt_cookies, jwt_requi
 from werkzeug.utils import secure_filename # 用于安全地获取文件名
 import os # 新增 os
 import uuid # 用于生成唯一文件名
-from ..extensions import logger, table_service # 假设 table_service 已经可以更新 Users 表
+from ..extensions import logger, table_service, login_service # 假设 table_service 已经可以更新 Users 表
 # ... (其他导入) ...
 
 user_bp = Blueprint('user_bp', __name__, url_prefix="/api/user")
@@ -45,6 +45,7 @@ def upload_avatar_api():
             update_success = table_service.update_record("Users", "user_id", int(current_user_id_str), {"avatar_url": avatar_url})
 
             if update_success:
+                login_service.invalidate_profile(current_user_id_str) # 头像已修改，缓存的资料和 token 身份信息失效
                 return jsonify({"msg": "Avatar uploaded successfully", "avatar_url": avatar_url}), 200
             else:
                 # 如果更新失败，可能需要删除已保存的文件
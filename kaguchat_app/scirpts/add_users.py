@@ -1,8 +1,28 @@
+# kaguchat_app/scirpts/add_users.py
+# 批量导入用户 (Users 表)。
+#   - 流式解析 JSON 数组 / NDJSON / CSV，内存占用与文件大小无关
+#   - 密码哈希分散到进程池的多个进程中并行计算 (已是 werkzeug 哈希的密码原样写入，适合从旧系统迁移)
+#   - 每 --batch-size 行用一次 executemany (多行 INSERT) 写入并提交
+#   - 用户名按数据库排序规则 (utf8mb4_0900_ai_ci，不区分大小写和重音) 去重: 批内重复的行和用户名已存在的行
+#     被拒绝 (--ignore-duplicates 时计为跳过)，Users 表上只有 uk_phone 唯一键，不能依赖 INSERT IGNORE
+#   - 每批提交后写入检查点文件，中断后用同样的参数重新运行会从上次提交的位置继续
+#   - 定期输出进度和吞吐量 (rows/s)
+#
+# 用法 (在项目根目录):
+#   python kaguchat_app/scirpts/add_users.py users.ndjson --batch-size 2000 --workers 8
+#   python kaguchat_app/scirpts/add_users.py users.csv --ignore-duplicates --rejects rejects.ndjson
+#   python kaguchat_app/scirpts/add_users.py users.json --hash-method scrypt
+# 注意: 吞吐量的上限通常是密码哈希本身的代价 (werkzeug 默认的 pbkdf2 每个哈希需要数百毫秒 CPU 时间)，
+# 增加 --workers 可以线性提升；导入已有哈希时只受数据库写入速度限制。
+import argparse
+import collections
+import csv
 import json
 import os
 import sys
-import datetime
-from werkzeug.security import generate_password_hash
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 
 current_script_path = os.path.abspath(__file__)
 scripts_dir = os.path.dirname(current_script_path)
@@ -12,64 +32,348 @@ project_root = os.path.dirname(kaguchat_app_dir)
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-try:
-    from kaguchat_app.data.db_access import DatabaseAccess
-except ModuleNotFoundError as e:
-    print(f"Error: {e}. Please ensure the script is run from the correct directory.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Unexpected error: {e}")
-    sys.exit(1)
-
-DEFAULT_JSON_FILE_PATHS = os.path.join(current_script_path,"user_data.json")
-
-def batch_add_users_from_json(json_file_path=DEFAULT_JSON_FILE_PATHS):
-    db = None
-    successful_inserts = 0
-    failed_inserts = 0
-
-    try:
-        db = DatabaseAccess()
-        if not db.connection:
-            print("Failed to connect to the database.")
+import mysql.connector
+from werkzeug.security import generate_password_hash
+
+from kaguchat_app.db_config import get_db_pool
+from kaguchat_app.business.password_hasher import is_password_hash
+
+DEFAULT_JSON_FILE_PATH = os.path.join(scripts_dir, "user_data.json")
+
+# 可以导入的 Users 列 (user_id 由数据库分配)；输入中的其他字段 (例如旧数据中的 email) 会被忽略
+USER_COLUMNS = ("username", "nickname", "phone", "password", "avatar_url", "created_at")
+REQUIRED_COLUMNS = ("username", "phone", "password")
+
+
+def username_key(username):
+    """用户名比较键: 去掉重音后 casefold，与 utf8mb4_0900_ai_ci 的比较结果一致 ('Bob' == 'bob')。"""
+    decomposed = unicodedata.normalize('NFKD', username)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+# ---- 流式解析 ----
+
+def iter_ndjson(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array(file, read_size=1 << 16):
+    """增量解析顶层 JSON 数组，每次只在内存中保留一小段文本。"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # 跳过空白、数组开头的 '[' 和元素之间的 ','
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and not started:
+                if buffer[position] != '[':
+                    raise ValueError("JSON input must be an array of user objects")
+                started = True
+                position += 1
+                continue
+            break
+        if position < len(buffer) and buffer[position] == ']':
             return
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            users_data = json.load(file)
-        
-        for user_data in users_data:
-            username = user_data.get("username")
-            email = user_data.get("email")
-            plain_password = user_data.get("password")
-            phone = user_data.get("phone") # 会是 None 如果键不存在或值为 null
-            avatar_url = user_data.get("avatar_url") # 会是 None 如果键不存在或值为 null
-
-            hashed_password = generate_password_hash(plain_password)
-            insert_data = {
-                "username": username,
-                "email": email,
-                "password": hashed_password,
-                "phone": phone, # 如果数据库允许 NULL，None 会被正确处理
-                "avatar_url": avatar_url, # 同上
-                # 添加 Users 表中其他必要的字段（如果它们没有默认值且非空）
-            }
-
-            columns = []
-            values_tuple = []
-            for col_name, col_val in insert_data.items():
-                columns.append(col_name)
-                values_tuple.append(col_val)
-            sql_columns_str = ", ".join(columns)
-            placeholders = ", ".join(["%s"] * len(columns))
-            query = f"INSERT INTO Users ({sql_columns_str}) VALUES ({placeholders})"
-            params = tuple(values_tuple)
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # 元素被截断在缓冲区末尾，继续读取
+            if eof:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = file.read(read_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+            continue
+        yield item
+        position = end
+
+
+def iter_csv(file):
+    for row in csv.DictReader(file):
+        yield row
+
+
+def detect_format(path, explicit=None):
+    if explicit:
+        return explicit
+    extension = os.path.splitext(path)[1].lower()
+    return {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}.get(extension, 'json')
+
+
+def iter_records(path, input_format):
+    with open(path, 'r', encoding='utf-8-sig', newline='' if input_format == 'csv' else None) as file:
+        reader = {'ndjson': iter_ndjson, 'csv': iter_csv, 'json': iter_json_array}[input_format]
+        yield from reader(file)
+
+
+# ---- 在进程池中执行的哈希任务 ----
+
+def _hash_passwords(passwords, method):
+    if method:
+        return [generate_password_hash(p, method=method) for p in passwords]
+    return [generate_password_hash(p) for p in passwords]
+
+
+# ---- 检查点 ----
+
+def load_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        checkpoint = json.load(file)
+    if checkpoint.get('source') != os.path.abspath(source):
+        raise SystemExit(f"Checkpoint {path} belongs to {checkpoint.get('source')}, not {source}; "
+                         f"remove it or use another --checkpoint file")
+    return checkpoint
+
+
+def save_checkpoint(path, source, stats):
+    if not path:
+        return
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(dict(stats, source=os.path.abspath(source), updated_at=time.time()), file)
+    os.replace(temp_path, path) # 原子替换，中断时不会留下半个检查点
+
+
+class UserLoader:
+    """
+    把用户记录按批流过 "校验 -> 进程池哈希 -> executemany 插入 -> 提交 -> 检查点"。
+    同时最多有 max_pending 批在进程池中计算，主进程在等待的同时写入已完成的批。
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.stats = {'rows_done': 0, 'inserted': 0, 'skipped': 0, 'failed': 0}
+        self.rejects = open(args.rejects, 'a', encoding='utf-8') if args.rejects else None
+        self.executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+        self.conn = None
+        self.started_at = None
+        self.last_report = 0.0
+        self.rows_at_start = 0
+        verb = "INSERT IGNORE" if args.ignore_duplicates else "INSERT"
+        self.query = (f"{verb} INTO Users ({', '.join(f'`{c}`' for c in USER_COLUMNS)}) "
+                      f"VALUES ({', '.join(['%s'] * len(USER_COLUMNS))})")
+
+    def reject(self, record, error, skipped=False):
+        """记录被拒绝的行；skipped=True 时计为跳过 (--ignore-duplicates 下的重复行)，不计为失败。"""
+        self.stats['skipped' if skipped else 'failed'] += 1
+        if isinstance(record, dict) and record.get('password'):
+            record = dict(record, password='<redacted>') # 不把明文密码写入拒绝文件
+        if self.rejects:
+            self.rejects.write(json.dumps({'error': str(error), 'record': record}, ensure_ascii=False, default=str) + '\n')
+
+    def normalize(self, record):
+        if not isinstance(record, dict):
+            raise ValueError("record is not an object")
+        values = {}
+        for column in USER_COLUMNS:
+            value = record.get(column)
+            if isinstance(value, str):
+                value = value.strip() or None
+            values[column] = value
+        missing = [c for c in REQUIRED_COLUMNS if values[c] is None]
+        if missing:
+            raise ValueError(f"missing required field(s): {', '.join(missing)}")
+        if values['nickname'] is None:
+            values['nickname'] = values['username']
+        return values
+
+    # ---- 提交哈希任务 ----
+
+    def submit(self, records):
+        """校验一批记录并把需要哈希的密码分片提交到进程池，返回 (rows, [(行下标, future)], 原始记录数)。"""
+        rows = []
+        seen = set()
+        for record in records:
+            try:
+                row = self.normalize(record)
+            except ValueError as e:
+                self.reject(record, e)
+                continue
+            key = username_key(row['username'])
+            if key in seen:
+                self.reject(row, f"duplicate username {row['username']!r} in this batch",
+                            skipped=self.args.ignore_duplicates)
+                continue
+            seen.add(key)
+            rows.append(row)
+        to_hash = [i for i, row in enumerate(rows) if not is_password_hash(row['password'])]
+        passwords = [rows[i]['password'] for i in to_hash]
+        futures = []
+        if passwords:
+            if self.executor is None:
+                futures.append((to_hash, _hash_passwords(passwords, self.args.hash_method)))
+            else:
+                # 每批拆成 workers 份，保证一批就能用满所有进程
+                slice_size = max(1, -(-len(passwords) // self.args.workers))
+                for start in range(0, len(passwords), slice_size):
+                    futures.append((to_hash[start:start + slice_size],
+                                    self.executor.submit(_hash_passwords, passwords[start:start + slice_size],
+                                                         self.args.hash_method)))
+        return rows, futures, len(records)
+
+    # ---- 写入 ----
+
+    def connect(self):
+        self.conn = get_db_pool().acquire()
+        self.conn.autocommit = False
+
+    def drop_existing_usernames(self, rows):
+        """一条 IN 查询找出用户名已存在的行 (排序规则不区分大小写，'Alice' 会匹配已有的 'alice')，拒绝或跳过它们。"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT username FROM Users WHERE username IN ({', '.join(['%s'] * len(rows))})",
+                           [row['username'] for row in rows])
+            existing = {username_key(username) for (username,) in cursor.fetchall()}
+        finally:
+            cursor.close()
+        self.conn.commit() # 结束只读事务，下一批能看到其他连接提交的数据
+        if not existing:
+            return rows
+        kept = []
+        for row in rows:
+            if username_key(row['username']) in existing:
+                self.reject(row, f"username {row['username']!r} already exists", skipped=self.args.ignore_duplicates)
+            else:
+                kept.append(row)
+        return kept
+
+    def insert(self, rows):
+        params = [tuple(row[c] for c in USER_COLUMNS) for row in rows]
+        cursor = self.conn.cursor()
+        try:
             try:
-                db.execute_update(query, params)
-                successful_inserts += 1
-            except Exception as e:
-                print(f"Failed to insert user {username}: {e}")
-                failed_inserts += 1
-    except Exception as e:
-        print(f"Error: {e}")
+                cursor.executemany(self.query, params)
+                inserted = cursor.rowcount
+                self.conn.commit()
+                return inserted, []
+            except mysql.connector.Error:
+                self.conn.rollback()
+            # 整批失败时逐行写入，只拒绝出错的行
+            inserted, failures = 0, []
+            for row, row_params in zip(rows, params):
+                try:
+                    cursor.execute(self.query, row_params)
+                    inserted += cursor.rowcount
+                except mysql.connector.Error as e:
+                    failures.append((row, e))
+            self.conn.commit()
+            return inserted, failures
+        finally:
+            cursor.close()
+
+    def flush(self, pending):
+        rows, futures, record_count = pending
+        for indexes, future in futures:
+            hashes = future if isinstance(future, list) else future.result()
+            for index, password_hash in zip(indexes, hashes):
+                rows[index]['password'] = password_hash
+        # 在写入时检查 (而不是提交哈希任务时)，前面各批已提交，跨批的重复用户名也能查到
+        rows = self.drop_existing_usernames(rows) if rows else rows
+        inserted, failures = self.insert(rows) if rows else (0, [])
+        for row, error in failures:
+            self.reject(row, error)
+        self.stats['inserted'] += inserted
+        # INSERT IGNORE 跳过的行 (手机号重复，uk_phone)
+        self.stats['skipped'] += len(rows) - len(failures) - inserted
+        self.stats['rows_done'] += record_count
+        save_checkpoint(self.args.checkpoint, self.args.source, self.stats)
+        self.report()
+
+    def report(self, final=False):
+        now = time.monotonic()
+        if not final and now - self.last_report < self.args.report_interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.started_at, 1e-9)
+        rate = (self.stats['rows_done'] - self.rows_at_start) / elapsed
+        print(f"{'Done' if final else '...'} rows={self.stats['rows_done']} inserted={self.stats['inserted']} "
+              f"skipped={self.stats['skipped']} failed={self.stats['failed']} "
+              f"elapsed={elapsed:.1f}s rate={rate:,.0f} rows/s", flush=True)
+
+    # ---- 主循环 ----
+
+    def run(self):
+        input_format = detect_format(self.args.source, self.args.format)
+        checkpoint = load_checkpoint(self.args.checkpoint, self.args.source)
+        if checkpoint:
+            for key in self.stats:
+                self.stats[key] = checkpoint.get(key, 0)
+            print(f"Resuming from checkpoint: {self.stats['rows_done']} rows already processed")
+        self.rows_at_start = self.stats['rows_done']
+        skip = self.stats['rows_done']
+
+        self.connect()
+        self.started_at = time.monotonic()
+        pending = collections.deque()
+        batch = []
+        try:
+            for record in iter_records(self.args.source, input_format):
+                if skip:
+                    skip -= 1 # 已在上次运行中提交的行只解析不处理
+                    continue
+                batch.append(record)
+                if len(batch) >= self.args.batch_size:
+                    pending.append(self.submit(batch))
+                    batch = []
+                    if len(pending) > self.args.max_pending:
+                        self.flush(pending.popleft())
+            if batch:
+                pending.append(self.submit(batch))
+            while pending:
+                self.flush(pending.popleft())
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+            if self.conn is not None:
+                get_db_pool().release(self.conn)
+            if self.rejects:
+                self.rejects.close()
+        self.report(final=True)
+        return self.stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load users into the Users table.")
+    parser.add_argument('source', nargs='?', default=DEFAULT_JSON_FILE_PATH,
+                        help='JSON 数组、NDJSON (.ndjson/.jsonl) 或 CSV 文件')
+    parser.add_argument('--format', choices=['json', 'ndjson', 'csv'], help='默认按扩展名判断')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每次 executemany 并提交的行数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='密码哈希进程数 (1 表示在主进程中计算)')
+    parser.add_argument('--max-pending', type=int, default=2, help='同时在进程池中计算的批数')
+    parser.add_argument('--hash-method', default=None, help="werkzeug 哈希算法，例如 'scrypt'；默认使用 werkzeug 的默认算法 (与未配置 PASSWORD_HASH_METHOD 的应用相同)")
+    parser.add_argument('--ignore-duplicates', action='store_true', help='用户名或手机号重复的行计为跳过 (skipped) 而不是失败 (failed)')
+    parser.add_argument('--checkpoint', help='检查点文件 (默认 <source>.checkpoint)；传空字符串禁用')
+    parser.add_argument('--rejects', help='把被拒绝的行及原因追加写入该 NDJSON 文件')
+    parser.add_argument('--report-interval', type=float, default=5.0, help='进度输出间隔 (秒)')
+    args = parser.parse_args(argv)
+    if args.checkpoint is None:
+        args.checkpoint = f"{args.source}.checkpoint"
+    if args.batch_size < 1 or args.workers < 1 or args.max_pending < 1:
+        parser.error("--batch-size, --workers and --max-pending must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.source):
+        raise SystemExit(f"Input file not found: {args.source}")
+    stats = UserLoader(args).run()
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint) # 全部完成后删除检查点，下次运行从头开始
+    return 0 if not stats['failed'] else 1
+
 
 if __name__ == "__main__":
-    batch_add_users_from_json()
\ No newline at end of file
+    sys.exit(main())
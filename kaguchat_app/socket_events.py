@@ -3,7 +3,12 @@ from flask import request, current_app # 移除了 flask.session
 from flask_socketio import emit, join_room, leave_room
 from flask import session as socketio_session
 # 确保 login_service 包含 verify_jwt_token 和 get_profile 方法
-from .extensions import socketio, chat_service, login_service, logger
+from .extensions import socketio, chat_service, login_service, message_writer, presence_service, typing_service, logger
+from .business.chat_service import get_conversation_key
+from .data.query_stats import query_stats # 每个事件的查询次数/数据库耗时统计
+from .metrics import metrics # 每个事件的 Prometheus 计数和耗时
+from .data.membership_cache import membership_index # 好友/群成员权限索引
+from .log_config import typing_log_sampler
 from datetime import datetime
 import jwt # 直接使用 PyJWT 来解码和验证
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError, DecodeError # PyJWT 的异常
@@ -14,10 +19,15 @@ def verify_and_extract_user_from_token(token_string):
     """
     验证JWT token并返回包含 user_id 和 username 的字典。
     如果验证失败，则抛出相应的JWT异常。
+    已验证过的 token 和用户资料都有进程内缓存，重连风暴时不需要访问数据库。
     """
     if not token_string:
         raise InvalidTokenError("No token provided.")
     try:
+        cached_identity = login_service.get_cached_token_identity(token_string)
+        if cached_identity is not None:
+            return cached_identity
+
         payload = jwt.decode(
             token_string,
             current_app.config['JWT_SECRET_KEY'],
@@ -25,41 +35,23 @@ def verify_and_extract_user_from_token(token_string):
         )
         # Flask-JWT-Extended 默认使用 'sub' 作为身份标识
         user_id = str(payload['sub']) # 确保 user_id 是字符串，与 login_api 中创建token时一致
-        
-        # 尝试从 payload 中获取更多用户信息，例如 username 或 nickname
-        # 这些需要在生成 JWT token 时就包含进去
-        username = payload.get('username') # 假设 token 中有 username claim
-        nickname = payload.get('nickname') # 假设 token 中有 nickname claim
-        avatar_url = payload.get('avatar_url') # 假设 token 中有 avatar_url claim
-
-        if not username: # 如果JWT中没有username，可以尝试从数据库查询
-            # 注意：频繁在connect时查库可能影响性能，最好JWT中包含足够信息
-            user_profile_list = login_service.get_profile(user_id) # get_profile 返回的是列表
-            if user_profile_list:
-                user_profile = user_profile_list[0]
-                username = user_profile.get('username')
-                if not nickname: # 如果JWT和DB都没有nickname，用username
-                    nickname = user_profile.get('nickname', username)
-                if not avatar_url:
-                    avatar_url = user_profile.get('avatar_url')
-            else: # 如果数据库也查不到（理论上不应该发生，因为JWT是基于存在的用户生成的）
-                raise InvalidTokenError("User identity in token not found in database.")
-
-
-        return {
-            'user_id': user_id,
-            'username': username or f"user_{user_id}", # 提供一个备用 username
-            'nickname': nickname or username or f"User {user_id}",
-            'avatar_url': avatar_url
-        }
+
+        # login_api 签发的 token 中带有 username / nickname / avatar_url claims；
+        # 旧 token 或资料已修改时才会读取 (缓存的) 用户资料
+        identity = login_service.build_identity(user_id, payload)
+        if identity is None: # 如果数据库也查不到（理论上不应该发生，因为JWT是基于存在的用户生成的）
+            raise InvalidTokenError("User identity in token not found in database.")
+
+        login_service.cache_token_identity(token_string, identity, payload.get('exp'))
+        return identity
     except ExpiredSignatureError:
         logger.warning("JWT token has expired.")
         raise # 重新抛出给 connect handler
     except InvalidTokenError as e: # 包括 DecodeError, InvalidSignatureError 等
-        logger.warning(f"Invalid JWT token: {e}")
+        logger.warning("Invalid JWT token: %s", e)
         raise # 重新抛出给 connect handler
     except Exception as e: # 其他可能的错误
-        logger.error(f"Unexpected error decoding JWT: {e}", exc_info=True)
+        logger.error("Unexpected error decoding JWT: %s", e, exc_info=True)
         raise InvalidTokenError(f"Unexpected error during token decoding: {e}")
 
 
@@ -67,6 +59,8 @@ def verify_and_extract_user_from_token(token_string):
 def register_socketio_events(socketio_instance):
 
     @socketio_instance.on('connect')
+    @metrics.track_event('connect')
+    @query_stats.track_event('connect')
     def handle_connect(auth_data=None): # auth_data 是客户端通过 socket = io({ auth: {token: ...}}) 传递的
         token = None
         # 优先从 auth_data (推荐方式)
@@ -75,10 +69,10 @@ def register_socketio_events(socketio_instance):
         # 备用：从查询参数获取 (旧的或特定客户端可能使用的方式)
         elif request.args.get('token'):
             token = request.args.get('token')
-            logger.info(f"Client {request.sid} connected using token from query parameter.")
+            logger.info("Client %s connected using token from query parameter.", request.sid)
 
         if not token:
-            logger.warning(f"SocketIO 连接尝试，但缺少 JWT token。SID: {request.sid}")
+            logger.warning("SocketIO 连接尝试，但缺少 JWT token。SID: %s", request.sid)
             return False # 拒绝连接
 
         try:
@@ -90,39 +84,47 @@ def register_socketio_events(socketio_instance):
             socketio_session['nickname'] = user_info.get('nickname', user_info['username'])
             socketio_session['avatar_url'] = user_info.get('avatar_url')
 
-            print("socketio_session:", socketio_session) # 调试用
-            logger.info(f"客户端连接成功: {request.sid}, user_id: {user_info['user_id']}, username: {user_info['username']} (JWT认证)")
+            logger.info("客户端连接成功: %s, user_id: %s, username: %s (JWT认证)", request.sid, user_info['user_id'], user_info['username'])
             join_room(str(user_info['user_id'])) # 加入以用户ID命名的房间
+            # 预加载好友/群权限索引，之后的 join_chat / send_message 不再查询数据库
+            membership_index.get(user_info['user_id'])
+            presence_service.connect(user_info['user_id'], request.sid) # 记录连接，首个连接时通知在线的好友
 
         except (ExpiredSignatureError, InvalidTokenError, DecodeError) as e:
-            logger.warning(f"SocketIO 连接认证失败 for SID {request.sid}: {str(e)}")
+            logger.warning("SocketIO 连接认证失败 for SID %s: %s", request.sid, e)
             return False # 拒绝连接
         except Exception as e:
-            logger.error(f"SocketIO 'connect' 事件中发生未知错误: {e}. SID: {request.sid}", exc_info=True)
+            logger.error("SocketIO 'connect' 事件中发生未知错误: %s. SID: %s", e, request.sid, exc_info=True)
             return False
 
 
     @socketio_instance.on('disconnect')
+    @metrics.track_event('disconnect')
+    @query_stats.track_event('disconnect')
     def handle_disconnect():
         user_id = socketio_session.get('user_id') # 从 socketio_session 获取
-        logger.info(f"客户端断开连接: {request.sid}, user_id: {user_id if user_id else 'N/A'}")
+        logger.info("客户端断开连接: %s, user_id: %s", request.sid, user_id or 'N/A')
         if user_id:
             # 离开个人房间
             leave_room(str(user_id))
+            presence_service.disconnect(user_id, request.sid) # 最后一个连接断开时通知在线的好友
             # 如果有 current_chat_room，也应该离开
             current_room = socketio_session.pop('current_chat_room', None)
             if current_room:
+                typing_service.stopped(user_id, current_room)
                 leave_room(current_room)
-                logger.info(f"User {user_id} (SID: {request.sid}) left room {current_room} on disconnect.")
+                logger.debug("User %s (SID: %s) left room %s on disconnect.", user_id, request.sid, current_room)
             # 清理 socketio_session (可选, 因为连接断开后这个session也就失效了)
             # socketio_session.clear()
 
 
     @socketio_instance.on('join_chat')
+    @metrics.track_event('join_chat')
+    @query_stats.track_event('join_chat')
     def handle_join_chat(data):
         user_id_str = socketio_session.get('user_id') # 从 socketio_session 获取
         if not user_id_str:
-            logger.warning(f"未认证用户 (SID: {request.sid}) 尝试加入聊天。")
+            logger.warning("未认证用户 (SID: %s) 尝试加入聊天。", request.sid)
             emit('auth_error', {'message': 'Authentication required to join chat.'}, room=request.sid)
             return
 
@@ -130,7 +132,7 @@ def register_socketio_events(socketio_instance):
         contact_id_str = str(data.get('contact_id')) # 确保 contact_id 是字符串以便统一处理
         
         if not contact_type or not contact_id_str:
-            logger.warning(f"加入聊天尝试，但缺少 contact_type 或 contact_id: {data}。SID: {request.sid}")
+            logger.warning("加入聊天尝试，但缺少 contact_type 或 contact_id。UserID: %s, SID: %s", user_id_str, request.sid)
             emit('chat_error', {'message': 'contact_type and contact_id are required.'}, room=request.sid)
             return
 
@@ -138,36 +140,41 @@ def register_socketio_events(socketio_instance):
             user_id = int(user_id_str)
             contact_id = int(contact_id_str)
         except ValueError:
-            logger.error(f"加入聊天时ID格式无效。 UserID: {user_id_str}, ContactID: {contact_id_str}。SID: {request.sid}")
+            logger.error("加入聊天时ID格式无效。 UserID: %s, ContactID: %s。SID: %s", user_id_str, contact_id_str, request.sid)
             emit('chat_error', {'message': 'Invalid ID format.'}, room=request.sid)
             return
 
         room_name = None
-        if contact_type == 'friend':
-            # 对用户ID进行排序，确保房间名对于两个用户是唯一的且相同的
-            user1 = min(user_id, contact_id)
-            user2 = max(user_id, contact_id)
-            room_name = f"friend_{user1}_{user2}"
-        elif contact_type == 'group':
-            room_name = f"group_{contact_id}"
+        if contact_type in ('friend', 'group'):
+            # 房间名即会话键，私聊对双方相同 (friend_<小id>_<大id>)，群聊为 group_<id>
+            room_name = get_conversation_key(user_id, contact_id, contact_type)
         else:
-            logger.warning(f"无效的 contact_type: {contact_type}。SID: {request.sid}")
+            logger.warning("无效的 contact_type: %s。SID: %s", contact_type, request.sid)
             emit('chat_error', {'message': 'Invalid contact type.'}, room=request.sid)
             return
 
+        # 只能加入自己的好友 / 所在群的聊天室
+        if not chat_service.can_message(user_id, contact_id, contact_type):
+            logger.warning("用户 %s 无权加入 %s %s 的聊天。SID: %s", user_id, contact_type, contact_id, request.sid)
+            emit('chat_error', {'message': 'Not a friend or group member.'}, room=request.sid)
+            return
+
         # （可选）离开旧的聊天房间
         old_room = socketio_session.get('current_chat_room')
         if old_room and old_room != room_name:
+            typing_service.stopped(user_id_str, old_room)
             leave_room(old_room)
-            logger.info(f"用户 {user_id} (SID: {request.sid}) 离开旧房间 {old_room}。")
+            logger.debug("用户 %s (SID: %s) 离开旧房间 %s。", user_id, request.sid, old_room)
 
         join_room(room_name)
         socketio_session['current_chat_room'] = room_name # 在 socketio_session 中记录当前聊天室
-        logger.info(f"用户 {user_id} (SID: {request.sid}) 加入房间 {room_name} (与 {contact_type} {contact_id} 聊天)。")
+        logger.info("用户 %s (SID: %s) 加入房间 %s (与 %s %s 聊天)。", user_id, request.sid, room_name, contact_type, contact_id)
         emit('joined_chat_room', {'room_name': room_name, 'message': f'Successfully joined chat with {contact_id}.'}, room=request.sid)
 
 
     @socketio_instance.on('leave_chat')
+    @metrics.track_event('leave_chat')
+    @query_stats.track_event('leave_chat')
     def handle_leave_chat(data): # data 可以包含 room_name 或 contact_id/contact_type
         user_id = socketio_session.get('user_id') # 从 socketio_session 获取
         if not user_id:
@@ -182,19 +189,21 @@ def register_socketio_events(socketio_instance):
         # 你也可以根据 data 中的 contact_id/contact_type 来重新计算 room_name
 
         if room_name_to_leave:
+            typing_service.stopped(user_id, room_name_to_leave)
             leave_room(room_name_to_leave)
-            logger.info(f"用户 {user_id} (SID: {request.sid}) 离开房间 {room_name_to_leave}")
+            logger.info("用户 %s (SID: %s) 离开房间 %s", user_id, request.sid, room_name_to_leave)
             # 如果离开的是当前聊天室，则从 session 中移除
             if socketio_session.get('current_chat_room') == room_name_to_leave:
                 socketio_session.pop('current_chat_room', None)
             emit('left_chat_room', {'room_name': room_name_to_leave, 'message': 'Successfully left chat room.'}, room=request.sid)
         else:
-            logger.info(f"用户 {user_id} (SID: {request.sid}) 尝试离开聊天，但未指定房间或在session中未找到。")
+            logger.info("用户 %s (SID: %s) 尝试离开聊天，但未指定房间或在session中未找到。", user_id, request.sid)
 
 
     @socketio_instance.on('send_message')
+    @metrics.track_event('send_message')
+    @query_stats.track_event('send_message')
     def handle_send_message(data):
-        logger.info(f"SocketIO: >>>>>>> Received Sending attempt. SID: {request.sid}")
         sender_id_str = socketio_session.get('user_id')
         # 从 socketio_session 获取更完整的用户信息
         sender_username = socketio_session.get('username')
@@ -202,7 +211,7 @@ def register_socketio_events(socketio_instance):
         sender_avatar_url = socketio_session.get('avatar_url')
 
         if not sender_id_str:
-            logger.warning(f"发送消息尝试，但 socketio_session 中缺少 user_id。SID: {request.sid}")
+            logger.warning("发送消息尝试，但 socketio_session 中缺少 user_id。SID: %s", request.sid)
             emit('unauthorized', {'error': 'Authentication required to send messages.'}, room=request.sid)
             return
 
@@ -211,7 +220,8 @@ def register_socketio_events(socketio_instance):
         selected_contact_type = data.get('contact_type')
 
         if not content or not selected_contact_id_str or not selected_contact_type:
-            logger.warning(f"发送消息尝试，但缺少数据: {data}。SID: {request.sid}")
+            logger.warning("发送消息尝试，但缺少数据。Sender: %s, ContactID: %s, ContactType: %s, SID: %s",
+                           sender_id_str, data.get('contact_id'), selected_contact_type, request.sid)
             emit('message_error', {'error': 'Message content, contact_id, or contact_type missing.'}, room=request.sid)
             return
 
@@ -227,30 +237,58 @@ def register_socketio_events(socketio_instance):
             elif selected_contact_type == 'group':
                 group_id_db = selected_contact_id
             else:
-                logger.error(f"无效的 contact_type: {selected_contact_type}。数据: {data}。SID: {request.sid}")
+                logger.error("无效的 contact_type: %s。Sender: %s, ContactID: %s。SID: %s",
+                             selected_contact_type, sender_id_str, selected_contact_id_str, request.sid)
                 emit('message_error', {'error': 'Invalid contact type.'}, room=request.sid)
                 return
 
+            # 只能向好友 / 所在的群发送消息 (缓存的权限索引，通常不访问数据库)
+            if not chat_service.can_message(sender_id, selected_contact_id, selected_contact_type):
+                logger.warning("用户 %s 无权向 %s %s 发送消息。SID: %s", sender_id, selected_contact_type, selected_contact_id, request.sid)
+                emit('message_error', {'error': 'Not a friend or group member.', 'client_msg_id': data.get('client_msg_id')}, room=request.sid)
+                return
+
             # 1. 保存消息到数据库
-            # 修改 chat_service.send_message 以便它返回包含 message_id 和 sent_at 的完整消息对象或字典
-            saved_message_info = chat_service.send_message_and_get_info(
-                sender_id, 
-                selected_contact_id,
-                selected_contact_type,
-                content
-            )
+            client_msg_id = data.get('client_msg_id') # 客户端生成的临时 ID，用于匹配 message_persisted 确认
+            persisted = True
+            if message_writer.enabled:
+                # 写后模式: message_id 由应用生成，立即广播，由后台任务批量写入，写入后向发送者发送 message_persisted
+                pending_message = chat_service.build_message(
+                    sender_id, selected_contact_id, selected_contact_type, content
+                )
+                persisted = not message_writer.submit(pending_message, ack_sid=request.sid, client_msg_id=client_msg_id)
+                if persisted:
+                    # 队列已满或正在关闭，回退为同步写入
+                    logger.warning("Write-behind queue unavailable, persisting message %s synchronously", pending_message['message_id'])
+                    chat_service.persist_messages([pending_message])
+                saved_message_info = chat_service.format_message(pending_message)
+            else:
+                # 修改 chat_service.send_message 以便它返回包含 message_id 和 sent_at 的完整消息对象或字典
+                saved_message_info = chat_service.send_message_and_get_info(
+                    sender_id, 
+                    selected_contact_id,
+                    selected_contact_type,
+                    content
+                )
             #print("sender_id:", sender_id," selected_contact_id:", selected_contact_id, "selected_contact_type:", selected_contact_type, "content:", content)
             
             # print(saved_message_info)
             if not saved_message_info or 'message_id' not in saved_message_info or 'sent_at' not in saved_message_info:
-                logger.error(f"消息保存失败或未能返回必要信息。Sender: {sender_id}。SID: {request.sid}")
+                logger.error("消息保存失败或未能返回必要信息。Sender: %s。SID: %s", sender_id, request.sid)
                 emit('message_error', {'error': 'Failed to save message.'}, room=request.sid)
                 return
                 
             message_id = saved_message_info['message_id']
             sent_at_from_db = saved_message_info['sent_at']
 
-            logger.info(f"消息 (ID: {message_id}) 从 {sender_id} 发往 {selected_contact_type} {selected_contact_id} 已保存至数据库。")
+            logger.debug("消息 (ID: %s) 从 %s 发往 %s %s 已保存至数据库。", message_id, sender_id, selected_contact_type, selected_contact_id)
+
+            # 发送者资料以共享的资料缓存为准 (会话中保存的是连接时的昵称/头像，之后可能已被修改)
+            sender_profile = login_service.get_cached_profile(sender_id)
+            if sender_profile:
+                sender_username = sender_profile['username'] or sender_username
+                sender_nickname = sender_profile['nickname'] or sender_username
+                sender_avatar_url = sender_profile['avatar_url']
 
             # 2. 准备要发送给客户端的消息数据
             # 使用从数据库获取的精确时间，并格式化
@@ -269,37 +307,40 @@ def register_socketio_events(socketio_instance):
                 'sent_at': sent_at_formatted, # ISO 格式时间戳
                 # is_self 将由客户端根据 sender_id === currentUser.user_id 判断
                 'contact_id': selected_contact_id, # 前端可能需要这个来更新特定对话
-                'contact_type': selected_contact_type
+                'contact_type': selected_contact_type,
+                'client_msg_id': client_msg_id,
+                'persisted': persisted # 写后模式下为 False，稍后发送者会收到 message_persisted
             }
 
             # 3. 确定消息要发送到哪个房间
-            target_room = None
-            if selected_contact_type == 'friend':
-                user1 = min(sender_id, selected_contact_id)
-                user2 = max(sender_id, selected_contact_id)
-                target_room = f"friend_{user1}_{user2}"
-            elif selected_contact_type == 'group':
-                target_room = f"group_{selected_contact_id}"
+            target_room = get_conversation_key(sender_id, selected_contact_id, selected_contact_type)
 
             if target_room:
-                logger.info(f"向房间 {target_room} 广播 'new_message'。Payload: {message_payload}。SID: {request.sid}")
+                # 发出消息即停止输入 (下一次合并时通知房间)
+                typing_service.stopped(sender_id_str, socketio_session.get('current_chat_room'))
+                # 消息内容只在 DEBUG 级别记录 (惰性格式化，未开启 DEBUG 时不会序列化 payload)
+                logger.debug("向房间 %s 广播 'new_message'。Payload: %s。SID: %s", target_room, message_payload, request.sid)
                 socketio_instance.emit('new_message', message_payload, room=target_room)
                 
                 # （可选）如果需要，也可以给发送者一个单独的确认事件，但通常广播到房间已包含发送者
                 # emit('message_sent_confirmation', {'message_id': message_id, 'status': 'success'}, room=request.sid)
             else:
-                logger.error(f"无法确定消息的目标房间。数据: {data}。SID: {request.sid}")
+                logger.error("无法确定消息的目标房间。Sender: %s, ContactID: %s, ContactType: %s。SID: %s",
+                             sender_id, selected_contact_id, selected_contact_type, request.sid)
                 # 这种情况理论上不应发生，因为 contact_type 已被验证
 
         except ValueError:
-            logger.error(f"发送消息时ID格式无效。 UserID: {sender_id_str}, ContactID: {selected_contact_id_str}。SID: {request.sid}")
+            logger.error("发送消息时ID格式无效。 UserID: %s, ContactID: %s。SID: %s", sender_id_str, selected_contact_id_str, request.sid)
             emit('message_error', {'error': 'Invalid ID format.'}, room=request.sid)
         except Exception as e:
-            logger.error(f"send_message 事件处理出错: {e}. 数据: {data}. SID: {request.sid}", exc_info=True)
+            logger.error("send_message 事件处理出错: %s. Sender: %s, ContactID: %s, ContactType: %s. SID: %s",
+                         e, sender_id_str, selected_contact_id_str, selected_contact_type, request.sid, exc_info=True)
             emit('message_error', {'error': 'An error occurred while sending the message.'}, room=request.sid)
 
     # --- （可选）用户正在输入状态 ---
     @socketio_instance.on('user_typing')
+    @metrics.track_event('user_typing')
+    @query_stats.track_event('user_typing')
     def handle_user_typing(data):
         user_id = socketio_session.get('user_id')
         nickname = socketio_session.get('nickname', socketio_session.get('username'))
@@ -314,11 +355,18 @@ def register_socketio_events(socketio_instance):
         # target_room = calculate_room_name(user_id, contact_id, contact_type) # 你需要一个计算房间名的函数
 
         if target_room:
-            # include_self=False 确保 "正在输入" 的提示不会显示给输入者自己
-            socketio_instance.emit('is_typing', {'user_id': user_id, 'nickname': nickname}, room=target_room, include_self=False)
-            logger.debug(f"User {user_id} ({nickname}) is typing in room {target_room}")
+            if typing_service.enabled:
+                # 去抖后由后台任务按房间合并发送 typing_update
+                typing_service.typing(user_id, nickname, target_room)
+            else:
+                # include_self=False 确保 "正在输入" 的提示不会显示给输入者自己
+                socketio_instance.emit('is_typing', {'user_id': user_id, 'nickname': nickname}, room=target_room, include_self=False)
+            if typing_log_sampler.should_log('user_typing'): # 高频事件，只采样记录
+                logger.debug("User %s (%s) is typing in room %s (1/%s sampled)", user_id, nickname, target_room, typing_log_sampler.every)
 
     @socketio_instance.on('user_stopped_typing')
+    @metrics.track_event('user_stopped_typing')
+    @query_stats.track_event('user_stopped_typing')
     def handle_user_stopped_typing(data):
         user_id = socketio_session.get('user_id')
         nickname = socketio_session.get('nickname', socketio_session.get('username'))
@@ -330,5 +378,9 @@ def register_socketio_events(socketio_instance):
         # 或者同上，从 data 中获取
 
         if target_room:
-            socketio_instance.emit('is_not_typing', {'user_id': user_id, 'nickname': nickname}, room=target_room, include_self=False)
-            logger.debug(f"User {user_id} ({nickname}) stopped typing in room {target_room}")
\ No newline at end of file
+            if typing_service.enabled:
+                typing_service.stopped(user_id, target_room)
+            else:
+                socketio_instance.emit('is_not_typing', {'user_id': user_id, 'nickname': nickname}, room=target_room, include_self=False)
+            if typing_log_sampler.should_log('user_stopped_typing'):
+                logger.debug("User %s (%s) stopped typing in room %s (1/%s sampled)", user_id, nickname, target_room, typing_log_sampler.every)
\ No newline at end of file
@@ -0,0 +1,21 @@
+-- 001_conversation_summaries.sql
+-- 每个用户、每个联系人 (好友或群) 一行的会话摘要表，取代 ContactListView 中的关联子查询。
+-- 由 ChatService 在发送消息的同一事务内维护 (双向覆盖: 好友双方的摘要都会更新)。
+--
+-- 执行顺序:
+--   1. mysql -u db_admin -p kaguchat < mysql/migrations/001_conversation_summaries.sql
+--   2. FLASK_APP=run.py flask rebuild-conversation-summaries   # 回填现有好友/群的摘要
+-- 之后 /api/chat/contacts 只需对 (user_id, last_message_time) 做一次索引范围读取。
+
+CREATE TABLE IF NOT EXISTS `Conversation_Summaries` (
+  `user_id` bigint NOT NULL,
+  `contact_type` enum('friend','group') NOT NULL,
+  `contact_id` bigint NOT NULL,
+  `last_message_id` bigint DEFAULT NULL,
+  `last_message` varchar(255) DEFAULT NULL, -- 只保存预览，保持行紧凑
+  `last_message_time` datetime DEFAULT NULL,
+  `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`user_id`,`contact_type`,`contact_id`),
+  KEY `idx_user_last_message_time` (`user_id`,`last_message_time`),
+  CONSTRAINT `conversation_summaries_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `Users` (`user_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,27 @@
+-- 002_messages_conversation_key.sql
+-- 为 Messages 增加规范化的会话键 conversation_key，并建立 (conversation_key, sent_at, message_id) 复合索引，
+-- 让单个会话的历史消息查询只做一次索引范围扫描 (不再需要 index merge + filesort)。
+-- 会话键格式与 Socket.IO 房间名一致:
+--   私聊: friend_<较小的 user_id>_<较大的 user_id>
+--   群聊: group_<group_id>
+--
+-- 迁移步骤 (全程不长时间锁表):
+--   1. 执行本文件第 1 步: 增加可为空的列 (MySQL 8.0 ALGORITHM=INSTANT，只修改元数据)
+--   2. FLASK_APP=run.py flask backfill-conversation-keys --batch-size 5000
+--      按 message_id 键集分页 (每批取下一段仍为 NULL 的行) 分批 UPDATE，每批单独提交，批间可休眠；
+--      该命令可重复执行，只处理仍为 NULL 的行。message_id 改为稀疏的 Snowflake ID (见 data/id_generator.py) 后
+--      仍然适用，不会按固定步长遍历 MIN..MAX 区间
+--   3. 执行本文件第 3 步: 在线创建复合索引 (ALGORITHM=INPLACE, LOCK=NONE，期间允许读写)
+--   4. 部署新代码 (写入时带 conversation_key，查询使用复合索引)
+--   5. 再执行一次第 2 步，补齐旧代码在部署窗口内写入的行 (只遍历 conversation_key 仍为 NULL 的行，
+--      与应用生成的 Snowflake message_id 的取值范围无关)
+
+-- 第 1 步
+ALTER TABLE `Messages`
+  ADD COLUMN `conversation_key` varchar(64) DEFAULT NULL,
+  ALGORITHM=INSTANT;
+
+-- 第 3 步 (回填完成后执行)
+ALTER TABLE `Messages`
+  ADD INDEX `idx_conversation_sent_at` (`conversation_key`, `sent_at`, `message_id`),
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -13,9 +13,15 @@ if __name__ == '__main__':
     host = os.environ.get('FLASK_RUN_HOST', '0.0.0.0')
     port = int(os.environ.get('FLASK_RUN_PORT', 5001))
     debug = app.config.get('DEBUG', True) # 从应用配置获取debug状态
+    worker_id = os.environ.get('KAGUCHAT_WORKER_ID') # 由 run_cluster.py 启动时设置
+    if worker_id is not None:
+        # 多进程模式下每个 worker 都是独立进程，不能使用 debug reloader
+        debug = False
+        logger.info(f"Running as cluster worker {worker_id}")
 
     logger.info(f"Starting KaguChat server on {host}:{port} with debug={debug}")
     # 使用 socketio.run() 来启动，它会处理 Flask app 和 SocketIO 服务器
     # allow_unsafe_werkzeug=True 在 debug 模式下通常是需要的，以便 reloader 工作
     # 在生产环境中，你会用 Gunicorn + eventlet/gevent
-    socketio.run(app, host=host, port=port, debug=debug, allow_unsafe_werkzeug=debug)
\ No newline at end of file
+    # 集群 worker 在未安装 eventlet/gevent 时会回退到 Werkzeug 服务器，这里允许其启动以便本地测试
+    socketio.run(app, host=host, port=port, debug=debug, allow_unsafe_werkzeug=debug or worker_id is not None)
\ No newline at end of file
@@ -0,0 +1,264 @@
+# run_cluster.py
+# 以多进程方式启动 KaguChat:
+#   - 启动 N 个 run.py worker 进程 (各自监听 base_port + i)
+#   - 所有 worker 通过消息队列 (默认本地 Redis) 共享 Socket.IO emit
+#   - 内置一个按客户端 IP 粘滞 (sticky session) 的 TCP 代理，对外监听 --port
+#     Socket.IO 的 long-polling 握手要求同一客户端的所有请求落在同一个 worker 上
+#
+# 用法:
+#   python run_cluster.py --workers 4 --port 5001 --base-port 5101 --message-queue redis://localhost:6379/1
+#   python run_cluster.py --workers 4 --no-proxy --nginx-conf kaguchat_upstream.conf  # 生产环境交给 nginx 做粘滞路由
+#
+# Prometheus 指标: 所有 worker 共用 --metrics-dir (PROMETHEUS_MULTIPROC_DIR)，启动时清空，
+# 任意 worker 的 /metrics 都输出汇总结果；worker 退出后删除其 live gauge 文件。
+# worker 前面有代理，/metrics 默认不按来源地址放行，抓取端应使用 METRICS_AUTH_TOKEN (Bearer token)。
+import argparse
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [cluster] %(levelname)s %(message)s')
+logger = logging.getLogger('kaguchat.cluster')
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+RESTART_BACKOFF_SECONDS = 2.0
+
+
+class WorkerProcess:
+    """一个 run.py worker 子进程，意外退出时由 Cluster 重启。"""
+
+    def __init__(self, worker_id, host, port, env, node_id=None):
+        self.worker_id = worker_id
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.env = env
+        self.process = None
+        self.last_start = 0.0
+
+    def start(self):
+        env = dict(os.environ, **self.env)
+        env['KAGUCHAT_WORKER_ID'] = str(self.worker_id)
+        if self.node_id is not None:
+            env['KAGUCHAT_NODE_ID'] = str(self.node_id) # 消息 ID 生成器的节点号，不设置时由 worker 在 Redis 中租用
+        env['FLASK_RUN_HOST'] = self.host
+        env['FLASK_RUN_PORT'] = str(self.port)
+        self.process = subprocess.Popen([sys.executable, os.path.join(PROJECT_ROOT, 'run.py')], env=env, cwd=PROJECT_ROOT)
+        self.last_start = time.monotonic()
+        logger.info(f"Started worker {self.worker_id} (pid {self.process.pid}) on {self.host}:{self.port}")
+
+    def mark_metrics_dead(self):
+        """删除已退出进程的 live gauge 文件 (等同于 prometheus_client.multiprocess.mark_process_dead)。"""
+        metrics_dir = self.env.get('PROMETHEUS_MULTIPROC_DIR')
+        if not metrics_dir or not self.process:
+            return
+        for path in glob.glob(os.path.join(metrics_dir, f"gauge_live*_{self.process.pid}.db")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def poll(self):
+        return self.process.poll() if self.process else None
+
+    def stop(self, timeout=10):
+        if not self.process or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class StickyProxy:
+    """
+    按客户端 IP 哈希选择后端 worker 的 TCP 代理。
+    工作在 TCP 层，对 HTTP long-polling 和 WebSocket 都透明；
+    选中的 worker 不可用时按顺序尝试下一个。
+    """
+
+    def __init__(self, listen_host, listen_port, backends):
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.backends = backends # [(host, port), ...]
+
+    def _pick_order(self, client_ip):
+        digest = hashlib.md5(client_ip.encode('utf-8')).digest()
+        start = int.from_bytes(digest[:4], 'big') % len(self.backends)
+        return [self.backends[(start + i) % len(self.backends)] for i in range(len(self.backends))]
+
+    async def _pipe(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def _handle(self, client_reader, client_writer):
+        peer = client_writer.get_extra_info('peername')
+        client_ip = peer[0] if peer else 'unknown'
+        for host, port in self._pick_order(client_ip):
+            try:
+                backend_reader, backend_writer = await asyncio.open_connection(host, port)
+                break
+            except OSError:
+                logger.warning(f"Backend {host}:{port} unavailable for client {client_ip}, trying next worker")
+        else:
+            logger.error(f"No backend available for client {client_ip}")
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(client_reader, backend_writer),
+            self._pipe(backend_reader, client_writer),
+        )
+
+    async def serve(self):
+        server = await asyncio.start_server(self._handle, self.listen_host, self.listen_port)
+        logger.info(f"Sticky proxy listening on {self.listen_host}:{self.listen_port} -> {len(self.backends)} workers")
+        async with server:
+            await server.serve_forever()
+
+
+def render_nginx_conf(backends, listen_port):
+    """生成 nginx 配置片段: ip_hash 粘滞路由 + WebSocket Upgrade。"""
+    servers = '\n'.join(f"    server {host}:{port};" for host, port in backends)
+    return f"""upstream kaguchat_workers {{
+    ip_hash;
+{servers}
+}}
+
+server {{
+    listen {listen_port};
+
+    location / {{
+        proxy_pass http://kaguchat_workers;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_read_timeout 86400;
+    }}
+}}
+"""
+
+
+class Cluster:
+    def __init__(self, args):
+        self.args = args
+        env = {'SOCKETIO_MESSAGE_QUEUE': args.message_queue, 'PROMETHEUS_MULTIPROC_DIR': args.metrics_dir,
+               # worker 前面是代理 (内置粘滞代理或 nginx)，所有客户端看起来都来自 127.0.0.1，
+               # 因此默认不按来源地址放行 /metrics，需配置 METRICS_AUTH_TOKEN 或显式设置 METRICS_ALLOWED_IPS
+               'METRICS_ALLOWED_IPS': os.environ.get('METRICS_ALLOWED_IPS', '')}
+        self.workers = [
+            WorkerProcess(i, args.worker_host, args.base_port + i, env,
+                          node_id=args.node_id_base + i if args.node_id_base is not None else None)
+            for i in range(args.workers)
+        ]
+        self.stopping = False
+
+    def backends(self):
+        return [(w.host, w.port) for w in self.workers]
+
+    def reset_metrics_dir(self):
+        """多进程指标目录必须在 worker 启动前清空，否则会混入上次运行的数值。"""
+        shutil.rmtree(self.args.metrics_dir, ignore_errors=True)
+        os.makedirs(self.args.metrics_dir, exist_ok=True)
+
+    def start_workers(self):
+        self.reset_metrics_dir()
+        for worker in self.workers:
+            worker.start()
+
+    def stop_workers(self):
+        self.stopping = True
+        for worker in self.workers:
+            worker.stop()
+            worker.mark_metrics_dead()
+        logger.info("All workers stopped")
+
+    async def supervise(self):
+        """重启意外退出的 worker (两次启动之间至少间隔 RESTART_BACKOFF_SECONDS)。"""
+        while not self.stopping:
+            for worker in self.workers:
+                code = worker.poll()
+                if code is not None and time.monotonic() - worker.last_start >= RESTART_BACKOFF_SECONDS:
+                    logger.warning(f"Worker {worker.worker_id} exited with code {code}, restarting")
+                    worker.mark_metrics_dead()
+                    worker.start()
+            await asyncio.sleep(1.0)
+
+    async def run(self):
+        self.start_workers()
+        tasks = [asyncio.create_task(self.supervise())]
+        if self.args.proxy:
+            proxy = StickyProxy(self.args.host, self.args.port, self.backends())
+            tasks.append(asyncio.create_task(proxy.serve()))
+        await asyncio.gather(*tasks)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run KaguChat as N worker processes sharing a Socket.IO message queue.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='worker 进程数 (默认 CPU 核数)')
+    parser.add_argument('--host', default=os.environ.get('FLASK_RUN_HOST', '0.0.0.0'), help='粘滞代理监听地址')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FLASK_RUN_PORT', 5001)), help='粘滞代理监听端口')
+    parser.add_argument('--worker-host', default='127.0.0.1', help='worker 监听地址')
+    parser.add_argument('--base-port', type=int, default=5101, help='第 i 个 worker 监听 base_port + i')
+    parser.add_argument('--message-queue', default=os.environ.get('SOCKETIO_MESSAGE_QUEUE', 'redis://localhost:6379/1'),
+                        help='Socket.IO 消息队列 URL (redis://、amqp://、kafka:// ...)')
+    parser.add_argument('--node-id-base', type=int,
+                        help='第 i 个 worker 的消息 ID 节点号为 node_id_base + i (多机部署时各机器区间不能重叠)；不指定则自动租用')
+    parser.add_argument('--metrics-dir',
+                        default=os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'kaguchat_metrics')),
+                        help='worker 共享的 Prometheus 多进程指标目录 (启动时清空)')
+    parser.add_argument('--no-proxy', dest='proxy', action='store_false', help='不启动内置粘滞代理 (由 nginx 等负责路由)')
+    parser.add_argument('--nginx-conf', help='将对应的 nginx upstream 配置写入该文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers < 1:
+        raise SystemExit("--workers must be at least 1")
+    cluster = Cluster(args)
+    if args.nginx_conf:
+        with open(args.nginx_conf, 'w', encoding='utf-8') as f:
+            f.write(render_nginx_conf(cluster.backends(), args.port))
+        logger.info(f"Wrote nginx config to {args.nginx_conf}")
+
+    loop = asyncio.new_event_loop()
+    main_task = loop.create_task(cluster.run())
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, main_task.cancel)
+        except NotImplementedError: # Windows
+            pass
+    try:
+        loop.run_until_complete(main_task)
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        pass
+    finally:
+        cluster.stop_workers()
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()